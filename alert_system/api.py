@@ -1,16 +1,37 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 import uvicorn
 from datetime import datetime
+import os
 import send_alerts as alerts
+from listener import AlertListener
 
 app = FastAPI()
 
+# Push-based dispatch: new alerts are sent within seconds of being written.
+# The scheduler's /send calls remain as a safety net.
+listener = AlertListener()
+
+@app.on_event("startup")
+def start_listener():
+    if os.environ.get('ALERT_LISTENER_ENABLED', 'true').lower() == 'true':
+        listener.start()
+
+@app.on_event("shutdown")
+def stop_listener():
+    listener.stop()
+    alerts.close_dispatcher()
+
 @app.get("/send")
-async def send_alerts():
+def send_alerts(run_id: str = None):
     """Trigger alert sending process"""
     try:
-        alerts.main()
-        return {"status": "success", "timestamp": datetime.now().isoformat()}
+        if not alerts.main():
+            return JSONResponse(
+                status_code=409,
+                content={"status": "skipped", "run_id": run_id, "timestamp": datetime.now().isoformat()}
+            )
+        return {"status": "success", "run_id": run_id, "timestamp": datetime.now().isoformat()}
     except Exception as e:
         return {"status": "error", "error": str(e), "timestamp": datetime.now().isoformat()}
 
@@ -0,0 +1,416 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from urllib.parse import urlsplit
+
+import httpx
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+logger = logging.getLogger('alert_system.channels')
+
+# Digest templates, compiled once per process
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+template_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    trim_blocks=True,
+    lstrip_blocks=True
+)
+html_template = template_env.get_template("digest.html")
+text_template = template_env.get_template("digest.txt")
+
+
+def digest_subject(alerts):
+    return f"GPW Alert System: {len(alerts)} New Trading Signals"
+
+
+def split_digest(alerts, max_chars):
+    """
+    Split alerts into consecutive groups whose text digests each fit in
+    max_chars. Each alert's share of the digest is measured once, so a large
+    batch costs one render per alert rather than one per candidate group.
+    """
+    overhead = len(text_template.render(alerts=[]))
+    groups, group, size = [], [], overhead
+    for alert in alerts:
+        length = len(text_template.render(alerts=[alert])) - overhead
+        if group and size + length > max_chars:
+            groups.append(group)
+            group, size = [], overhead
+        group.append(alert)
+        size += length
+    if group:
+        groups.append(group)
+    return groups
+
+
+# Outbox bookkeeping that never leaves the alert system
+INTERNAL_FIELDS = ("outbox_id", "attempts")
+
+def public_alerts(alerts):
+    return [{k: v for k, v in alert.items() if k not in INTERNAL_FIELDS} for alert in alerts]
+
+
+class DeliveryError(Exception):
+    """
+    A failed send. permanent errors (e.g. a rejected address) are not
+    retried; retry_after overrides the backoff when the remote asked for it.
+    """
+
+    def __init__(self, message, retry_after=None, permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` sends per second with bursts of `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Channel:
+    """
+    Base class for a notification channel. Subclasses implement send();
+    deliver() adds the per-channel concurrency cap, rate limit and retries.
+    """
+
+    name = None
+    max_concurrency = 4
+    rate_per_second = 10.0
+    max_attempts = 3
+    retry_base_seconds = 1.0
+    # Longest message the channel accepts; None sends every digest whole
+    max_message_chars = None
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.limiter = RateLimiter(self.rate_per_second)
+
+    async def deliver(self, destination, alerts):
+        """
+        Send one digest to a destination, as several messages in turn when it
+        is longer than max_message_chars. Each message is retried on its own.
+        Returns the most attempts any message needed.
+        """
+        if self.max_message_chars is None:
+            return await self._deliver_message(destination, alerts)
+        attempts = 0
+        for part in split_digest(alerts, self.max_message_chars):
+            attempts = max(attempts, await self._deliver_message(destination, part))
+        return attempts
+
+    async def _deliver_message(self, destination, alerts):
+        async with self.semaphore:
+            for attempt in range(1, self.max_attempts + 1):
+                await self.limiter.acquire()
+                try:
+                    await self.send(destination, alerts)
+                    return attempt
+                except DeliveryError as e:
+                    if e.permanent or attempt == self.max_attempts:
+                        raise
+                    delay = e.retry_after or self.retry_base_seconds * 2 ** (attempt - 1)
+                except Exception as e:
+                    if attempt == self.max_attempts:
+                        raise DeliveryError(str(e)) from e
+                    delay = self.retry_base_seconds * 2 ** (attempt - 1)
+                logger.warning(f"{self.name} delivery to {self.mask(destination)} failed (attempt {attempt}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def send(self, destination, alerts):
+        raise NotImplementedError
+
+    def mask(self, destination):
+        """How a destination appears in logs and stored errors."""
+        return destination
+
+    async def close(self):
+        pass
+
+
+class EmailChannel(Channel):
+    """SMTP digests over a small pool of sessions reused across sends and runs."""
+
+    name = "email"
+
+    def __init__(self, host, port, user=None, password=None, starttls=True, sender=None):
+        self.max_concurrency = int(os.environ.get('EMAIL_MAX_CONNECTIONS', 4))
+        self.rate_per_second = float(os.environ.get('EMAIL_RATE_PER_SECOND', 10))
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender or user or 'gpw-alerts@localhost'
+        self.idle = []
+
+    async def _connect(self):
+        client = aiosmtplib.SMTP(hostname=self.host, port=self.port, start_tls=self.starttls, timeout=30)
+        await client.connect()
+        if self.user and self.password:
+            await client.login(self.user, self.password)
+        return client
+
+    async def send(self, destination, alerts):
+        msg = MIMEMultipart('alternative')
+        msg['From'] = self.sender
+        msg['To'] = destination
+        msg['Subject'] = digest_subject(alerts)
+        msg.attach(MIMEText(text_template.render(alerts=alerts), 'plain'))
+        msg.attach(MIMEText(html_template.render(alerts=alerts), 'html'))
+
+        client = self.idle.pop() if self.idle else None
+        if client is None or not client.is_connected:
+            client = await self._connect()
+        try:
+            errors, _ = await client.send_message(msg)
+        except aiosmtplib.SMTPRecipientsRefused as e:
+            self.idle.append(client)
+            raise DeliveryError(f"Recipient refused: {destination}", permanent=True) from e
+        except Exception:
+            # Never reuse a session left in an unknown state
+            client.close()
+            raise
+        self.idle.append(client)
+        if errors:
+            raise DeliveryError(f"Recipient refused: {errors}", permanent=True)
+
+    async def close(self):
+        while self.idle:
+            client = self.idle.pop()
+            try:
+                await client.quit()
+            except Exception:
+                pass
+
+
+def mask_secret(value):
+    """Short digest standing in for a value that must not be logged."""
+    return "#" + hashlib.sha256(value.encode()).hexdigest()[:8]
+
+
+def mask_url(url):
+    """
+    Scheme and host of a URL whose path or query may carry a token (webhook
+    URLs), with a short digest to tell URLs apart.
+    """
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/...{mask_secret(url)}"
+
+
+class HttpChannel(Channel):
+    """
+    Base for channels that POST to an HTTP endpoint. Errors name the channel
+    and status only: URLs may carry tokens and must not reach logs or the
+    outbox's last_error.
+    """
+
+    client = None
+
+    async def post(self, url, **kwargs):
+        if HttpChannel.client is None:
+            # One keep-alive client shared by every HTTP channel
+            HttpChannel.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(10.0),
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+            )
+        try:
+            response = await HttpChannel.client.post(url, **kwargs)
+        except httpx.HTTPError as e:
+            # httpx messages can quote the request URL
+            raise DeliveryError(f"{self.name} request failed: {type(e).__name__}") from None
+        if response.status_code == 429:
+            retry_after = response.headers.get("retry-after")
+            raise DeliveryError(
+                f"Rate limited by {self.name}",
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        if response.status_code >= 500:
+            raise DeliveryError(f"{self.name} returned {response.status_code}")
+        if response.status_code >= 400:
+            raise DeliveryError(f"{self.name} returned {response.status_code}", permanent=True)
+        return response
+
+    async def close(self):
+        if HttpChannel.client is not None:
+            await HttpChannel.client.aclose()
+            HttpChannel.client = None
+
+
+class WebhookChannel(HttpChannel):
+    """POST the digest as JSON to the subscription's URL."""
+
+    name = "webhook"
+    max_concurrency = 10
+    rate_per_second = 20.0
+
+    async def send(self, destination, alerts):
+        await self.post(destination, json={"subject": digest_subject(alerts), "alerts": public_alerts(alerts)})
+
+    def mask(self, destination):
+        return mask_url(destination)
+
+
+class TelegramChannel(HttpChannel):
+    """Telegram Bot API sendMessage; the destination is the chat id."""
+
+    name = "telegram"
+    max_concurrency = 5
+    # Telegram allows about 30 messages per second per bot
+    rate_per_second = 25.0
+    # sendMessage rejects text over 4096 characters
+    max_message_chars = 4000
+
+    def __init__(self, token, api_url="https://api.telegram.org"):
+        super().__init__()
+        self.url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+
+    async def send(self, destination, alerts):
+        await self.post(self.url, json={"chat_id": destination, "text": text_template.render(alerts=alerts)})
+
+
+class SlackChannel(HttpChannel):
+    """Slack incoming webhook; the destination is the webhook URL."""
+
+    name = "slack"
+    max_concurrency = 2
+    # Incoming webhooks are limited to roughly one message per second
+    rate_per_second = 1.0
+    # Slack advises keeping message text under 4000 characters
+    max_message_chars = 4000
+
+    async def send(self, destination, alerts):
+        await self.post(destination, json={"text": text_template.render(alerts=alerts)})
+
+    def mask(self, destination):
+        return mask_url(destination)
+
+
+class FileChannel(Channel):
+    """Append each digest as a JSON line to a file, for local runs and audits."""
+
+    name = "file"
+    max_concurrency = 1
+    rate_per_second = 1000.0
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+
+    def _append(self, path, line):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as f:
+            f.write(line + "\n")
+
+    async def send(self, destination, alerts):
+        path = destination if os.path.isabs(destination) else os.path.join(self.directory, destination)
+        line = json.dumps({"subject": digest_subject(alerts), "alerts": public_alerts(alerts)}, default=str)
+        await asyncio.to_thread(self._append, path, line)
+
+
+def build_channels():
+    """Channels available in this deployment, keyed by name."""
+    channels = {
+        "webhook": WebhookChannel(),
+        "slack": SlackChannel(),
+        "file": FileChannel(os.environ.get('ALERT_FILE_DIR', '/app/alert_files'))
+    }
+    if os.environ.get('EMAIL_HOST'):
+        channels["email"] = EmailChannel(
+            os.environ['EMAIL_HOST'],
+            int(os.environ.get('EMAIL_PORT', 587)),
+            user=os.environ.get('EMAIL_USER'),
+            password=os.environ.get('EMAIL_PASSWORD'),
+            starttls=os.environ.get('EMAIL_STARTTLS', 'true').lower() == 'true',
+            sender=os.environ.get('EMAIL_FROM')
+        )
+    if os.environ.get('TELEGRAM_BOT_TOKEN'):
+        channels["telegram"] = TelegramChannel(
+            os.environ['TELEGRAM_BOT_TOKEN'],
+            os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+        )
+    return channels
+
+
+class Dispatcher:
+    """
+    Delivers digests to every (channel, destination) concurrently. Runs on a
+    private event loop that lives for the whole process, so SMTP sessions and
+    HTTP connections are reused across batches and runs.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="alert-dispatcher", daemon=True)
+        self.thread.start()
+        # Channels own asyncio primitives, so create them on the dispatcher loop
+        self.channels = self._run(self._build_channels())
+
+    async def _build_channels(self):
+        return build_channels()
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def deliver_all(self, deliveries):
+        """
+        deliveries: list of (channel, destination, alerts). Returns one result
+        dict per delivery with ok, error, permanent (a failure retrying will
+        not fix), attempts, duration_ms and label, the destination as it may
+        be logged.
+        """
+        return self._run(self._deliver_all(deliveries))
+
+    async def _deliver_all(self, deliveries):
+        return await asyncio.gather(*(
+            self._deliver_one(channel_name, destination, alerts)
+            for channel_name, destination, alerts in deliveries
+        ))
+
+    async def _deliver_one(self, channel_name, destination, alerts):
+        start = time.monotonic()
+        channel = self.channels.get(channel_name)
+        label = channel.mask(destination) if channel is not None else mask_secret(destination)
+        result = {"channel": channel_name, "destination": destination, "label": label, "alerts": alerts,
+                  "ok": False, "error": None, "permanent": False, "attempts": 0}
+        try:
+            if channel is None:
+                raise DeliveryError(f"Channel {channel_name} is not configured", permanent=True)
+            result["attempts"] = await channel.deliver(destination, alerts)
+            result["ok"] = True
+        except Exception as e:
+            logger.error(f"Error delivering to {channel_name}:{label}: {str(e)}")
+            result["error"] = str(e)
+            result["permanent"] = isinstance(e, DeliveryError) and e.permanent
+        result["duration_ms"] = int((time.monotonic() - start) * 1000)
+        return result
+
+    def close(self):
+        async def close_channels():
+            for channel in self.channels.values():
+                await channel.close()
+        self._run(close_channels())
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -0,0 +1,127 @@
+import os
+import time
+import select
+import logging
+import threading
+
+import psycopg2
+
+import send_alerts
+
+logger = logging.getLogger('alert_system.listener')
+
+# Channel notified by the alerts trigger for every actionable alert
+ALERT_CHANNEL = "new_alert"
+
+# Dispatch once no new alert arrived for DEBOUNCE_SECONDS, but never hold the
+# first alert of a burst longer than MAX_DELAY_SECONDS
+DEBOUNCE_SECONDS = float(os.environ.get('ALERT_DEBOUNCE_SECONDS', 5))
+MAX_DELAY_SECONDS = float(os.environ.get('ALERT_MAX_DELAY_SECONDS', 30))
+# Idle wake-up: checks the connection and picks up retries that became due
+POLL_SECONDS = 60
+# Wait before retrying when another dispatch held the lock
+BUSY_RETRY_SECONDS = 10
+RECONNECT_DELAY_SECONDS = 5
+
+
+class AlertListener(threading.Thread):
+    """
+    Long-lived LISTEN on the new_alert channel. Bursts of notifications are
+    debounced into a single dispatch, which claims everything due in the
+    outbox and sends it as one digest per destination.
+    """
+
+    def __init__(self):
+        super().__init__(name="alert-listener", daemon=True)
+        self._stop_event = threading.Event()
+        self.first_pending = None
+        self.last_pending = None
+        self.not_before = 0.0
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _connect(self):
+        conn = psycopg2.connect(
+            host=os.environ.get('DB_HOST', 'localhost'),
+            user=os.environ.get('DB_USER', 'user'),
+            password=os.environ.get('DB_PASSWORD', 'password'),
+            dbname=os.environ.get('DB_NAME', 'stocks')
+        )
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {ALERT_CHANNEL}")
+        return conn
+
+    def _mark_pending(self, now):
+        if self.first_pending is None:
+            self.first_pending = now
+        self.last_pending = now
+
+    def _dispatch_due_at(self):
+        if self.first_pending is None:
+            return None
+        due_at = min(self.last_pending + DEBOUNCE_SECONDS, self.first_pending + MAX_DELAY_SECONDS)
+        return max(due_at, self.not_before)
+
+    def _has_due_retries(self, conn):
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT EXISTS (
+                    SELECT 1 FROM alert_outbox
+                    WHERE status = 'PENDING' AND next_attempt_at <= NOW()
+                )
+            """)
+            return cur.fetchone()[0]
+
+    def _dispatch(self):
+        logger.info("Dispatching pending alerts")
+        try:
+            dispatched = send_alerts.main()
+        except Exception as e:
+            logger.error(f"Alert dispatch failed: {str(e)}")
+            dispatched = True
+
+        if dispatched:
+            self.first_pending = self.last_pending = None
+        else:
+            # A scheduled run holds the lock; it has probably claimed our
+            # alerts already, but check again shortly in case it had not
+            self.not_before = time.monotonic() + BUSY_RETRY_SECONDS
+
+    def _listen(self, conn):
+        # Alerts written while we were not listening are already in the outbox
+        self._mark_pending(time.monotonic())
+
+        while not self._stop_event.is_set():
+            due_at = self._dispatch_due_at()
+            timeout = POLL_SECONDS if due_at is None else max(0.0, due_at - time.monotonic())
+
+            readable, _, _ = select.select([conn], [], [], timeout)
+            now = time.monotonic()
+            if readable:
+                conn.poll()
+                if conn.notifies:
+                    logger.info(f"Received {len(conn.notifies)} new alert notifications")
+                    conn.notifies.clear()
+                    self._mark_pending(now)
+            elif due_at is None and self._has_due_retries(conn):
+                self._mark_pending(now)
+
+            due_at = self._dispatch_due_at()
+            if due_at is not None and now >= due_at:
+                self._dispatch()
+
+    def run(self):
+        logger.info(f"Listening for new alerts on channel {ALERT_CHANNEL}")
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                self._listen(conn)
+            except Exception as e:
+                logger.error(f"Alert listener failed, reconnecting: {str(e)}")
+                self._stop_event.wait(RECONNECT_DELAY_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
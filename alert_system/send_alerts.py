@@ -1,10 +1,9 @@
 import os
 import logging
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from contextlib import contextmanager
 from sqlalchemy import create_engine, text
 from datetime import datetime
+from channels import Dispatcher
 
 # Configure logging
 logging.basicConfig(
@@ -23,163 +22,176 @@ def get_db_connection():
     connection_string = f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
     return create_engine(connection_string)
 
-# Get pending alerts
-def get_pending_alerts(engine):
+# Advisory lock making alert dispatch single-flight across triggers
+ALERT_LOCK = "gpw_alert_system"
+
+@contextmanager
+def advisory_lock(engine, name, shared=False):
+    """
+    Hold a session-level Postgres advisory lock for the duration of the block.
+    Yields False without waiting when another session holds it. Postgres drops
+    the lock together with the connection, so a crashed run never leaves it stuck.
+    """
+    mode = "_shared" if shared else ""
+    conn = engine.connect()
+    acquired = False
     try:
-        with engine.connect() as conn:
+        acquired = conn.execute(
+            text(f"SELECT pg_try_advisory_lock{mode}(hashtext(:name))"), {"name": name}
+        ).scalar()
+        conn.commit()
+        yield acquired
+    finally:
+        if acquired:
+            conn.execute(text(f"SELECT pg_advisory_unlock{mode}(hashtext(:name))"), {"name": name})
+            conn.commit()
+        conn.close()
+
+# Outbox delivery settings. A dispatch claims everything queued up to
+# OUTBOX_BATCH_SIZE at once, so a debounced burst reaches every destination as
+# a single digest; only a larger backlog is split across several.
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 500))
+MAX_DELIVERY_ATTEMPTS = int(os.environ.get('MAX_DELIVERY_ATTEMPTS', 6))
+# Retry backoff: base * 2^(attempt - 1), capped
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 3600
+# A claimed batch not marked within this time (e.g. the process died mid-send)
+# becomes claimable again
+CLAIM_LEASE_SECONDS = 600
+
+# Claim a batch of due outbox rows
+def claim_alert_batch(engine, batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Atomically claim up to batch_size due outbox rows and return their alerts.
+    SKIP LOCKED lets concurrent senders claim disjoint batches instead of
+    waiting on (or double-sending) each other's rows.
+    """
+    try:
+        with engine.begin() as conn:
             result = conn.execute(
                 text("""
-                    SELECT id, symbol, strategy, signal_type, price, 
-                           volume, ma50, ma100, created_at
-                    FROM alerts
-                    WHERE status = 'PENDING'
-                    ORDER BY created_at
-                """)
+                    WITH claimed AS (
+                        UPDATE alert_outbox o
+                        SET status = 'SENDING', claimed_at = NOW(), attempts = o.attempts + 1
+                        WHERE o.id IN (
+                            SELECT id FROM alert_outbox
+                            WHERE (status = 'PENDING' AND next_attempt_at <= NOW())
+                            OR (status = 'SENDING' AND claimed_at < NOW() - make_interval(secs => :lease))
+                            ORDER BY next_attempt_at, id
+                            LIMIT :batch_size
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING o.id, o.alert_id, o.attempts
+                    )
+                    SELECT c.id AS outbox_id, c.attempts, a.id, a.symbol, a.strategy,
+                           a.signal_type, a.status, a.price, a.created_at,
+                           a.details->>'stop_loss' AS stop_loss,
+                           a.details->>'target' AS target,
+                           a.details->>'conditions_met' AS conditions_met
+                    FROM claimed c
+                    JOIN alerts a ON a.id = c.alert_id
+                    ORDER BY a.created_at, a.id
+                """),
+                {"batch_size": batch_size, "lease": CLAIM_LEASE_SECONDS}
             )
-            
+
             alerts = []
             for row in result:
                 alerts.append({
+                    "outbox_id": row.outbox_id,
+                    "attempts": row.attempts,
                     "id": row.id,
                     "symbol": row.symbol,
                     "strategy": row.strategy,
                     "signal_type": row.signal_type,
-                    "price": row.price,
-                    "volume": row.volume,
-                    "ma50": row.ma50,
-                    "ma100": row.ma100,
+                    "status": row.status,
+                    "price": float(row.price),
+                    "stop_loss": float(row.stop_loss) if row.stop_loss is not None else None,
+                    "target": float(row.target) if row.target is not None else None,
+                    "conditions_met": int(row.conditions_met) if row.conditions_met is not None else None,
                     "created_at": row.created_at.strftime("%Y-%m-%d %H:%M:%S")
                 })
             
             return alerts
     except Exception as e:
-        logger.error(f"Error getting pending alerts: {str(e)}")
+        logger.error(f"Error claiming alerts: {str(e)}")
         return []
 
-# Mark alert as sent
-def mark_alert_sent(engine, alert_id):
+# Mark a delivered batch
+def mark_batch_sent(engine, outbox_ids):
+    """
+    Mark every outbox row of a batch as sent and stamp its alert, in one
+    statement. alerts.status keeps the signal kind (ALERT/WATCH).
+    """
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                WITH sent AS (
+                    UPDATE alert_outbox
+                    SET status = 'SENT', sent_at = NOW(), last_error = NULL
+                    WHERE id = ANY(:ids)
+                    RETURNING alert_id
+                )
+                UPDATE alerts a
+                SET sent_at = NOW()
+                FROM sent
+                WHERE a.id = sent.alert_id
+            """),
+            {"ids": list(outbox_ids)}
+        )
+    logger.info(f"Marked {len(outbox_ids)} alerts as sent")
+
+# Schedule a failed batch for retry
+def mark_batch_failed(engine, outbox_ids, error, permanent=False):
+    """
+    Release a failed batch with exponential backoff. Rows that used up their
+    attempts, or whose failure is permanent, are parked as FAILED.
+    """
     try:
-        with engine.connect() as conn:
+        with engine.begin() as conn:
             conn.execute(
                 text("""
-                    UPDATE alerts
-                    SET status = 'SENT', sent_at = NOW()
-                    WHERE id = :alert_id
+                    UPDATE alert_outbox
+                    SET status = CASE WHEN :permanent OR attempts >= :max_attempts THEN 'FAILED' ELSE 'PENDING' END,
+                        next_attempt_at = NOW() + make_interval(
+                            secs => LEAST(:base * power(2, attempts - 1), :cap)
+                        ),
+                        last_error = :error
+                    WHERE id = ANY(:ids)
                 """),
-                {"alert_id": alert_id}
+                {
+                    "ids": list(outbox_ids),
+                    "max_attempts": MAX_DELIVERY_ATTEMPTS,
+                    "permanent": permanent,
+                    "base": RETRY_BASE_SECONDS,
+                    "cap": RETRY_MAX_SECONDS,
+                    "error": str(error)[:1000]
+                }
             )
-            conn.commit()
-            logger.info(f"Marked alert {alert_id} as sent")
     except Exception as e:
-        logger.error(f"Error marking alert as sent: {str(e)}")
+        logger.error(f"Error scheduling alert retry: {str(e)}")
 
-# Send email
-def send_email(alerts, recipients):
-    if not alerts:
-        logger.info("No alerts to send")
-        return
-    
-    try:
-        email_host = os.environ.get('EMAIL_HOST')
-        email_port = int(os.environ.get('EMAIL_PORT', 587))
-        email_user = os.environ.get('EMAIL_USER')
-        email_password = os.environ.get('EMAIL_PASSWORD')
-        
-        if not all([email_host, email_user, email_password]):
-            logger.error("Email configuration missing")
-            return
-        
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = email_user
-        msg['To'] = ", ".join(recipients)
-        msg['Subject'] = f"GPW Alert System: {len(alerts)} New Trading Signals"
-        
-        # Create email body
-        body = f"""
-        <html>
-        <head>
-            <style>
-                table {{
-                    border-collapse: collapse;
-                    width: 100%;
-                }}
-                th, td {{
-                    border: 1px solid #ddd;
-                    padding: 8px;
-                    text-align: left;
-                }}
-                th {{
-                    background-color: #f2f2f2;
-                }}
-                .buy {{
-                    color: green;
-                    font-weight: bold;
-                }}
-                .sell {{
-                    color: red;
-                    font-weight: bold;
-                }}
-            </style>
-        </head>
-        <body>
-            <h2>GPW Trading Signals</h2>
-            <p>The following trading signals have been generated:</p>
-            
-            <table>
-                <tr>
-                    <th>Symbol</th>
-                    <th>Signal</th>
-                    <th>Strategy</th>
-                    <th>Price</th>
-                    <th>MA50</th>
-                    <th>MA100</th>
-                    <th>Volume</th>
-                    <th>Time</th>
-                </tr>
-        """
-        
-        for alert in alerts:
-            signal_class = "buy" if alert["signal_type"] == "BUY" else "sell"
-            body += f"""
-                <tr>
-                    <td>{alert["symbol"]}</td>
-                    <td class="{signal_class}">{alert["signal_type"]}</td>
-                    <td>{alert["strategy"]}</td>
-                    <td>{alert["price"]:.2f}</td>
-                    <td>{alert["ma50"]:.2f}</td>
-                    <td>{alert["ma100"]:.2f}</td>
-                    <td>{alert["volume"]}</td>
-                    <td>{alert["created_at"]}</td>
-                </tr>
-            """
-        
-        body += """
-            </table>
-            
-            <p>This is an automated message from the GPW Alert System.</p>
-        </body>
-        </html>
-        """
-        
-        msg.attach(MIMEText(body, 'html'))
-        
-        # Send email
-        with smtplib.SMTP(email_host, email_port) as server:
-            server.starttls()
-            server.login(email_user, email_password)
-            server.send_message(msg)
-        
-        logger.info(f"Email sent to {len(recipients)} recipients with {len(alerts)} alerts")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error sending email: {str(e)}")
-        return False
+# Channel dispatcher, created on first use and shared by every run
+_dispatcher = None
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = Dispatcher()
+    return _dispatcher
+
+def close_dispatcher():
+    global _dispatcher
+    if _dispatcher is not None:
+        _dispatcher.close()
+        _dispatcher = None
+
+# Statuses sent to EMAIL_RECIPIENTS when no subscriptions are configured
+DEFAULT_STATUSES = ("ALERT", "PENDING")
 
 # Get email recipients
 def get_recipients():
-    # In a real system, this would come from a database or config file
+    """Fallback recipients, used only while alert_subscriptions is empty."""
     recipients_env = os.environ.get('EMAIL_RECIPIENTS', '')
     if recipients_env:
         return [email.strip() for email in recipients_env.split(',')]
@@ -187,6 +199,125 @@ def get_recipients():
         # Default recipient for testing
         return ['admin@example.com']
 
+# Route a claimed batch to destinations
+def route_alerts(engine, alerts):
+    """
+    Match a batch of alerts against every active subscription in one query
+    and return {(channel, destination): [alerts]}. Pairs already delivered
+    (by an earlier, partially failed attempt) are skipped.
+    """
+    by_id = {alert["id"]: alert for alert in alerts}
+
+    with engine.connect() as conn:
+        result = conn.execute(
+            text("""
+                SELECT s.channel, s.destination, a.id
+                FROM alerts a
+                JOIN alert_subscriptions s
+                    ON s.active
+                    AND (s.symbols IS NULL OR a.symbol = ANY(s.symbols))
+                    AND (s.strategies IS NULL OR a.strategy = ANY(s.strategies))
+                    AND a.status = ANY(s.statuses)
+                    AND COALESCE((a.details->>'conditions_met')::int, 0) >= s.min_conditions
+                WHERE a.id = ANY(:ids)
+                AND NOT EXISTS (
+                    SELECT 1 FROM alert_deliveries d
+                    WHERE d.alert_id = a.id AND d.recipient = s.destination AND d.channel = s.channel
+                )
+                GROUP BY s.channel, s.destination, a.id
+                ORDER BY s.channel, s.destination, a.id
+            """),
+            {"ids": list(by_id)}
+        )
+        rows = result.fetchall()
+        has_subscriptions = bool(rows) or conn.execute(
+            text("SELECT EXISTS (SELECT 1 FROM alert_subscriptions WHERE active)")
+        ).scalar()
+
+    routes = {}
+    if has_subscriptions:
+        for channel, destination, alert_id in rows:
+            routes.setdefault((channel, destination), []).append(by_id[alert_id])
+    else:
+        # No subscriptions yet: everything actionable goes to EMAIL_RECIPIENTS
+        actionable = [alert for alert in alerts if alert["status"] in DEFAULT_STATUSES]
+        if actionable:
+            routes = {("email", email): actionable for email in get_recipients()}
+    return routes
+
+# Record successful deliveries
+def record_deliveries(engine, results):
+    """
+    Insert one row per delivered (alert, destination, channel) in a single
+    statement, with the send duration and the latency since the alert was
+    created.
+    """
+    rows = [
+        (alert["id"], result["destination"], result["channel"], result["duration_ms"], result["attempts"])
+        for result in results if result["ok"]
+        for alert in result["alerts"]
+    ]
+    if not rows:
+        return
+    alert_ids, recipients, channels, durations, attempts = (list(column) for column in zip(*rows))
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO alert_deliveries
+                    (alert_id, recipient, channel, duration_ms, attempts, latency_ms)
+                SELECT d.alert_id, d.recipient, d.channel, d.duration_ms, d.attempts,
+                       (EXTRACT(EPOCH FROM (clock_timestamp() - a.created_at)) * 1000)::int
+                FROM unnest(
+                    CAST(:alert_ids AS integer[]),
+                    CAST(:recipients AS varchar[]),
+                    CAST(:channels AS varchar[]),
+                    CAST(:durations AS integer[]),
+                    CAST(:attempts AS integer[])
+                ) AS d(alert_id, recipient, channel, duration_ms, attempts)
+                JOIN alerts a ON a.id = d.alert_id
+                ON CONFLICT DO NOTHING
+            """),
+            {
+                "alert_ids": alert_ids,
+                "recipients": recipients,
+                "channels": channels,
+                "durations": durations,
+                "attempts": attempts
+            }
+        )
+
+# Deliver a claimed batch
+def deliver_batch(engine, alerts):
+    """
+    Send every destination its digest of the batch, all channels and
+    destinations concurrently. Returns the sent, retry and rejected outbox ids
+    plus an error summary. An alert is retried if any of its destinations
+    failed transiently; one whose only failures are permanent (a refused
+    address, a 4xx, an unconfigured channel) is rejected, as retrying would
+    only re-send it to the destinations that already have it.
+    """
+    routes = route_alerts(engine, alerts)
+    results = get_dispatcher().deliver_all(
+        [(channel, destination, digest) for (channel, destination), digest in routes.items()]
+    )
+    record_deliveries(engine, results)
+
+    failures = [result for result in results if not result["ok"]]
+    retry_alert_ids = {alert["id"] for result in failures if not result["permanent"] for alert in result["alerts"]}
+    rejected_alert_ids = {alert["id"] for result in failures for alert in result["alerts"]} - retry_alert_ids
+    logger.info(f"Delivered {len(results) - len(failures)} of {len(results)} digests covering {len(alerts)} alerts")
+
+    sent, retry, rejected = [], [], []
+    for alert in alerts:
+        if alert["id"] in retry_alert_ids:
+            retry.append(alert["outbox_id"])
+        elif alert["id"] in rejected_alert_ids:
+            rejected.append(alert["outbox_id"])
+        else:
+            sent.append(alert["outbox_id"])
+    error = "; ".join(f"{r['channel']}:{r['label']}: {r['error']}" for r in failures)
+    return sent, retry, rejected, error
+
 # Record health status
 def update_health_status(engine, status, details=None):
     try:
@@ -208,39 +339,51 @@ def update_health_status(engine, status, details=None):
 
 # Main function
 def main():
+    """
+    Send all pending alerts. Returns False without doing anything when another
+    dispatch is already running.
+    """
     logger.info("Starting alert system")
     
     try:
         # Get database connection
         engine = get_db_connection()
-        
-        # Get pending alerts
-        alerts = get_pending_alerts(engine)
-        
-        if not alerts:
-            logger.info("No pending alerts")
-            update_health_status(engine, "OK", "No pending alerts")
-            return
-        
-        logger.info(f"Found {len(alerts)} pending alerts")
-        
-        # Get recipients
-        recipients = get_recipients()
-        
-        if not recipients:
-            logger.error("No recipients configured")
-            update_health_status(engine, "ERROR", "No recipients configured")
-            return
-        
-        # Send email
-        if send_email(alerts, recipients):
-            # Mark alerts as sent
-            for alert in alerts:
-                mark_alert_sent(engine, alert["id"])
+
+        with advisory_lock(engine, ALERT_LOCK) as acquired:
+            if not acquired:
+                logger.warning("Another alert dispatch is in progress, skipping this run")
+                return False
             
-            update_health_status(engine, "OK", f"Sent {len(alerts)} alerts")
-        else:
-            update_health_status(engine, "ERROR", "Failed to send alerts")
+            sent = failed = rejected = 0
+            while True:
+                # Claim and deliver one batch at a time until the outbox is drained
+                alerts = claim_alert_batch(engine)
+                if not alerts:
+                    break
+
+                sent_ids, retry_ids, rejected_ids, error = deliver_batch(engine, alerts)
+                if sent_ids:
+                    mark_batch_sent(engine, sent_ids)
+                    sent += len(sent_ids)
+                if rejected_ids:
+                    mark_batch_failed(engine, rejected_ids, error, permanent=True)
+                    rejected += len(rejected_ids)
+                if retry_ids:
+                    mark_batch_failed(engine, retry_ids, error)
+                    failed += len(retry_ids)
+                    # The server is unlikely to recover within this run
+                    break
+
+            if failed or rejected:
+                update_health_status(
+                    engine, "ERROR",
+                    f"Sent {sent} alerts, {failed} failed and left for retry, {rejected} rejected permanently"
+                )
+            elif sent:
+                update_health_status(engine, "OK", f"Sent {sent} alerts")
+            else:
+                logger.info("No pending alerts")
+                update_health_status(engine, "OK", "No pending alerts")
         
     except Exception as e:
         logger.error(f"Error in main process: {str(e)}")
@@ -249,5 +392,7 @@ def main():
         except:
             pass
 
+    return True
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
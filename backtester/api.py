@@ -1,11 +1,15 @@
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import json
+import asyncio
 import logging
 import os
 from datetime import datetime, timedelta
-import backtest
+import registry
+from jobs import JobManager, format_sse
+from indicators import indicator_cache
 
 # Create logs directory if it doesn't exist
 os.makedirs("/app/logs", exist_ok=True)
@@ -23,21 +27,54 @@ logger = logging.getLogger('backtester_api')
 
 app = FastAPI(title="Stock Strategy Backtester API")
 
+# Queued backtests run on a process pool sized by BACKTEST_WORKERS
+job_manager = JobManager()
+SSE_KEEPALIVE_SECONDS = 15
+
 class BacktestRequest(BaseModel):
     symbol: str
     strategy: str
     parameters: Optional[Dict[str, Any]] = None
 
+class PortfolioBacktestRequest(BaseModel):
+    symbols: Optional[List[str]] = None
+    strategy: str = "momentum_trend_breakout"
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    parameters: Optional[Dict[str, Any]] = None
+
+class BacktestJobRequest(BaseModel):
+    kind: str = "backtest"  # "backtest": one run per symbol, "portfolio": one universe run
+    symbols: Optional[List[str]] = None
+    strategy: str = "momentum_trend_breakout"
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    parameters: Optional[Dict[str, Any]] = None
+    # Optimizer grids: every parameter set is run for every symbol
+    parameter_sets: Optional[List[Dict[str, Any]]] = None
+    max_workers: Optional[int] = None
+    # Monte Carlo paths per candidate for a robustness report; none when unset
+    robustness_simulations: Optional[int] = None
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    job_manager.shutdown()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "OK", "timestamp": datetime.now().isoformat()}
 
+@app.get("/indicators/cache")
+def indicator_cache_stats():
+    """Hit statistics of this process's indicator cache; job workers report theirs with each result"""
+    return indicator_cache.stats()
+
 @app.post("/backtest")
-async def run_backtest(request: BacktestRequest):
-    """Run a backtest for a specific symbol and strategy"""
+def run_backtest(request: BacktestRequest):
+    """Run a backtest for a specific symbol and strategy, or return the registered identical run"""
     try:
-        results = backtest.run_backtest(
+        results = registry.run_backtest(
             request.symbol,
             request.strategy,
             request.parameters
@@ -47,57 +84,213 @@ async def run_backtest(request: BacktestRequest):
             raise HTTPException(status_code=400, detail=results["error"])
 
         return results
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in backtest endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/portfolio_backtest")
+def run_portfolio_backtest(request: PortfolioBacktestRequest):
+    """Backtest a strategy over a universe of symbols with shared capital"""
+    try:
+        results = registry.run_portfolio_backtest(
+            request.symbols,
+            request.strategy,
+            request.parameters,
+            request.start_date,
+            request.end_date
+        )
+
+        if "error" in results:
+            raise HTTPException(status_code=400, detail=results["error"])
+
+        return results
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in portfolio backtest endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/results")
-async def get_results(symbol: Optional[str] = None, limit: int = 10):
+def get_results(symbol: Optional[str] = None, limit: int = Query(10, ge=1, le=100)):
     """Get backtest results for a specific symbol or all symbols"""
     try:
-        results = backtest.get_backtest_results(symbol, limit)
+        results = registry.get_backtest_results(symbol, limit)
         return {"results": results}
     except Exception as e:
         logger.error(f"Error in results endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/trades")
+def get_trades(run_id: int, symbol: Optional[str] = None):
+    """Get the closed trades of a registered backtest run"""
+    try:
+        return {"run_id": run_id, "trades": registry.get_backtest_trades(run_id, symbol)}
+    except Exception as e:
+        logger.error(f"Error in trades endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/robustness")
+def get_robustness(
+    run_id: int,
+    simulations: int = Query(10000, ge=100, le=100000),
+    confidence: float = Query(0.95, gt=0, lt=1),
+    ruin_loss: float = Query(0.5, gt=0, le=1),
+    seed: Optional[int] = None
+):
+    """Bootstrap and permutation confidence intervals for a registered run's trades"""
+    try:
+        results = registry.get_backtest_robustness(run_id, simulations, confidence, ruin_loss, seed)
+
+        if "error" in results:
+            raise HTTPException(status_code=404, detail=results["error"])
+
+        return results
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in robustness endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/equity_curve")
-async def get_equity_curve(
-    symbol: str,
-    start_date: str,
+def get_equity_curve(
+    symbol: Optional[str] = None,
+    start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    strategy: str = "moving_average",
-    short_ma: int = 50,
-    long_ma: int = 100,
-    initial_capital: float = 10000.0
+    strategy: str = "momentum_trend_breakout",
+    atr_multiplier: float = 1.5,
+    risk_reward_ratio: float = 3.0,
+    initial_capital: float = 10000.0,
+    run_id: Optional[int] = None
 ):
-    """Get equity curve data for a specific backtest configuration"""
+    """Get equity curve data for a registered run, or for a specific backtest configuration"""
     try:
+        if run_id is None and not (symbol and start_date):
+            raise HTTPException(status_code=400, detail="Pass run_id, or symbol and start_date")
         if not end_date:
             end_date = datetime.now().strftime('%Y-%m-%d')
 
         params = {
-            "short_ma": short_ma,
-            "long_ma": long_ma,
+            "atr_multiplier": atr_multiplier,
+            "risk_reward_ratio": risk_reward_ratio,
             "initial_capital": initial_capital
         }
 
-        results = backtest.get_backtest_equity_curve(
+        results = registry.get_backtest_equity_curve(
             symbol,
             start_date,
             end_date,
             strategy,
-            params
+            params,
+            run_id
         )
 
         if "error" in results:
             raise HTTPException(status_code=400, detail=results["error"])
 
         return results
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in equity_curve endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/jobs", status_code=202)
+async def submit_job(request: BacktestJobRequest):
+    """Queue a backtest job; poll /jobs/{job_id} or stream /jobs/{job_id}/events for progress"""
+    if request.kind not in ("backtest", "portfolio"):
+        raise HTTPException(status_code=400, detail=f"Unknown job kind: {request.kind}")
+    if request.strategy not in registry.STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy: {request.strategy}")
+    if request.max_workers is not None and request.max_workers < 1:
+        raise HTTPException(status_code=400, detail="max_workers must be at least 1")
+    if request.robustness_simulations is not None and not 0 < request.robustness_simulations <= 100000:
+        raise HTTPException(status_code=400, detail="robustness_simulations must be between 1 and 100000")
+
+    try:
+        symbols = request.symbols or await asyncio.to_thread(registry.load_symbols_config)
+        if not symbols:
+            raise HTTPException(status_code=400, detail="No symbols to backtest")
+        parameter_sets = [
+            {**(request.parameters or {}), **parameter_set}
+            for parameter_set in (request.parameter_sets or [{}])
+        ]
+        # Reject unconvertible values now rather than failing every unit
+        for parameter_set in parameter_sets:
+            try:
+                registry.normalize_parameters(request.strategy, parameter_set)
+            except registry.ParameterError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        job = job_manager.submit(
+            request.kind,
+            request.strategy,
+            symbols,
+            parameter_sets,
+            request.start_date,
+            request.end_date,
+            request.max_workers,
+            request.robustness_simulations
+        )
+        return job.snapshot()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in job submit endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs")
+async def list_jobs():
+    """Queued, running and recently finished jobs, newest first"""
+    return {"workers": job_manager.workers, "jobs": [job.snapshot() for job in job_manager.list()]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, per-symbol progress and results of a job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.snapshot(include_results=True)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a job: queued backtests are dropped, running ones finish"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.snapshot()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-Sent Events stream of a job's progress, closed once it finishes"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    queue = job_manager.subscribe(job)
+
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            yield format_sse({"type": "status", "data": job.snapshot()})
+            if job.finished:
+                return
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                    yield format_sse(event)
+                    if event["type"] == "status" and event["data"]["status"] in ("completed", "failed", "cancelled"):
+                        break
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            job_manager.unsubscribe(job, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8004)
@@ -2,10 +2,12 @@ import pandas as pd
 import numpy as np
 import logging
 import os
+import io
 import json
 from datetime import datetime, timedelta
 from sqlalchemy import create_engine, text
 from strategy_analyzer.strategies.momentum_trend_breakout import MomentumTrendBreakoutStrategy
+from intraday import IntradayFillModel
 
 logger = logging.getLogger('backtest')
 logging.basicConfig(
@@ -42,6 +44,11 @@ def create_backtest_closed_positions_table(engine):
             profit_pct DOUBLE PRECISION,
             created_at TIMESTAMP DEFAULT NOW()
         );
+        ALTER TABLE backtest_closed_positions
+            ADD COLUMN IF NOT EXISTS run_id INTEGER REFERENCES backtest_runs(id) ON DELETE CASCADE,
+            ADD COLUMN IF NOT EXISTS shares DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS exit_reason VARCHAR(20);
+        CREATE INDEX IF NOT EXISTS idx_backtest_closed_positions_run ON backtest_closed_positions(run_id);
     """)
     with engine.connect() as conn:
         conn.execute(query)
@@ -82,10 +89,12 @@ def fetch_full_history(engine, symbol):
         logger.error(f"Error fetching full history for {symbol}: {str(e)}")
         return pd.DataFrame()
 
-def run_backtest(engine, symbol, strategy_params=None):
+def run_backtest(engine, symbol, strategy_params=None, intraday=False):
     """
     Perform backtesting for the specified symbol, allowing only one open position at a time.
     A new position is opened only when there are no currently open positions.
+    With intraday=True, days that touch both stop and target are settled on hourly bars
+    when intraday_stock_prices has them.
     """
     df = fetch_full_history(engine, symbol)
     if df.empty:
@@ -98,6 +107,8 @@ def run_backtest(engine, symbol, strategy_params=None):
     # Ensure chronological order
     df = df.sort_values("timestamp").reset_index(drop=True)
 
+    fill_model = IntradayFillModel.load(engine, [symbol], df["timestamp"]) if intraday else None
+
     strategy = MomentumTrendBreakoutStrategy(engine, settings=strategy_params)
     min_days = strategy_params.get("trend_period", 5)  # minimum lookback period
 
@@ -126,9 +137,13 @@ def run_backtest(engine, symbol, strategy_params=None):
             # If both triggered on the same day, pick which triggers first
             if stop_hit and target_hit:
                 day_open = df["open"].iloc[i]
-                dist_stop = abs(day_open - stop_loss)
-                dist_target = abs(day_open - target)
-                if dist_stop < dist_target:
+                if fill_model is not None:
+                    stop_first = fill_model.stop_first(
+                        np.zeros(1, dtype=int), i, np.array([stop_loss]), np.array([target]), np.array([day_open])
+                    )[0]
+                else:
+                    stop_first = abs(day_open - stop_loss) < abs(day_open - target)
+                if stop_first:
                     target_hit = False
                 else:
                     stop_hit = False
@@ -222,75 +237,67 @@ def backtest_report(closed_positions, label=""):
     logger.info(f"Overall average change: {overall_pct:.2f}%")
     logger.info(df_report[["symbol","signal_type","entry_date","exit_date","profit","pct_change"]].tail(5))
 
-def save_closed_positions(engine, closed_positions):
+# Columns written by save_closed_positions, in COPY order
+CLOSED_POSITION_COLUMNS = [
+    "run_id", "symbol", "signal_type", "signal_date", "entry_date", "entry_price",
+    "stop_loss", "target", "conditions_met", "exit_date", "exit_price", "shares",
+    "profit", "profit_pct", "exit_reason"
+]
+
+def closed_positions_frame(closed_positions, run_id=None):
     """
-    Insert each closed position into backtest_closed_positions table.
+    Convert closed trades (a list of dicts from run_backtest or the portfolio
+    engine's trades DataFrame) into one typed frame in COPY column order.
+    profit_pct is derived from the prices when the trades do not carry it.
     """
-    if not closed_positions:
-        return
-
-    insert_query = text("""
-        INSERT INTO backtest_closed_positions (
-            symbol,
-            signal_type,
-            signal_date,
-            entry_date,
-            entry_price,
-            stop_loss,
-            target,
-            conditions_met,
-            exit_date,
-            exit_price,
-            profit,
-            profit_pct
-        )
-        VALUES (
-            :symbol,
-            :signal_type,
-            :signal_date,
-            :entry_date,
-            :entry_price,
-            :stop_loss,
-            :target,
-            :conditions_met,
-            :exit_date,
-            :exit_price,
-            :profit,
-            :profit_pct
-        )
-    """)
-
-    with engine.begin() as conn:
-        for pos in closed_positions:
-            # Convert np.float64 to Python float
-            entry_price = float(pos["entry_price"]) if pos["entry_price"] is not None else None
-            stop_loss   = float(pos["stop_loss"])   if pos["stop_loss"]   is not None else None
-            target      = float(pos["target"])      if pos["target"]      is not None else None
-            exit_price  = float(pos["exit_price"])  if pos["exit_price"]  is not None else None
-            profit      = float(pos["profit"])      if pos["profit"]      is not None else None
-
-            # Compute a percentage gain/loss
-            if entry_price is not None and exit_price is not None:
-                profit_pct = ((exit_price - entry_price) / entry_price) * 100
-            else:
-                profit_pct = None
-
-            conn.execute(insert_query, {
-                "symbol": pos["symbol"],
-                "signal_type": pos["signal_type"],
-                "signal_date": pos["signal_date"],
-                "entry_date": pos["entry_date"],
-                "entry_price": entry_price,
-                "stop_loss": stop_loss,
-                "target": target,
-                "conditions_met": pos["conditions_met"],
-                "exit_date": pos["exit_date"],
-                "exit_price": exit_price,
-                "profit": profit,
-                "profit_pct": profit_pct
-            })
-
-    logger.info(f"Inserted {len(closed_positions)} closed positions into database.")
+    df = pd.DataFrame(closed_positions)
+    has_profit_pct = "profit_pct" in df
+    df = df.reindex(columns=CLOSED_POSITION_COLUMNS)
+
+    frame = pd.DataFrame(index=df.index)
+    frame["run_id"] = pd.array([run_id] * len(df), dtype="Int64")
+    frame["symbol"] = df["symbol"].astype(str)
+    frame["signal_type"] = df["signal_type"]
+    for column in ("signal_date", "entry_date", "exit_date"):
+        frame[column] = pd.to_datetime(df[column])
+    for column in ("entry_price", "stop_loss", "target", "exit_price", "shares", "profit", "profit_pct"):
+        frame[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+    frame["conditions_met"] = pd.to_numeric(df["conditions_met"], errors="coerce").astype("Int64")
+    if not has_profit_pct:
+        frame["profit_pct"] = (frame["exit_price"] - frame["entry_price"]) / frame["entry_price"] * 100
+    frame["exit_reason"] = df["exit_reason"]
+    return frame[CLOSED_POSITION_COLUMNS]
+
+def save_closed_positions(engine, closed_positions, run_id=None, conn=None):
+    """
+    Write closed trades into backtest_closed_positions with a single COPY,
+    tagged with the backtest run they belong to. Given an open connection
+    `conn`, the COPY runs in its transaction and is committed with it.
+    """
+    if closed_positions is None or len(closed_positions) == 0:
+        return 0
+
+    frame = closed_positions_frame(closed_positions, run_id)
+    buffer = io.StringIO()
+    # Empty unquoted fields are NULL in COPY's CSV format
+    frame.to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d %H:%M:%S")
+    buffer.seek(0)
+    copy = f"COPY backtest_closed_positions ({', '.join(CLOSED_POSITION_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+    if conn is not None:
+        with conn.connection.cursor() as cur:
+            cur.copy_expert(copy, buffer)
+    else:
+        raw = engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                cur.copy_expert(copy, buffer)
+            raw.commit()
+        finally:
+            raw.close()
+
+    logger.info(f"Inserted {len(frame)} closed positions into database.")
+    return len(frame)
 
 if __name__ == "__main__":
     engine = get_db_connection()
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import logging
+from sqlalchemy import text
+
+logger = logging.getLogger('intraday_fills')
+
+
+class IntradayFillModel:
+    """
+    Decides which of a position's stop and target was hit first on days the
+    daily range contains both, by walking that day's hourly bars from
+    intraday_stock_prices.
+
+    Ties are rare, so nothing is preloaded: the hourly bars of a simulated
+    day's tied positions are fetched in one query and laid end to end, and
+    searchsorted finds each position's first bar touching either level.
+    Positions without hourly bars for the day, or where a single bar spans
+    both levels, fall back to the daily heuristic: the level closer to the
+    open is assumed to come first.
+    """
+
+    def __init__(self, engine, symbols, dates):
+        self.engine = engine
+        self.symbols = np.asarray(symbols)
+        self.dates = pd.DatetimeIndex(dates).normalize()
+        self.resolved = 0
+        self.fallback = 0
+
+    @classmethod
+    def load(cls, engine, symbols, dates):
+        """
+        Fill model for a daily panel's `symbols` columns and `dates` rows, or
+        None when intraday_stock_prices has no bars for them.
+        """
+        dates = pd.DatetimeIndex(dates).normalize()
+        with engine.connect() as conn:
+            available = conn.execute(
+                text("""
+                    SELECT EXISTS (
+                        SELECT 1 FROM intraday_stock_prices
+                        WHERE symbol = ANY(:symbols)
+                        AND timestamp >= :start_date
+                        AND timestamp < :end_date
+                    )
+                """),
+                {
+                    "symbols": list(symbols),
+                    "start_date": dates[0].to_pydatetime(),
+                    "end_date": (dates[-1] + pd.Timedelta(days=1)).to_pydatetime()
+                }
+            ).scalar()
+        return cls(engine, symbols, dates) if available else None
+
+    def day_bars(self, symbols, day):
+        """Hourly bars of the `symbols` columns on panel day `day`, ordered by symbol then time."""
+        start = self.dates[day]
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT symbol, open::float8, high::float8, low::float8
+                    FROM intraday_stock_prices
+                    WHERE symbol = ANY(:symbols)
+                    AND timestamp >= :start_date
+                    AND timestamp < :end_date
+                    ORDER BY symbol, timestamp
+                """),
+                {
+                    "symbols": list(self.symbols[symbols]),
+                    "start_date": start.to_pydatetime(),
+                    "end_date": (start + pd.Timedelta(days=1)).to_pydatetime()
+                }
+            ).fetchall()
+        if not rows:
+            return None
+        symbol, open_, high, low = zip(*rows)
+        return np.asarray(symbol), np.asarray(open_), np.asarray(high), np.asarray(low)
+
+    def stop_first(self, symbols, day, stop, target, day_open):
+        """
+        For positions in the `symbols` columns whose stop and target both lie
+        in day `day`'s range, return whether the stop was reached first.
+        """
+        result = np.abs(day_open - stop) < np.abs(day_open - target)
+        bars = self.day_bars(symbols, day)
+        if bars is None:
+            self.fallback += len(symbols)
+            return result
+        bar_symbol, bar_open, bar_high, bar_low = bars
+
+        # Each bar belongs to one tied position; bars of a position are contiguous
+        names = self.symbols[symbols]
+        order = np.argsort(names, kind="stable")
+        owner = order[np.searchsorted(names[order], bar_symbol)]
+        bar_order = np.argsort(owner, kind="stable")
+        owner, bar_open, bar_high, bar_low = owner[bar_order], bar_open[bar_order], bar_high[bar_order], bar_low[bar_order]
+
+        positions = np.arange(len(symbols))
+        segment_start = np.searchsorted(owner, positions, side="left")
+        lengths = np.searchsorted(owner, positions, side="right") - segment_start
+        first_stop = self._first_touch(bar_low <= stop[owner], segment_start, lengths)
+        first_target = self._first_touch(bar_high >= target[owner], segment_start, lengths)
+
+        # A position with no bars gets first_stop == first_target == 0 and keeps the heuristic
+        decided = first_stop != first_target
+        result[decided] = first_stop[decided] < first_target[decided]
+
+        # Both levels inside one hourly bar: apply the heuristic to that bar's open
+        same_bar = ~decided & (first_stop < lengths)
+        if same_bar.any():
+            opens = bar_open[segment_start[same_bar] + first_stop[same_bar]]
+            result[same_bar] = np.abs(opens - stop[same_bar]) < np.abs(opens - target[same_bar])
+
+        self.resolved += int(decided.sum())
+        self.fallback += len(symbols) - int(decided.sum())
+        return result
+
+    @staticmethod
+    def _first_touch(touched, segment_start, lengths):
+        """Offset of the first touching bar within each segment; its length when none does."""
+        hits = np.flatnonzero(touched)
+        if len(hits) == 0:
+            return lengths
+        first = np.searchsorted(hits, segment_start)
+        offset = hits[np.minimum(first, len(hits) - 1)] - segment_start
+        return np.where((first < len(hits)) & (offset < lengths), offset, lengths)
@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import multiprocessing
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import registry
+from backtest import get_db_connection
+from indicators import indicator_cache
+
+logger = logging.getLogger('backtest_jobs')
+
+# CPU budget: worker processes shared by every job, so concurrent jobs
+# never run more backtests at once than this
+BACKTEST_WORKERS = int(os.environ.get('BACKTEST_WORKERS', os.cpu_count() or 2))
+
+# Finished jobs are kept in memory for status queries, oldest dropped first
+FINISHED_JOBS_KEPT = 100
+
+# Per-subscriber buffer of progress events; a stalled stream drops events
+SUBSCRIBER_QUEUE_SIZE = 100
+
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+# One engine per worker process, created on its first backtest
+_worker_engine = None
+
+
+def run_unit(strategy, symbols, parameters, start_date, end_date, robustness_simulations=None):
+    """
+    Run one backtest in a worker process and return its registry summary,
+    with a Monte Carlo robustness report when simulations are requested.
+    Units of a parameter sweep reuse the worker's cached indicator series;
+    its cache statistics come with the summary.
+    """
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = get_db_connection()
+    run = registry.get_or_run_backtest(_worker_engine, strategy, symbols, parameters, start_date, end_date)
+    if run is None:
+        raise ValueError("No price data for the requested period")
+    summary = {**registry.run_summary(run), "metrics": run["metrics"]}
+    if robustness_simulations:
+        summary["robustness"] = registry.get_backtest_robustness(
+            run["id"], robustness_simulations, engine=_worker_engine
+        )
+    summary["indicator_cache"] = indicator_cache.stats()
+    return summary
+
+
+def format_sse(event):
+    """Serialize an event as a Server-Sent Events message."""
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+class BacktestJob:
+    """
+    A queued backtest request split into units: one per symbol and
+    parameter set for a "backtest" job, a single universe run for a
+    "portfolio" job. Progress is tracked per symbol.
+    """
+
+    def __init__(self, kind, strategy, symbols, parameter_sets, start_date, end_date, max_workers,
+                 robustness_simulations=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.strategy = strategy
+        self.symbols = symbols
+        self.start_date = start_date
+        self.end_date = end_date
+        self.max_workers = max_workers
+        self.robustness_simulations = robustness_simulations
+        self.status = "queued"
+        self.cancel_requested = False
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+
+        if kind == "portfolio":
+            self.pending = deque((tuple(symbols), parameters) for parameters in parameter_sets)
+        else:
+            self.pending = deque(((symbol,), parameters) for parameters in parameter_sets for symbol in symbols)
+        self.total = len(self.pending)
+        self.running = 0
+        self.done = 0
+        self.failed = 0
+        self.symbol_units = {}
+        for unit_symbols, _ in self.pending:
+            for symbol in unit_symbols:
+                self.symbol_units[symbol] = self.symbol_units.get(symbol, 0) + 1
+        self.symbol_done = dict.fromkeys(self.symbol_units, 0)
+        self.results = []
+        self.errors = []
+        self.subscribers = set()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def can_start_unit(self):
+        if self.cancel_requested or not self.pending:
+            return False
+        return self.max_workers is None or self.running < self.max_workers
+
+    def progress(self):
+        symbols_done = sum(1 for symbol, units in self.symbol_units.items() if self.symbol_done[symbol] == units)
+        return {
+            "units_total": self.total,
+            "units_done": self.done,
+            "units_failed": self.failed,
+            "units_running": self.running,
+            "symbols_total": len(self.symbol_units),
+            "symbols_done": symbols_done,
+            "percent": round(100 * (self.done + self.failed) / self.total, 1) if self.total else 100.0,
+        }
+
+    def snapshot(self, include_results=False):
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "strategy": self.strategy,
+            "status": self.status,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "progress": self.progress(),
+        }
+        if include_results:
+            data["results"] = self.results
+            data["errors"] = self.errors
+        return data
+
+
+class JobManager:
+    """
+    In-process backtest queue. Jobs are split into units that run on a
+    shared process pool; free worker slots are handed to running jobs in
+    round-robin order, so a long universe job does not starve a
+    single-symbol request submitted after it. Lives on the API's event loop.
+    """
+
+    def __init__(self, workers=BACKTEST_WORKERS):
+        self.workers = max(1, workers)
+        self.jobs = {}
+        self.active = deque()
+        self.in_flight = 0
+        self._pool = None
+
+    def pool(self):
+        if self._pool is None:
+            # spawn: forking the API process would copy uvicorn's threads and loop
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Started backtest worker pool with {self.workers} processes")
+        return self._pool
+
+    def submit(self, kind, strategy, symbols, parameter_sets=None, start_date=None, end_date=None,
+               max_workers=None, robustness_simulations=None):
+        job = BacktestJob(kind, strategy, symbols, parameter_sets or [{}], start_date, end_date, max_workers,
+                          robustness_simulations)
+        self.jobs[job.id] = job
+        self.active.append(job)
+        logger.info(f"Queued {kind} job {job.id}: {job.total} backtests over {len(job.symbol_units)} symbols")
+        self._dispatch()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id):
+        """Drop a job's queued units; units already running finish first."""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_requested = True
+        skipped = len(job.pending)
+        job.pending.clear()
+        logger.info(f"Cancelling job {job.id}: {skipped} queued backtests dropped, {job.running} still running")
+        if job.running:
+            job.status = "cancelling"
+            self._publish(job, "status")
+        else:
+            self._finish(job)
+        return job
+
+    def subscribe(self, job):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        job.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, job, queue):
+        job.subscribers.discard(queue)
+
+    def shutdown(self):
+        for job in list(self.active):
+            self.cancel(job.id)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _next_job(self):
+        for _ in range(len(self.active)):
+            job = self.active[0]
+            self.active.rotate(-1)
+            if job.can_start_unit():
+                return job
+        return None
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.in_flight < self.workers:
+            job = self._next_job()
+            if job is None:
+                break
+            symbols, parameters = job.pending.popleft()
+            if job.status == "queued":
+                job.status = "running"
+                job.started_at = datetime.now()
+                self._publish(job, "status")
+            job.running += 1
+            self.in_flight += 1
+            future = loop.run_in_executor(
+                self.pool(), run_unit,
+                job.strategy, list(symbols), parameters, job.start_date, job.end_date,
+                job.robustness_simulations
+            )
+            future.add_done_callback(
+                lambda f, job=job, symbols=symbols, parameters=parameters, started=time.monotonic():
+                    self._unit_done(job, symbols, parameters, started, f)
+            )
+
+    def _unit_done(self, job, symbols, parameters, started, future):
+        job.running -= 1
+        self.in_flight -= 1
+        seconds = round(time.monotonic() - started, 3)
+        unit = {"symbols": list(symbols) if len(symbols) > 1 else symbols[0], "parameters": parameters}
+        try:
+            result = future.result()
+            job.done += 1
+            job.results.append({**unit, "seconds": seconds, "run": result})
+            self._publish(job, "progress", {**unit, "seconds": seconds, "run_id": result["id"], "cached": result["cached"]})
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker died (e.g. killed for memory); start a fresh pool
+                logger.error("Backtest worker pool broke, restarting it")
+                self._pool = None
+            job.failed += 1
+            job.errors.append({**unit, "error": str(e)})
+            logger.error(f"Backtest of {unit['symbols']} in job {job.id} failed: {str(e)}")
+            self._publish(job, "progress", {**unit, "seconds": seconds, "error": str(e)})
+        for symbol in symbols:
+            job.symbol_done[symbol] += 1
+
+        if not job.pending and not job.running:
+            self._finish(job)
+        self._dispatch()
+
+    def _finish(self, job):
+        if job.cancel_requested:
+            job.status = "cancelled"
+        elif job.total and job.failed == job.total:
+            job.status = "failed"
+        else:
+            job.status = "completed"
+        job.finished_at = datetime.now()
+        if job in self.active:
+            self.active.remove(job)
+        logger.info(f"Job {job.id} {job.status}: {job.done} done, {job.failed} failed of {job.total}")
+        self._publish(job, "status")
+        self._prune()
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda job: job.finished_at)[:-FINISHED_JOBS_KEPT]:
+            del self.jobs[job.id]
+
+    def _publish(self, job, event_type, unit=None):
+        data = job.snapshot()
+        if unit is not None:
+            data["unit"] = unit
+        event = {"type": event_type, "data": data}
+        for queue in list(job.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning(f"Dropping progress event of job {job.id} for a slow client")
@@ -0,0 +1,308 @@
+import pandas as pd
+import numpy as np
+import logging
+from strategy_analyzer.strategies.base import discover_strategies
+from strategy_analyzer.strategies.panel import PRICE_COLUMNS, load_panel
+
+from backtest import get_db_connection, load_symbols_config
+from intraday import IntradayFillModel
+
+logger = logging.getLogger('portfolio_backtest')
+
+# Portfolio rules; any of them can be overridden per run
+PORTFOLIO_DEFAULTS = {
+    "initial_capital": 100000.0,  # PLN
+    "max_positions": 10,          # concurrent open positions
+    "risk_per_trade": 0.01,       # equity lost if the initial stop is hit
+    "max_position_pct": 0.2,      # cap on a single position's share of equity
+    "commission_rate": 0.0039,    # per side, typical GPW retail rate
+    "min_commission": 5.0,        # PLN per order
+    "slippage_pct": 0.001,        # entries fill higher and exits lower by this much
+    "intraday_fills": False,      # settle stop/target ties on hourly bars where available
+}
+# Portfolio rules that are counts and stay integers
+PORTFOLIO_INTEGER_SETTINGS = ("max_positions",)
+
+TRADING_DAYS = 252
+
+
+def load_price_panel(engine, symbols, start_date=None, end_date=None):
+    """
+    Daily bars of every symbol as a date x symbol PricePanel, from the loader
+    the strategy analyzer uses. Days a symbol did not trade are NaN.
+    """
+    return load_panel(engine, symbols, PRICE_COLUMNS, start_date=start_date, end_date=end_date)
+
+
+def entry_signals(panel, strategy):
+    """
+    Evaluate the strategy's entry rules for every symbol and day at once and
+    return the signal mask with the signal type, conditions met, stop-loss,
+    target and turnover of each signal as arrays.
+    """
+    evaluation = strategy.evaluate(panel)
+    return {
+        "signal": evaluation["signal"],
+        "signal_type": evaluation["signal_type"],
+        "conditions": evaluation["conditions"],
+        "stop_loss": evaluation["stop_loss"],
+        "target": evaluation["target"],
+        "turnover": evaluation["details"]["turnover"],
+    }
+
+
+def commission(value, settings):
+    return np.maximum(value * settings["commission_rate"], settings["min_commission"])
+
+
+def simulate(panel, signals, settings, fill_model=None):
+    """
+    Walk the date x symbol panel once. Each day: enter yesterday's signals at
+    the open (highest conditions_met and turnover first, each one the
+    remaining cash covers, while slots last), then check every open position's stop and target against the
+    day's range, then mark the book to the close.
+
+    Position state is one slot per symbol in flat arrays; closed trades are
+    collected as array chunks and assembled into a DataFrame at the end.
+    With an IntradayFillModel, days on which both levels were touched are
+    settled on hourly bars instead of by distance from the open.
+    """
+    o = panel["open"].to_numpy()
+    h = panel["high"].to_numpy()
+    l = panel["low"].to_numpy()
+    c = panel["close"].to_numpy()
+    mark = panel["close"].ffill().to_numpy()
+    n_days, n_symbols = c.shape
+
+    signal = signals["signal"]
+    signal_types = signals["signal_type"]
+    conditions = signals["conditions"]
+    stop_levels = signals["stop_loss"]
+    target_levels = signals["target"]
+    turnover = np.nan_to_num(signals["turnover"])
+
+    slip = settings["slippage_pct"]
+    cash = float(settings["initial_capital"])
+    commission_paid = 0.0
+
+    # Open position state, one slot per symbol
+    shares = np.zeros(n_symbols)
+    entry_price = np.zeros(n_symbols)
+    entry_cost = np.zeros(n_symbols)
+    stop = np.zeros(n_symbols)
+    target = np.zeros(n_symbols)
+    entry_day = np.full(n_symbols, -1)
+    entry_conditions = np.zeros(n_symbols, dtype=int)
+    entry_signal_type = np.full(n_symbols, "", dtype=signal_types.dtype)
+
+    equity = np.empty(n_days)
+    market_value = np.empty(n_days)
+    open_count = np.empty(n_days, dtype=int)
+    equity[0] = cash
+    market_value[0] = 0.0
+    open_count[0] = 0
+    closed = []
+
+    for t in range(1, n_days):
+        # 1) Entries at today's open for yesterday's signals
+        slots = settings["max_positions"] - np.count_nonzero(shares)
+        if slots > 0:
+            candidates = np.flatnonzero(signal[t - 1] & (shares == 0) & (o[t] >= c[t - 1]))
+            if candidates.size:
+                order = np.lexsort((-turnover[t - 1, candidates], -conditions[t - 1, candidates]))
+                candidates = candidates[order]
+
+                fill = o[t, candidates] * (1 + slip)
+                risk = fill - stop_levels[t - 1, candidates]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    size = np.minimum(
+                        np.floor(equity[t - 1] * settings["risk_per_trade"] / risk),
+                        np.floor(equity[t - 1] * settings["max_position_pct"] / fill)
+                    )
+                size = np.where(risk > 0, size, 0)
+                valid = size > 0
+                candidates, fill, size = candidates[valid], fill[valid], size[valid]
+
+                fees = commission(size * fill, settings)
+                cost = size * fill + fees
+                # Fill greedily in priority order: a candidate the remaining cash
+                # cannot cover is skipped, and cheaper ones after it may still fit
+                taken = np.zeros(candidates.size, dtype=bool)
+                remaining = cash
+                for i in range(candidates.size):
+                    if cost[i] <= remaining:
+                        taken[i] = True
+                        remaining -= cost[i]
+                        slots -= 1
+                        if slots == 0:
+                            break
+                candidates, fill, size, cost = candidates[taken], fill[taken], size[taken], cost[taken]
+
+                cash -= cost.sum()
+                commission_paid += fees[taken].sum()
+                shares[candidates] = size
+                entry_price[candidates] = fill
+                entry_cost[candidates] = cost
+                stop[candidates] = stop_levels[t - 1, candidates]
+                target[candidates] = target_levels[t - 1, candidates]
+                entry_day[candidates] = t
+                entry_conditions[candidates] = conditions[t - 1, candidates]
+                entry_signal_type[candidates] = signal_types[t - 1, candidates]
+
+        # 2) Stops and targets within today's range
+        held = shares > 0
+        if held.any():
+            stop_hit = held & (l[t] <= stop)
+            target_hit = held & (h[t] >= target)
+            # Both touched: assume the level closer to the open came first
+            both = stop_hit & target_hit
+            stop_first = np.abs(o[t] - stop) < np.abs(o[t] - target)
+            if fill_model is not None and both.any():
+                tied = np.flatnonzero(both)
+                stop_first[tied] = fill_model.stop_first(tied, t, stop[tied], target[tied], o[t, tied])
+            stop_hit &= ~both | stop_first
+            target_hit &= ~both | ~stop_first
+
+            exits = np.flatnonzero(stop_hit | target_hit)
+            if exits.size:
+                # A gap through the level fills at the open
+                level = np.where(stop_hit[exits], np.minimum(o[t, exits], stop[exits]),
+                                 np.maximum(o[t, exits], target[exits]))
+                exit_price = level * (1 - slip)
+                fees = commission(shares[exits] * exit_price, settings)
+                proceeds = shares[exits] * exit_price - fees
+                cash += proceeds.sum()
+                commission_paid += fees.sum()
+
+                closed.append((
+                    exits, entry_day[exits] - 1, entry_day[exits], np.full(exits.size, t),
+                    entry_price[exits], exit_price, stop[exits], target[exits], shares[exits],
+                    entry_conditions[exits], proceeds - entry_cost[exits], entry_cost[exits],
+                    np.where(stop_hit[exits], "stop_loss", "target"), entry_signal_type[exits]
+                ))
+                shares[exits] = 0
+                entry_day[exits] = -1
+
+        # 3) Mark to market
+        market_value[t] = np.nansum(shares * mark[t])
+        equity[t] = cash + market_value[t]
+        open_count[t] = np.count_nonzero(shares)
+
+    dates = panel["close"].index
+    symbols = panel["close"].columns
+    trades = build_trades(closed, dates, symbols)
+
+    held = np.flatnonzero(shares)
+    open_positions = pd.DataFrame({
+        "symbol": symbols[held],
+        "entry_date": dates[entry_day[held]],
+        "entry_price": entry_price[held],
+        "stop_loss": stop[held],
+        "target": target[held],
+        "shares": shares[held],
+        "cost": entry_cost[held],
+        "market_value": shares[held] * mark[-1, held],
+    })
+
+    equity = pd.Series(equity, index=dates, name="equity")
+    return {
+        "equity": equity,
+        "drawdown": (equity / equity.cummax() - 1).rename("drawdown"),
+        "exposure": pd.Series(market_value / equity.to_numpy(), index=dates, name="exposure"),
+        "open_positions_count": pd.Series(open_count, index=dates, name="open_positions"),
+        "trades": trades,
+        "open_positions": open_positions,
+        "commission_paid": commission_paid,
+    }
+
+
+def build_trades(closed, dates, symbols):
+    columns = ["symbol", "signal_date", "entry_date", "exit_date", "entry_price", "exit_price",
+               "stop_loss", "target", "shares", "conditions_met", "profit", "cost", "exit_reason",
+               "signal_type"]
+    if not closed:
+        return pd.DataFrame(columns=columns + ["profit_pct"])
+    parts = [np.concatenate(chunk) for chunk in zip(*closed)]
+    trades = pd.DataFrame(dict(zip(columns, parts)))
+    trades["symbol"] = symbols[trades["symbol"].to_numpy()]
+    for column in ("signal_date", "entry_date", "exit_date"):
+        trades[column] = dates[trades[column].to_numpy()]
+    trades["profit_pct"] = trades["profit"] / trades["cost"] * 100
+    return trades
+
+
+def portfolio_metrics(result, settings):
+    """Headline statistics of a simulated portfolio."""
+    equity = result["equity"]
+    trades = result["trades"]
+    initial = settings["initial_capital"]
+    returns = equity.pct_change().dropna()
+    years = max((equity.index[-1] - equity.index[0]).days / 365.25, 1 / TRADING_DAYS)
+
+    wins = trades[trades["profit"] > 0]
+    losses = trades[trades["profit"] <= 0]
+    gross_loss = -losses["profit"].sum()
+
+    return {
+        "initial_capital": initial,
+        "final_equity": float(equity.iloc[-1]),
+        "total_return_pct": float((equity.iloc[-1] / initial - 1) * 100),
+        "cagr_pct": float(((equity.iloc[-1] / initial) ** (1 / years) - 1) * 100),
+        "max_drawdown_pct": float(result["drawdown"].min() * 100),
+        "sharpe": float(returns.mean() / returns.std() * np.sqrt(TRADING_DAYS)) if returns.std() > 0 else 0.0,
+        "avg_exposure_pct": float(result["exposure"].mean() * 100),
+        "max_open_positions": int(result["open_positions_count"].max()),
+        "trades": int(len(trades)),
+        "win_rate_pct": float(len(wins) / len(trades) * 100) if len(trades) else 0.0,
+        "profit_factor": float(wins["profit"].sum() / gross_loss) if gross_loss > 0 else None,
+        # Entry commission of positions still open included
+        "commission_paid": float(result["commission_paid"]),
+        "open_positions": int(len(result["open_positions"])),
+    }
+
+
+def run_portfolio_backtest(engine, symbols=None, strategy_params=None, portfolio_params=None,
+                           start_date=None, end_date=None, strategy="momentum_trend_breakout"):
+    """
+    Backtest the strategy over a whole universe with shared capital.
+    Returns the simulation result (equity, drawdown and exposure series,
+    closed trades, open positions) plus its metrics, or None without data.
+    """
+    settings = dict(PORTFOLIO_DEFAULTS)
+    settings.update(portfolio_params or {})
+    symbols = symbols or load_symbols_config()
+
+    panel = load_price_panel(engine, symbols, start_date, end_date)
+    if panel is None:
+        logger.warning("No price data for the requested universe")
+        return None
+    logger.info(f"Loaded {panel['close'].shape[0]} days x {panel['close'].shape[1]} symbols")
+
+    fill_model = None
+    if settings["intraday_fills"]:
+        fill_model = IntradayFillModel.load(engine, panel["close"].columns, panel["close"].index)
+        if fill_model is None:
+            logger.info("No intraday bars for the requested universe, using the daily heuristic")
+
+    strategy = discover_strategies()[strategy](engine, settings=strategy_params)
+    signals = entry_signals(panel, strategy)
+    result = simulate(panel, signals, settings, fill_model)
+    result["metrics"] = portfolio_metrics(result, settings)
+    if fill_model is not None:
+        result["metrics"]["intraday_resolved_exits"] = fill_model.resolved
+        result["metrics"]["heuristic_resolved_exits"] = fill_model.fallback
+    result["settings"] = settings
+    return result
+
+
+if __name__ == "__main__":
+    engine = get_db_connection()
+    result = run_portfolio_backtest(engine)
+    if result is None:
+        exit(0)
+
+    logger.info("===== Portfolio Backtest Results =====")
+    for key, value in result["metrics"].items():
+        logger.info(f"{key}: {value}")
+    if not result["trades"].empty:
+        logger.info(result["trades"][["symbol", "entry_date", "exit_date", "shares", "profit", "profit_pct"]].tail(5))
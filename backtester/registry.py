@@ -0,0 +1,418 @@
+import io
+import json
+import time
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from strategy_analyzer.strategies.base import discover_strategies
+
+import portfolio
+import robustness
+from backtest import get_db_connection, load_symbols_config, save_closed_positions
+
+logger = logging.getLogger('backtest_registry')
+
+# Strategies a backtest can be requested for, by the name used in strategies.json
+STRATEGIES = discover_strategies()
+
+# A single-symbol run may put its whole capital into the one position
+SINGLE_SYMBOL_DEFAULTS = {"max_position_pct": 1.0}
+
+# Version of the simulation's results, part of every params hash: bump it when
+# the engine changes what a run produces, so older registered runs are not served
+ENGINE_VERSION = 2
+
+# Unix epoch as a day number, for storing dates as int32 offsets
+EPOCH = np.datetime64("1970-01-01", "D")
+
+
+class ParameterError(ValueError):
+    """A request parameter that cannot be converted to its setting's type."""
+
+
+# Spellings accepted for boolean parameters, e.g. from query strings
+TRUE_STRINGS = ("true", "1", "yes", "on")
+FALSE_STRINGS = ("false", "0", "no", "off")
+
+
+def coerce_parameter(key, value, default, integer=False):
+    """
+    Convert a request value to the type of its setting: counts to int (a
+    fractional count is an error), other numbers to float, booleans parsed
+    explicitly. Raises ParameterError for anything that does not convert.
+    """
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in TRUE_STRINGS + FALSE_STRINGS:
+            return value.strip().lower() in TRUE_STRINGS
+        raise ParameterError(f"{key} must be true or false, got {value!r}")
+    if isinstance(default, (int, float)):
+        if isinstance(value, bool):
+            raise ParameterError(f"{key} must be a number, got {value!r}")
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ParameterError(f"{key} must be a number, got {value!r}") from None
+        if not np.isfinite(number):
+            raise ParameterError(f"{key} must be finite, got {value!r}")
+        if integer:
+            if not number.is_integer():
+                raise ParameterError(f"{key} must be a whole number, got {value!r}")
+            return int(number)
+        return number
+    if not isinstance(value, type(default)):
+        raise ParameterError(f"{key} must be a {type(default).__name__}, got {value!r}")
+    return value
+
+
+def normalize_parameters(strategy, parameters, single_symbol=False):
+    """
+    Split request parameters into strategy settings and portfolio rules.
+    Unknown keys are dropped and every value, defaults included, is
+    coerced to its setting's type, so equivalent requests hash identically.
+    Raises ParameterError for a value that does not convert.
+    """
+    parameters = parameters or {}
+    strategy_class = STRATEGIES[strategy]
+    strategy_defaults = strategy_class(None).settings
+    portfolio_defaults = dict(portfolio.PORTFOLIO_DEFAULTS)
+    if single_symbol:
+        portfolio_defaults.update(SINGLE_SYMBOL_DEFAULTS)
+
+    def pick(defaults, integers):
+        return {
+            key: coerce_parameter(key, parameters.get(key, default), default, key in integers)
+            for key, default in defaults.items()
+        }
+
+    return (pick(strategy_defaults, strategy_class.integer_settings),
+            pick(portfolio_defaults, portfolio.PORTFOLIO_INTEGER_SETTINGS))
+
+
+def data_fingerprint(engine, symbols, start_date, end_date, intraday=False):
+    """
+    Last bar and bar count in range, so new or corrected data changes the
+    hash. Runs that settle fills on hourly bars also cover the intraday table.
+    """
+    tables = ["historical_stock_prices"] + (["intraday_stock_prices"] if intraday else [])
+    fingerprint = {}
+    with engine.connect() as conn:
+        for table in tables:
+            last_bar, bars = conn.execute(
+                text(f"""
+                    SELECT MAX(timestamp), COUNT(*)
+                    FROM {table}
+                    WHERE symbol = ANY(:symbols)
+                    AND (CAST(:start_date AS timestamp) IS NULL OR timestamp >= CAST(:start_date AS timestamp))
+                    AND (CAST(:end_date AS timestamp) IS NULL OR timestamp < CAST(:end_date AS timestamp) + INTERVAL '1 day')
+                """),
+                {"symbols": list(symbols), "start_date": start_date, "end_date": end_date}
+            ).fetchone()
+            prefix = "" if table == "historical_stock_prices" else "intraday_"
+            fingerprint[f"{prefix}last_bar"] = last_bar.isoformat() if last_bar else None
+            fingerprint[f"{prefix}bars"] = bars
+    return fingerprint
+
+
+def params_hash(strategy, symbols, start_date, end_date, strategy_params, portfolio_params, fingerprint):
+    key = json.dumps({
+        "engine": ENGINE_VERSION,
+        "strategy": strategy,
+        "symbols": sorted(symbols),
+        "start_date": start_date,
+        "end_date": end_date,
+        "strategy_params": strategy_params,
+        "portfolio_params": portfolio_params,
+        "data": fingerprint,
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+# Equity curve blob
+def pack_equity_curve(result):
+    """Compress the run's curves and trade days into a small numpy archive."""
+    dates = result["equity"].index.to_numpy().astype("datetime64[D]")
+    trades = result["trades"]
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        days=(dates - EPOCH).astype(np.int32),
+        equity=result["equity"].to_numpy(),
+        exposure=result["exposure"].to_numpy().astype(np.float32),
+        entry_days=(trades["entry_date"].to_numpy().astype("datetime64[D]") - EPOCH).astype(np.int32),
+        exit_days=(trades["exit_date"].to_numpy().astype("datetime64[D]") - EPOCH).astype(np.int32),
+    )
+    return buffer.getvalue()
+
+
+def unpack_equity_curve(blob):
+    with np.load(io.BytesIO(bytes(blob))) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    for name in ("days", "entry_days", "exit_days"):
+        arrays[name] = EPOCH + arrays[name].astype("timedelta64[D]")
+    return arrays
+
+
+def find_run(engine, run_hash=None, run_id=None):
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("""
+                SELECT id, symbol, symbols, strategy, start_date, end_date, parameters,
+                       metrics, equity_curve, duration_ms, created_at
+                FROM backtest_runs
+                WHERE params_hash = :hash OR id = :id
+                LIMIT 1
+            """),
+            {"hash": run_hash, "id": run_id}
+        ).mappings().fetchone()
+    return dict(row) if row else None
+
+
+def store_run(engine, run_hash, strategy, symbols, single_symbol, start_date, end_date,
+              parameters, result, duration_ms):
+    """
+    Register a run and COPY its closed trades in one transaction, so a run is
+    never visible without its trades. Returns the new run id, or None if it
+    was already there.
+    """
+    with engine.begin() as conn:
+        run_id = conn.execute(
+            text("""
+                INSERT INTO backtest_runs
+                    (params_hash, symbol, symbols, strategy, start_date, end_date,
+                     parameters, metrics, equity_curve, duration_ms)
+                VALUES
+                    (:hash, :symbol, :symbols, :strategy, :start_date, :end_date,
+                     :parameters, :metrics, :equity_curve, :duration_ms)
+                ON CONFLICT (params_hash) DO NOTHING
+                RETURNING id
+            """),
+            {
+                "hash": run_hash,
+                "symbol": symbols[0] if single_symbol else None,
+                "symbols": list(symbols),
+                "strategy": strategy,
+                "start_date": start_date,
+                "end_date": end_date,
+                "parameters": json.dumps(parameters),
+                "metrics": json.dumps(result["metrics"]),
+                "equity_curve": pack_equity_curve(result),
+                "duration_ms": duration_ms
+            }
+        ).scalar()
+        # A concurrent identical request registered it first, trades included
+        if run_id is not None:
+            save_closed_positions(engine, result["trades"], run_id, conn=conn)
+    return run_id
+
+
+def get_or_run_backtest(engine, strategy, symbols, parameters=None, start_date=None, end_date=None):
+    """
+    Return the registry row for this request, running and storing the
+    backtest first unless an identical run is already registered. The row
+    carries a `cached` flag; None when there is no data for the request.
+    """
+    single_symbol = len(symbols) == 1
+    start_date = pd.Timestamp(start_date).date().isoformat() if start_date else None
+    end_date = pd.Timestamp(end_date).date().isoformat() if end_date else None
+    strategy_params, portfolio_params = normalize_parameters(strategy, parameters, single_symbol)
+    fingerprint = data_fingerprint(engine, symbols, start_date, end_date,
+                                   portfolio_params["intraday_fills"])
+    if not fingerprint["bars"]:
+        return None
+
+    run_hash = params_hash(strategy, symbols, start_date, end_date,
+                           strategy_params, portfolio_params, fingerprint)
+    run = find_run(engine, run_hash=run_hash)
+    if run:
+        logger.info(f"Serving backtest run {run['id']} from the registry")
+        run["cached"] = True
+        return run
+
+    start = time.monotonic()
+    result = portfolio.run_portfolio_backtest(
+        engine, symbols, strategy_params, portfolio_params, start_date, end_date, strategy
+    )
+    if result is None:
+        return None
+    duration_ms = int((time.monotonic() - start) * 1000)
+    logger.info(f"Backtest of {len(symbols)} symbols took {duration_ms / 1000:.2f}s")
+
+    store_run(engine, run_hash, strategy, symbols, single_symbol, start_date, end_date,
+              {**strategy_params, **portfolio_params}, result, duration_ms)
+    run = find_run(engine, run_hash=run_hash)
+    run["cached"] = False
+    return run
+
+
+def run_summary(run):
+    """Registry row in the shape the dashboard's results table reads."""
+    metrics = run["metrics"]
+    parameters = run["parameters"]
+    return {
+        "id": run["id"],
+        "symbol": run["symbol"] or f"{len(run['symbols'])} symbols",
+        "strategy": run["strategy"],
+        "start_date": run["start_date"].isoformat() if run["start_date"] else None,
+        "end_date": run["end_date"].isoformat() if run["end_date"] else None,
+        "parameters": parameters,
+        "initial_capital": parameters.get("initial_capital"),
+        "total_return": metrics["total_return_pct"],
+        "cagr": metrics["cagr_pct"],
+        "max_drawdown": metrics["max_drawdown_pct"],
+        "win_rate": metrics["win_rate_pct"],
+        "total_trades": metrics["trades"],
+        "sharpe_ratio": metrics["sharpe"],
+        "duration_ms": run["duration_ms"],
+        "created_at": run["created_at"].isoformat(),
+        "cached": run.get("cached", True),
+    }
+
+
+def run_curves(run):
+    """Equity curve and trade markers of a registered run."""
+    curve = unpack_equity_curve(run["equity_curve"])
+    equity = curve["equity"]
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+    timestamps = pd.DatetimeIndex(curve["days"]).strftime('%Y-%m-%d')
+    return {
+        "equity_curve": [
+            {"timestamp": ts, "portfolio_value": round(float(value), 2),
+             "drawdown": round(float(dd), 6), "exposure": round(float(exposure), 6)}
+            for ts, value, dd, exposure in zip(timestamps, equity, drawdown, curve["exposure"])
+        ],
+        "signals": sorted(
+            [{"timestamp": ts, "position": 1} for ts in pd.DatetimeIndex(curve["entry_days"]).strftime('%Y-%m-%d')]
+            + [{"timestamp": ts, "position": -1} for ts in pd.DatetimeIndex(curve["exit_days"]).strftime('%Y-%m-%d')],
+            key=lambda s: s["timestamp"]
+        ),
+    }
+
+
+def run_backtest(symbol, strategy, parameters=None):
+    """
+    Backtest a strategy on one symbol through the registry. start_date and
+    end_date may be passed inside parameters, as the dashboard does.
+    """
+    if strategy not in STRATEGIES:
+        return {"error": f"Unknown strategy: {strategy}"}
+    parameters = dict(parameters or {})
+    start_date = parameters.pop("start_date", None)
+    end_date = parameters.pop("end_date", None)
+
+    engine = get_db_connection()
+    try:
+        run = get_or_run_backtest(engine, strategy, [symbol], parameters, start_date, end_date)
+    except ParameterError as e:
+        return {"error": str(e)}
+    if run is None:
+        return {"error": f"No price data for {symbol}"}
+    return {**run_summary(run), "metrics": run["metrics"]}
+
+
+def get_backtest_results(symbol=None, limit=10):
+    """Latest registered runs, optionally for one symbol."""
+    engine = get_db_connection()
+    with engine.connect() as conn:
+        result = conn.execute(
+            text("""
+                SELECT id, symbol, symbols, strategy, start_date, end_date, parameters,
+                       metrics, duration_ms, created_at
+                FROM backtest_runs
+                WHERE CAST(:symbol AS varchar) IS NULL OR symbol = :symbol
+                ORDER BY created_at DESC, id DESC
+                LIMIT :limit
+            """),
+            {"symbol": symbol, "limit": limit}
+        )
+        return [run_summary(dict(row)) for row in result.mappings()]
+
+
+def get_backtest_equity_curve(symbol, start_date, end_date, strategy, parameters, run_id=None):
+    """
+    Equity curve of a registered run, by id or by its request parameters.
+    A request that was never run is run (and registered) now.
+    """
+    engine = get_db_connection()
+    if run_id is not None:
+        run = find_run(engine, run_id=run_id)
+        if run is None:
+            return {"error": f"Backtest run {run_id} not found"}
+    else:
+        if strategy not in STRATEGIES:
+            return {"error": f"Unknown strategy: {strategy}"}
+        try:
+            run = get_or_run_backtest(engine, strategy, [symbol], parameters, start_date, end_date)
+        except ParameterError as e:
+            return {"error": str(e)}
+        if run is None:
+            return {"error": f"No price data for {symbol}"}
+    return {**run_curves(run), "run": run_summary(run), "metrics": run["metrics"]}
+
+
+def get_backtest_trades(run_id, symbol=None):
+    """Closed trades of a registered run, oldest first."""
+    engine = get_db_connection()
+    with engine.connect() as conn:
+        result = conn.execute(
+            text("""
+                SELECT symbol, signal_type, signal_date, entry_date, exit_date, entry_price,
+                       exit_price, stop_loss, target, shares, conditions_met, profit,
+                       profit_pct, exit_reason
+                FROM backtest_closed_positions
+                WHERE run_id = :run_id
+                AND (CAST(:symbol AS varchar) IS NULL OR symbol = :symbol)
+                ORDER BY entry_date, id
+            """),
+            {"run_id": run_id, "symbol": symbol}
+        )
+        return [
+            {key: value.isoformat() if hasattr(value, "isoformat") else value for key, value in row.items()}
+            for row in result.mappings()
+        ]
+
+
+def get_backtest_robustness(run_id, simulations=None, confidence=None, ruin_loss=None, seed=None, engine=None):
+    """Bootstrap and permutation analysis of a registered run's closed trades."""
+    engine = engine or get_db_connection()
+    run = find_run(engine, run_id=run_id)
+    if run is None:
+        return {"error": f"Backtest run {run_id} not found"}
+    with engine.connect() as conn:
+        profits = conn.execute(
+            text("""
+                SELECT profit FROM backtest_closed_positions
+                WHERE run_id = :run_id
+                ORDER BY exit_date, id
+            """),
+            {"run_id": run_id}
+        ).scalars().all()
+    report = robustness.analyze_trades(
+        np.array(profits, dtype=np.float64),
+        run["parameters"]["initial_capital"],
+        simulations, confidence, ruin_loss, seed
+    )
+    if report is None:
+        return {"error": f"Backtest run {run_id} has no closed trades"}
+    return {"run_id": run_id, **report}
+
+
+def run_portfolio_backtest(symbols=None, strategy="momentum_trend_breakout", parameters=None,
+                           start_date=None, end_date=None):
+    """Universe backtest through the registry."""
+    if strategy not in STRATEGIES:
+        return {"error": f"Unknown strategy: {strategy}"}
+    symbols = symbols or load_symbols_config()
+    engine = get_db_connection()
+    try:
+        run = get_or_run_backtest(engine, strategy, symbols, parameters, start_date, end_date)
+    except ParameterError as e:
+        return {"error": str(e)}
+    if run is None:
+        return {"error": "No price data for the requested universe"}
+    return {**run_summary(run), "metrics": run["metrics"], **run_curves(run)}
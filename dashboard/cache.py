@@ -0,0 +1,179 @@
+import json
+import time
+import hashlib
+import logging
+import functools
+import threading
+from collections import OrderedDict, defaultdict
+
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger('dashboard.cache')
+
+# Bumped by the data fetcher whenever new bars land in historical_stock_prices.
+# Every cache key embeds the current generation, so a bump invalidates all
+# cached responses at once without scanning keys.
+GENERATION_KEY = "gpw:cache:generation"
+KEY_PREFIX = "gpw:cache"
+
+# After a Redis failure, stay on the local LRU for this long before retrying
+REDIS_RETRY_SECONDS = 30
+
+
+class LRUCache:
+    """Small thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """
+    Response cache backed by Redis, falling back to an in-process LRU when
+    Redis is unreachable. Values must be JSON serializable.
+    """
+
+    def __init__(self, redis_host, maxsize=512):
+        self.redis = aioredis.Redis(
+            host=redis_host,
+            port=6379,
+            db=0,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5
+        )
+        self.local = LRUCache(maxsize)
+        self.local_generation = 0
+        self.counters = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self._redis_down_until = 0.0
+
+    def _redis_available(self):
+        return time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, error):
+        logger.warning(f"Redis unavailable, using in-process cache: {str(error)}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    async def _generation(self):
+        if self._redis_available():
+            try:
+                generation = int(await self.redis.get(GENERATION_KEY) or 0)
+                if generation != self.local_generation:
+                    # Data changed while we were on the fallback path
+                    self.local.clear()
+                    self.local_generation = generation
+                return generation
+            except redis.RedisError as e:
+                self._mark_redis_down(e)
+        return self.local_generation
+
+    async def make_key(self, namespace, params):
+        digest = hashlib.sha1(
+            json.dumps(params, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        return f"{KEY_PREFIX}:{namespace}:{await self._generation()}:{digest}"
+
+    async def get(self, namespace, params):
+        key = await self.make_key(namespace, params)
+        value = None
+        if self._redis_available():
+            try:
+                raw = await self.redis.get(key)
+                value = json.loads(raw) if raw is not None else None
+            except redis.RedisError as e:
+                self._mark_redis_down(e)
+                value = self.local.get(key)
+        else:
+            value = self.local.get(key)
+
+        self.counters[namespace]["hits" if value is not None else "misses"] += 1
+        return value
+
+    async def set(self, namespace, params, value, ttl):
+        key = await self.make_key(namespace, params)
+        if self._redis_available():
+            try:
+                await self.redis.set(key, json.dumps(value, default=str), ex=ttl)
+                return
+            except redis.RedisError as e:
+                self._mark_redis_down(e)
+        self.local.set(key, value, ttl)
+
+    async def invalidate(self):
+        """Drop every cached response, e.g. after new bars were written."""
+        self.local.clear()
+        self.local_generation += 1
+        if self._redis_available():
+            try:
+                self.local_generation = int(await self.redis.incr(GENERATION_KEY))
+            except redis.RedisError as e:
+                self._mark_redis_down(e)
+
+    def stats(self):
+        namespaces = {}
+        for namespace, counter in self.counters.items():
+            total = counter["hits"] + counter["misses"]
+            namespaces[namespace] = {
+                **counter,
+                "hit_rate": round(counter["hits"] / total, 4) if total else None
+            }
+        return {
+            "backend": "redis" if self._redis_available() else "local",
+            "generation": self.local_generation,
+            "local_entries": len(self.local),
+            "namespaces": namespaces
+        }
+
+    def cached(self, namespace, ttl, bypass_param=None):
+        """
+        Cache the JSON result of an async endpoint under its call parameters.
+        Responses that are not plain dicts (e.g. a 404 JSONResponse) or that
+        carry an "error" key are never cached. When bypass_param is given and
+        true in the call, the cache is skipped and refreshed.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                params = dict(kwargs)
+                bypass = bool(bypass_param and params.pop(bypass_param, False))
+
+                if not bypass:
+                    value = await self.get(namespace, params)
+                    if value is not None:
+                        return value
+
+                result = await func(*args, **kwargs)
+                if isinstance(result, dict) and "error" not in result:
+                    await self.set(namespace, params, result, ttl)
+                return result
+            return wrapper
+        return decorator
+
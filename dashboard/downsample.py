@@ -0,0 +1,62 @@
+import numpy as np
+
+INTERVALS = ("day", "week", "month")
+
+# Below this a chart is not worth reducing; LTTB needs at least 3 buckets
+MIN_POINTS = 3
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: pick `threshold` point indices that keep
+    the visual shape of the (x, y) line.
+
+    The first and last points are always kept. The remaining points are split
+    into threshold - 2 buckets, and each bucket keeps the point forming the
+    largest triangle with the previously kept point and the next bucket's
+    average. The loop runs once per output point; the work within a bucket is
+    vectorized.
+    """
+    n = len(x)
+    if threshold >= n or threshold < MIN_POINTS:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket edges over the interior points 1 .. n-2
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+
+    # Average of every bucket, used as the third triangle vertex for the
+    # bucket before it. The final "bucket" is the last point itself.
+    counts = np.diff(edges)
+    avg_x = np.r_[np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts, x[-1]]
+    avg_y = np.r_[np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts, y[-1]]
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        bx, by = x[start:end], y[start:end]
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs(
+            (x[prev] - avg_x[i + 1]) * (by - y[prev])
+            - (x[prev] - bx) * (avg_y[i + 1] - y[prev])
+        )
+        prev = start + int(np.argmax(area))
+        selected[i + 1] = prev
+
+    return selected
+
+
+def downsample(df, max_points, value_column="close"):
+    """Reduce a bar frame to at most max_points rows with LTTB on value_column."""
+    if not max_points or len(df) <= max_points:
+        return df
+
+    x = df["timestamp"].to_numpy(dtype="datetime64[s]").astype(np.float64)
+    y = df[value_column].to_numpy(dtype=np.float64)
+    indices = lttb_indices(x, y, max(int(max_points), MIN_POINTS))
+    return df.iloc[indices].reset_index(drop=True)
@@ -0,0 +1,103 @@
+import json
+import asyncio
+import logging
+
+import asyncpg
+
+logger = logging.getLogger('dashboard.events')
+
+# Postgres channel fed by the alerts/system_health triggers and the data fetcher
+EVENTS_CHANNEL = "dashboard_events"
+
+# Per-client buffer; a client that falls this far behind starts losing events
+SUBSCRIBER_QUEUE_SIZE = 100
+RECONNECT_DELAY_SECONDS = 5
+LIVENESS_CHECK_SECONDS = 30
+
+
+class EventBroadcaster:
+    """
+    Fan out Postgres NOTIFY events to every connected dashboard client.
+
+    A single LISTEN connection serves the whole process, however many
+    browsers are subscribed. Each subscriber gets its own asyncio queue.
+    """
+
+    def __init__(self, dsn, channel=EVENTS_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self.subscribers = set()
+        self.callbacks = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._listen_forever())
+        logger.info(f"Listening for dashboard events on channel {self.channel}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def on_event(self, callback):
+        """Register a callback(event), plain or async, run for every event."""
+        self.callbacks.append(callback)
+        return callback
+
+    def _publish(self, event):
+        for callback in self.callbacks:
+            try:
+                result = callback(event)
+                if asyncio.iscoroutine(result):
+                    asyncio.create_task(result)
+            except Exception as e:
+                logger.error(f"Error in event callback: {str(e)}")
+
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Dropping event for a slow dashboard client")
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed event payload: {payload[:200]}")
+            return
+        self._publish(event)
+
+    async def _listen_forever(self):
+        while True:
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                try:
+                    await conn.add_listener(self.channel, self._on_notify)
+                    # Notifications arrive on their own; only check the
+                    # connection is still alive so we can reconnect.
+                    while True:
+                        await asyncio.sleep(LIVENESS_CHECK_SECONDS)
+                        await conn.execute("SELECT 1")
+                finally:
+                    await conn.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event listener failed, reconnecting: {str(e)}")
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+
+def format_sse(event):
+    """Serialize an event as a Server-Sent Events message."""
+    return f"event: {event.get('type', 'message')}\ndata: {json.dumps(event.get('data'), default=str)}\n\n"
@@ -1,14 +1,22 @@
 import os
 import json
+import asyncio
 import logging
 from fastapi import FastAPI, Request, HTTPException, Form
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse, RedirectResponse
-from sqlalchemy import create_engine, text
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
 from datetime import datetime, timedelta
 import pandas as pd
-import requests
+import httpx
+from cache import ResponseCache
+from events import EventBroadcaster, format_sse
+import payloads
+import downsample
+from indicators import indicator, indicator_cache, bar_key
 
 # Configure logging
 logging.basicConfig(
@@ -23,22 +31,80 @@ app = FastAPI(title="GPW Alert System Dashboard")
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Compress JSON responses; endpoints that encode their own body (and SSE) are skipped
+app.add_middleware(GZipMiddleware, minimum_size=payloads.MIN_COMPRESS_SIZE)
+
+# Response cache for read-mostly API endpoints. Bars change once per trading
+# day and the data fetcher bumps the cache generation after every ingest, so
+# the TTLs are only a safety net.
+response_cache = ResponseCache(os.environ.get('REDIS_HOST', 'redis'))
+STOCK_CACHE_TTL = 6 * 3600
+SYMBOLS_CACHE_TTL = 6 * 3600
+SCAN_CACHE_TTL = 3600
+# Rankings land after the ingest that invalidates the cache, so keep them briefly
+RANKING_CACHE_TTL = 300
+
 # Database connection
-def get_db_connection():
+def get_connection_string(driver="postgresql"):
     db_host = os.environ.get('DB_HOST', 'localhost')
     db_user = os.environ.get('DB_USER', 'user')
     db_password = os.environ.get('DB_PASSWORD', 'password')
     db_name = os.environ.get('DB_NAME', 'stocks')
     
-    connection_string = f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
-    return create_engine(connection_string)
+    return f"{driver}://{db_user}:{db_password}@{db_host}/{db_name}"
+
+# One async engine (and connection pool) shared by every request, so a slow
+# query only holds its own connection instead of blocking the event loop.
+engine = create_async_engine(
+    get_connection_string("postgresql+asyncpg"),
+    pool_size=int(os.environ.get('DB_POOL_SIZE', 10)),
+    max_overflow=int(os.environ.get('DB_POOL_OVERFLOW', 10)),
+    pool_pre_ping=True
+)
+
+# Shared keep-alive client for calls to the backtester and strategy analyzer
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(10.0),
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=10)
+)
+
+async def read_sql(query, params=None):
+    """Run a query on the shared pool and return the rows as a DataFrame."""
+    async with engine.connect() as conn:
+        result = await conn.execute(text(query), params or {})
+        return pd.DataFrame.from_records(
+            result.fetchall(),
+            columns=list(result.keys()),
+            coerce_float=True
+        )
+
+# Live events (new alerts, health changes, new bars) pushed to browsers over SSE.
+# A single LISTEN connection serves every open dashboard.
+broadcaster = EventBroadcaster(get_connection_string())
+SSE_KEEPALIVE_SECONDS = 15
+
+@broadcaster.on_event
+async def invalidate_cache_on_new_bars(event):
+    # The fetcher already bumps the Redis generation; this also covers the
+    # in-process fallback cache when Redis is down.
+    if event.get("type") == "bars":
+        await response_cache.invalidate()
+
+@app.on_event("startup")
+async def start_event_listener():
+    broadcaster.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await broadcaster.stop()
+    await http_client.aclose()
+    await engine.dispose()
 
 # Get list of available symbols
-def get_symbols():
-    engine = get_db_connection()
+async def get_symbols():
     try:
-        with engine.connect() as conn:
-            result = conn.execute(
+        async with engine.connect() as conn:
+            result = await conn.execute(
                 text("""
                     SELECT DISTINCT symbol
                     FROM historical_stock_prices
@@ -68,65 +134,109 @@ def get_symbols():
         # Fall back to hardcoded symbols in case of error
         return ["PKO", "PKN", "PZU", "PEO", "KGH", "LPP"]
 
+# Weekly and monthly bars, maintained from the daily ones by a database
+# trigger as new bars are merged
+PERIOD_TABLES = {
+    "week": "weekly_bars",
+    "month": "monthly_bars",
+}
+
 # Get stock data for a symbol
-def get_stock_data(symbol, days=30):
-    engine = get_db_connection()
+async def get_stock_data(symbol, days=30, interval="day"):
     try:
-        with engine.connect() as conn:
-            query = f"""
+        if interval == "day":
+            query = """
                 SELECT timestamp, open, high, low, close, volume
                 FROM historical_stock_prices
                 WHERE symbol = :symbol
-                AND timestamp > NOW() - INTERVAL '{days} days'
+                AND timestamp > NOW() - make_interval(days => :days)
                 ORDER BY timestamp
             """
-            
-            df = pd.read_sql(text(query), conn, params={"symbol": symbol})
-            
-            if df.empty:
-                logger.warning(f"No data found for symbol {symbol} for the last {days} days")
+        else:
+            # Periods are labelled with their first trading day; last_day
+            # moves on while the current period is still open
+            query = f"""
+                SELECT first_day AS timestamp, open, high, low, close, volume, last_day
+                FROM {PERIOD_TABLES[interval]}
+                WHERE symbol = :symbol
+                AND last_day > NOW() - make_interval(days => :days)
+                ORDER BY timestamp
+            """
+        
+        df = await read_sql(query, {"symbol": symbol, "days": days})
+        
+        if df.empty:
+            logger.warning(f"No data found for symbol {symbol} for the last {days} days")
+        else:
+            logger.info(f"Retrieved {len(df)} data points for {symbol}")
+        
+        # Moving averages from the shared indicator cache
+        if len(df) > 0:
+            if interval == "day":
+                bars_key = bar_key(df['timestamp'])
             else:
-                logger.info(f"Retrieved {len(df)} data points for {symbol}")
-            
-            # Calculate moving averages
-            if len(df) > 0:
-                df['ma50'] = df['close'].rolling(window=min(50, len(df))).mean()
-                df['ma100'] = df['close'].rolling(window=min(100, len(df))).mean()
-            
-            return df
+                bars_key = bar_key(df['last_day']) + (interval,)
+            for column, window in (('ma50', 50), ('ma100', 100)):
+                df[column] = indicator(df, "sma", "close", min(window, len(df)), symbol=symbol, bars_key=bars_key)
+        
+        return df
     except Exception as e:
         logger.error(f"Error getting stock data for {symbol}: {str(e)}")
         return pd.DataFrame()
 
+# Keyset page of alerts, newest first. Rows are addressed by (created_at, id)
+# so every page is an index range scan, however much history has accumulated.
+ALERT_COLUMNS = "id, symbol, strategy, signal_type, price::float AS price, created_at, sent_at, status"
+
+async def fetch_alerts_page(days, limit, cursor=None, strategy=None, extra_columns=""):
+    # WATCH rows replaced by a newer WATCH for the same symbol are history only
+    conditions = ["created_at > NOW() - make_interval(days => :days)", "status <> 'SUPERSEDED'"]
+    # Fetch one extra row to learn whether another page exists
+    params = {"days": days, "limit": limit + 1}
+    if strategy is not None:
+        conditions.append("strategy = :strategy")
+        params["strategy"] = strategy
+    if cursor:
+        cursor_created_at, cursor_id = payloads.decode_cursor(cursor)
+        conditions.append("(created_at, id) < (:cursor_created_at, :cursor_id)")
+        params.update({"cursor_created_at": cursor_created_at, "cursor_id": cursor_id})
+
+    query = f"""
+        SELECT {ALERT_COLUMNS}{extra_columns}
+        FROM alerts
+        WHERE {' AND '.join(conditions)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT :limit
+    """
+    async with engine.connect() as conn:
+        result = await conn.execute(text(query), params)
+        rows = [dict(row) for row in result.mappings()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = payloads.encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return rows, next_cursor
+
 # Get recent alerts
-def get_recent_alerts(days=7):
-    engine = get_db_connection()
+async def get_recent_alerts(days=7, limit=payloads.DEFAULT_PAGE_SIZE, cursor=None):
     try:
-        with engine.connect() as conn:
-            query = """
-                SELECT id, symbol, strategy, signal_type, price, 
-                       volume, ma50, ma100, created_at, sent_at, status
-                FROM alerts
-                WHERE created_at > NOW() - INTERVAL :days DAY
-                ORDER BY created_at DESC
-            """
-            
-            df = pd.read_sql(text(query), conn, params={"days": days})
-            logger.info(f"Retrieved {len(df)} recent alerts")
-            return df.to_dict(orient='records')
+        alerts, next_cursor = await fetch_alerts_page(days, limit, cursor)
+        logger.info(f"Retrieved {len(alerts)} recent alerts")
+        return alerts, next_cursor
     except Exception as e:
         logger.error(f"Error getting alerts: {str(e)}")
-        return []
+        return [], None
 
 # Get backtest results
-def get_backtest_results(symbol=None, limit=10):
+async def get_backtest_results(symbol=None, limit=10):
     try:
         url = f"http://backtester:8004/results?limit={limit}"
         if symbol:
             url += f"&symbol={symbol}"
             
         logger.info(f"Requesting backtest results from: {url}")
-        response = requests.get(url, timeout=10)
+        response = await http_client.get(url, timeout=10)
         
         if response.status_code == 200:
             results = response.json().get('results', [])
@@ -140,31 +250,27 @@ def get_backtest_results(symbol=None, limit=10):
         return []
 
 # Get system health data
-def get_system_health():
-    engine = get_db_connection()
+async def get_system_health():
     try:
-        with engine.connect() as conn:
-            query = """
-                SELECT component, status, last_check, details
-                FROM system_health
-                WHERE last_check > NOW() - INTERVAL '1 day'
-                ORDER BY last_check DESC
-            """
-            
-            df = pd.read_sql(text(query), conn)
-            
-            # Get latest status for each component
-            components = {}
-            for _, row in df.iterrows():
-                if row['component'] not in components:
-                    components[row['component']] = {
-                        'status': row['status'],
-                        'last_check': row['last_check'],
-                        'details': row['details']
-                    }
-            
-            logger.info(f"Retrieved health status for {len(components)} components")
-            return list(components.items())
+        # component_status holds one row per component, maintained by a
+        # trigger on system_health, so this never touches the raw history
+        query = """
+            SELECT component, status, last_check, details, duration_ms,
+                   last_ok_at, consecutive_errors
+            FROM component_status
+            WHERE last_check > NOW() - INTERVAL '1 day'
+            ORDER BY component
+        """
+        
+        async with engine.connect() as conn:
+            result = await conn.execute(text(query))
+            components = [
+                (row.pop("component"), row)
+                for row in (dict(r) for r in result.mappings())
+            ]
+        
+        logger.info(f"Retrieved health status for {len(components)} components")
+        return components
     except Exception as e:
         logger.error(f"Error getting system health: {str(e)}")
         return []
@@ -172,7 +278,7 @@ def get_system_health():
 # Routes
 @app.get("/")
 async def home(request: Request):
-    symbols = get_symbols()
+    symbols = await get_symbols()
     logger.info(f"Rendering home page with {len(symbols)} symbols")
     return templates.TemplateResponse(
         "index.html", 
@@ -181,7 +287,7 @@ async def home(request: Request):
 
 @app.get("/uptrends")
 async def uptrends_page(request: Request):
-    symbols = get_symbols()
+    symbols = await get_symbols()
     logger.info(f"Rendering uptrends page with {len(symbols)} symbols")
     return templates.TemplateResponse(
         "uptrends.html",
@@ -190,7 +296,7 @@ async def uptrends_page(request: Request):
 
 @app.get("/backtest")
 async def backtest_page(request: Request):
-    symbols = get_symbols()
+    symbols = await get_symbols()
     logger.info(f"Rendering backtest page with {len(symbols)} symbols")
     return templates.TemplateResponse(
         "backtest.html", 
@@ -201,37 +307,34 @@ async def backtest_page(request: Request):
 async def run_backtest(
     symbol: str = Form(...),
     strategy: str = Form(...),
-    short_ma: int = Form(50),
-    long_ma: int = Form(100),
+    atr_multiplier: float = Form(1.5),
+    risk_reward_ratio: float = Form(3.0),
     initial_capital: float = Form(10000.0),
     start_date: str = Form(...),
     end_date: str = Form(...)
 ):
     try:
-        # Create request to backtester service
+        # Queue the run on the backtester; the page follows its progress over SSE
         data = {
-            "symbol": symbol,
+            "kind": "backtest",
+            "symbols": [symbol],
             "strategy": strategy,
+            "start_date": start_date,
+            "end_date": end_date,
             "parameters": {
-                "short_ma": short_ma,
-                "long_ma": long_ma,
-                "initial_capital": initial_capital,
-                "start_date": start_date,
-                "end_date": end_date
+                "atr_multiplier": atr_multiplier,
+                "risk_reward_ratio": risk_reward_ratio,
+                "initial_capital": initial_capital
             }
         }
-        
-        logger.info(f"Running backtest for {symbol} from {start_date} to {end_date}")
-        response = requests.post(
-            "http://backtester:8004/backtest",
-            json=data,
-            timeout=60
-        )
-        
-        if response.status_code == 200:
-            logger.info(f"Backtest completed successfully for {symbol}")
-            # Redirect to backtest results page
-            return RedirectResponse(url="/backtest?success=true", status_code=303)
+
+        logger.info(f"Queueing backtest for {symbol} from {start_date} to {end_date}")
+        response = await http_client.post("http://backtester:8004/jobs", json=data)
+
+        if response.status_code == 202:
+            job_id = response.json()["job_id"]
+            logger.info(f"Backtest job {job_id} queued for {symbol}")
+            return RedirectResponse(url=f"/backtest?job_id={job_id}&symbol={symbol}", status_code=303)
         else:
             error = response.json().get("detail", "Unknown error")
             logger.error(f"Backtest failed: {error}")
@@ -247,46 +350,130 @@ async def run_backtest(
             status_code=303
         )
 
+@app.get("/api/backtest/jobs/{job_id}/events")
+async def api_backtest_job_events(job_id: str):
+    """Relay a backtest job's progress stream from the backtester"""
+    async def event_stream():
+        try:
+            async with http_client.stream(
+                "GET",
+                f"http://backtester:8004/jobs/{job_id}/events",
+                timeout=httpx.Timeout(10.0, read=None)
+            ) as response:
+                if response.status_code != 200:
+                    yield format_sse({"type": "error", "data": {"error": f"Job {job_id} not found"}})
+                    return
+                async for chunk in response.aiter_raw():
+                    yield chunk
+        except Exception as e:
+            logger.error(f"Error relaying backtest job {job_id} events: {str(e)}")
+            yield format_sse({"type": "error", "data": {"error": str(e)}})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.delete("/api/backtest/jobs/{job_id}")
+async def api_cancel_backtest_job(job_id: str):
+    try:
+        response = await http_client.delete(f"http://backtester:8004/jobs/{job_id}")
+        return JSONResponse(status_code=response.status_code, content=response.json())
+    except Exception as e:
+        logger.error(f"Error cancelling backtest job {job_id}: {str(e)}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
 @app.get("/api/symbols")
+@response_cache.cached("symbols", ttl=SYMBOLS_CACHE_TTL)
 async def api_symbols():
-    symbols = get_symbols()
+    symbols = await get_symbols()
     return {"symbols": symbols}
 
+# Stock bars as parallel columns, cached per (symbol, days, interval, max_points).
+# Weekly and monthly bars are read from their own tables, with moving averages
+# over the period bars.
+@response_cache.cached("stock", ttl=STOCK_CACHE_TTL)
+async def load_stock_payload(symbol, days, interval="day", max_points=None):
+    df = await get_stock_data(symbol, days, interval)
+    if df.empty:
+        return None
+    # A new daily bar changes the last weekly bar's values without changing
+    # its label, so period bars are versioned by the last day they cover
+    last_column = "timestamp" if interval == "day" else "last_day"
+    last_timestamp = df[last_column].iloc[-1].isoformat()
+    df = downsample.downsample(df, max_points)
+    return {
+        "count": len(df),
+        "last_timestamp": last_timestamp,
+        "columns": payloads.stock_columns(df)
+    }
+
 @app.get("/api/stock/{symbol}")
-async def api_stock_data(symbol: str, days: int = 30):
-    df = get_stock_data(symbol, days)
+async def api_stock_data(request: Request, symbol: str, days: int = 30, format: str = "rows",
+                         interval: str = "day", max_points: int = None):
+    """
+    Price bars for a symbol. format=rows returns one object per bar,
+    format=columnar parallel arrays per field and format=arrow an Arrow IPC
+    stream. interval=week|month returns the stored weekly or monthly bars and
+    max_points caps the number of bars returned (LTTB on the close).
+    Responses carry an ETag keyed on the last bar.
+    """
+    if format not in payloads.STOCK_FORMATS:
+        return JSONResponse(
+            status_code=400,
+            content={"message": f"Unknown format {format}, expected one of {', '.join(payloads.STOCK_FORMATS)}"}
+        )
+    if interval not in downsample.INTERVALS:
+        return JSONResponse(
+            status_code=400,
+            content={"message": f"Unknown interval {interval}, expected one of {', '.join(downsample.INTERVALS)}"}
+        )
+    if max_points is not None and max_points < downsample.MIN_POINTS:
+        return JSONResponse(
+            status_code=400,
+            content={"message": f"max_points must be at least {downsample.MIN_POINTS}"}
+        )
+    if format == "arrow" and payloads.pa is None:
+        return JSONResponse(status_code=406, content={"message": "Arrow format is not available"})
+
+    # Keyword arguments: the cache key is built from them
+    payload = await load_stock_payload(symbol=symbol, days=days, interval=interval, max_points=max_points)
     
-    if df.empty:
+    if payload is None:
         logger.warning(f"No data found for symbol {symbol}")
         return JSONResponse(
             status_code=404,
             content={"message": f"No data found for symbol {symbol}"}
         )
+
+    etag = payloads.make_etag(
+        symbol, days, format, interval, max_points, payload["last_timestamp"], payload["count"]
+    )
+    # Browsers may store the response but must revalidate; unchanged data costs a 304
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if payloads.etag_matches(etag, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+
+    columns = payload["columns"]
+    if format == "arrow":
+        body = payloads.columns_to_arrow(columns)
+        media_type = payloads.ARROW_MEDIA_TYPE
+    else:
+        data = columns if format == "columnar" else payloads.columns_to_rows(columns)
+        body = payloads.dumps({"symbol": symbol, "format": format, "interval": interval, "data": data})
+        media_type = "application/json"
+
+    body, encoding = payloads.compress_body(body, request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
     
-    # Convert to records for JSON serialization
-    result = {
-        "symbol": symbol,
-        "data": []
-    }
-    
-    for _, row in df.iterrows():
-        result["data"].append({
-            "timestamp": row["timestamp"].isoformat(),
-            "open": float(row["open"]),
-            "high": float(row["high"]),
-            "low": float(row["low"]),
-            "close": float(row["close"]),
-            "volume": int(row["volume"]),
-            "ma50": float(row["ma50"]) if not pd.isna(row["ma50"]) else None,
-            "ma100": float(row["ma100"]) if not pd.isna(row["ma100"]) else None
-        })
-    
-    return result
+    return Response(content=body, media_type=media_type, headers=headers)
 
 @app.get("/strategies")
 async def strategies_page(request: Request):
     """Strategy Dashboard page"""
-    symbols = get_symbols()
+    symbols = await get_symbols()
     logger.info(f"Rendering strategies page with {len(symbols)} symbols")
     return templates.TemplateResponse(
         "strategies.html",
@@ -316,55 +503,63 @@ async def api_strategies():
         return {"strategies": [], "error": str(e)}
 
 @app.get("/api/strategy/matches")
+@response_cache.cached("strategy_matches", ttl=SCAN_CACHE_TTL)
 async def api_strategy_matches(strategy_name: str = None):
     """Get stocks that match or nearly match strategy criteria"""
-    engine = get_db_connection()
-    symbols = get_symbols()
+    symbols = await get_symbols()
     results = []
 
     try:
         if strategy_name == "moving_average":
-            # Get stocks where MA50 and MA100 are close to crossing
-            for symbol in symbols:
-                query = """
-                    SELECT symbol, timestamp, close,
-                           ma50, ma100, volume,
-                           ABS(ma50 - ma100) as diff,
-                           (ma50 > ma100) as is_bullish
-                    FROM (
-                        SELECT symbol, timestamp, close,
-                               AVG(close) OVER (ORDER BY timestamp ROWS BETWEEN 49 PRECEDING AND CURRENT ROW) as ma50,
-                               AVG(close) OVER (ORDER BY timestamp ROWS BETWEEN 99 PRECEDING AND CURRENT ROW) as ma100,
-                               volume
-                        FROM historical_stock_prices
-                        WHERE symbol = :symbol
-                        ORDER BY timestamp DESC
-                    ) as subquery
-                    WHERE ma50 IS NOT NULL AND ma100 IS NOT NULL
+            # Get stocks where MA50 and MA100 are close to crossing: the last
+            # 100 bars of every symbol in one query, right-aligned so the last
+            # row is each symbol's latest bar
+            query = """
+                SELECT s.symbol, p.timestamp, p.close::float8 AS close, p.volume
+                FROM unnest(CAST(:symbols AS varchar[])) AS s(symbol)
+                CROSS JOIN LATERAL (
+                    SELECT timestamp, close, volume
+                    FROM historical_stock_prices h
+                    WHERE h.symbol = s.symbol
                     ORDER BY timestamp DESC
-                    LIMIT 1
-                """
-                try:
-                    df = pd.read_sql(text(query), engine, params={"symbol": symbol})
-                    if not df.empty:
-                        record = df.iloc[0].to_dict()
-                        # Check if MAs are within 2% of each other
-                        if record['ma50'] and record['ma100']:
-                            diff_pct = abs(record['diff'] / record['ma100']) * 100
-                            if diff_pct < 2.0:  # Within 2%
-                                results.append({
-                                    "symbol": symbol,
-                                    "price": float(record['close']),
-                                    "ma50": float(record['ma50']),
-                                    "ma100": float(record['ma100']),
-                                    "diff_pct": float(diff_pct),
-                                    "is_bullish": bool(record['is_bullish']),
-                                    "volume": int(record['volume']),
-                                    "match_level": "near" if diff_pct > 0.5 else "match",
-                                    "timestamp": record['timestamp'].isoformat()
-                                })
-                except Exception as e:
-                    logger.error(f"Error processing {symbol}: {str(e)}")
+                    LIMIT 100
+                ) p
+            """
+            df = await read_sql(query, {"symbols": list(symbols)})
+            if not df.empty:
+                df = df.sort_values(["symbol", "timestamp"])
+                df["row"] = -df.groupby("symbol").cumcount(ascending=False)
+                bars = {
+                    field: df.pivot(index="row", columns="symbol", values=field)
+                    for field in ("timestamp", "close", "volume")
+                }
+                panel_symbols = tuple(bars["close"].columns)
+                bars_key = bar_key(bars["timestamp"])
+                # Averages over the bars available until a symbol has 50 / 100,
+                # like AVG() OVER (ROWS n PRECEDING)
+                ma50, ma100 = (
+                    indicator(bars, "sma", "close", window, 1, symbol=panel_symbols, bars_key=bars_key)[-1]
+                    for window in (50, 100)
+                )
+                columns = {symbol: i for i, symbol in enumerate(panel_symbols)}
+                for symbol in symbols:
+                    i = columns.get(symbol)
+                    if i is None or not ma50[i] or not ma100[i]:
+                        continue
+                    # Check if MAs are within 2% of each other
+                    diff_pct = abs((ma50[i] - ma100[i]) / ma100[i]) * 100
+                    if diff_pct < 2.0:  # Within 2%
+                        results.append({
+                            "symbol": symbol,
+                            "price": float(bars["close"].iloc[-1, i]),
+                            "ma50": float(ma50[i]),
+                            "ma100": float(ma100[i]),
+                            "diff_pct": float(diff_pct),
+                            "is_bullish": bool(ma50[i] > ma100[i]),
+                            "volume": int(bars["volume"].iloc[-1, i]),
+                            "match_level": "near" if diff_pct > 0.5 else "match",
+                            "timestamp": bars["timestamp"].iloc[-1, i].isoformat()
+                        })
 
         elif strategy_name == "consecutive_gains":
             # Get stocks with recent consecutive gains
@@ -381,7 +576,7 @@ async def api_strategy_matches(strategy_name: str = None):
                     LIMIT 5
                 """
                 try:
-                    df = pd.read_sql(text(query), engine, params={"symbol": symbol})
+                    df = await read_sql(query, {"symbol": symbol})
                     if len(df) >= 5:
                         # Sort by timestamp ascending for calculation
                         df = df.sort_values('timestamp')
@@ -415,35 +610,51 @@ async def api_strategy_matches(strategy_name: str = None):
         logger.error(f"Error finding strategy matches: {str(e)}")
         return {"matches": [], "error": str(e)}
 
+def validate_page(limit, cursor):
+    """400 response for an out-of-range page size or a malformed cursor, else None."""
+    if not 1 <= limit <= payloads.MAX_PAGE_SIZE:
+        return JSONResponse(
+            status_code=400,
+            content={"message": f"limit must be between 1 and {payloads.MAX_PAGE_SIZE}"}
+        )
+    if cursor:
+        try:
+            payloads.decode_cursor(cursor)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"message": str(e)})
+    return None
+
 @app.get("/api/strategy/signals")
-async def api_strategy_signals(strategy_name: str = None, days: int = 30):
-    """Get historical signals for a specific strategy"""
-    engine = get_db_connection()
+async def api_strategy_signals(strategy_name: str = None, days: int = 30,
+                               limit: int = payloads.DEFAULT_PAGE_SIZE, cursor: str = None):
+    """Get historical signals for a specific strategy, one keyset page at a time"""
+    error = validate_page(limit, cursor)
+    if error:
+        return error
     try:
-        query = """
-            SELECT id, symbol, strategy, signal_type, price,
-                   volume, ma50, ma100, created_at, status
-            FROM alerts
-            WHERE created_at > NOW() - INTERVAL :days DAY
-            AND strategy = :strategy
-            ORDER BY created_at DESC
-        """
-
-        df = pd.read_sql(text(query), engine, params={"days": days, "strategy": strategy_name})
-        logger.info(f"Retrieved {len(df)} signals for strategy {strategy_name}")
-        return {"signals": df.to_dict(orient='records')}
+        # Volume lives in the signal details, not in a column of its own
+        signals, next_cursor = await fetch_alerts_page(
+            days, limit, cursor,
+            strategy=strategy_name,
+            extra_columns=", (details->>'volume')::float AS volume"
+        )
+        logger.info(f"Retrieved {len(signals)} signals for strategy {strategy_name}")
+        return {"signals": signals, "next_cursor": next_cursor}
     except Exception as e:
         logger.error(f"Error getting strategy signals: {str(e)}")
-        return {"signals": [], "error": str(e)}
+        return {"signals": [], "next_cursor": None, "error": str(e)}
 
 @app.post("/api/strategy/run")
 async def run_strategy_check():
     """Trigger strategy analysis on-demand"""
     try:
-        response = requests.get("http://strategy_analyzer:8002/analyze", timeout=60)
+        response = await http_client.get("http://strategy_analyzer:8002/analyze", timeout=60)
         if response.status_code == 200:
             logger.info("Strategy analysis triggered successfully")
             return {"status": "success", "message": "Strategy analysis started. Check back shortly for results."}
+        elif response.status_code == 409:
+            logger.info("Strategy analysis already in progress, manual trigger skipped")
+            return {"status": "busy", "message": "Strategy analysis is already running. Check back shortly for results."}
         else:
             logger.error(f"Strategy analyzer failed: {response.status_code}")
             return {"status": "error", "message": f"Failed to start analysis: HTTP {response.status_code}"}
@@ -452,22 +663,25 @@ async def run_strategy_check():
         return {"status": "error", "message": f"Error: {str(e)}"}
 
 @app.get("/api/alerts")
-async def api_alerts(days: int = 7):
-    alerts = get_recent_alerts(days)
-    return {"alerts": alerts}
+async def api_alerts(days: int = 7, limit: int = payloads.DEFAULT_PAGE_SIZE, cursor: str = None):
+    error = validate_page(limit, cursor)
+    if error:
+        return error
+    alerts, next_cursor = await get_recent_alerts(days, limit, cursor)
+    return {"alerts": alerts, "next_cursor": next_cursor}
 
 @app.get("/api/uptrends")
+@response_cache.cached("uptrends", ttl=SCAN_CACHE_TTL, bypass_param="refresh")
 async def api_uptrends(minGain: float = 1.0, minVolume: int = 10000, refresh: bool = False):
     """Get stocks in an uptrend (gaining for 5 consecutive days)"""
-    engine = get_db_connection()
     try:
         # Get all available symbols
-        symbols = get_symbols()
+        symbols = await get_symbols()
         uptrend_stocks = []
 
         for symbol in symbols:
             # Get last 10 days of data
-            query = f"""
+            query = """
                 SELECT timestamp, close, volume
                 FROM historical_stock_prices
                 WHERE symbol = :symbol
@@ -475,7 +689,7 @@ async def api_uptrends(minGain: float = 1.0, minVolume: int = 10000, refresh: bo
                 LIMIT 10
             """
 
-            df = pd.read_sql(text(query), engine, params={"symbol": symbol})
+            df = await read_sql(query, {"symbol": symbol})
 
             if len(df) >= 6:  # Need at least 6 days (5 days for returns + 1 base day)
                 # Sort by timestamp ascending for calculation
@@ -513,22 +727,78 @@ async def api_uptrends(minGain: float = 1.0, minVolume: int = 10000, refresh: bo
         logger.error(f"Error getting uptrend stocks: {str(e)}")
         return {"stocks": [], "error": str(e)}
 
+@app.get("/api/rankings")
+@response_cache.cached("rankings", ttl=RANKING_CACHE_TTL)
+async def api_rankings(sector: str = None, minPercentile: float = 0, limit: int = 50):
+    """Latest relative-strength ranking of the universe, strongest first, and the sector table"""
+    if not 1 <= limit <= payloads.MAX_PAGE_SIZE:
+        return JSONResponse(
+            status_code=400,
+            content={"message": f"limit must be between 1 and {payloads.MAX_PAGE_SIZE}"}
+        )
+    try:
+        latest = await read_sql("SELECT MAX(timestamp) AS timestamp FROM symbol_rankings")
+        timestamp = latest["timestamp"].iloc[0]
+        if pd.isna(timestamp):
+            return {"timestamp": None, "stocks": [], "sectors": []}
+
+        stocks = await read_sql("""
+            SELECT symbol, sector, return_pct, rs_wig20, rs_mwig40, rs_percentile,
+                   sector_percentile, sector_momentum, sector_momentum_percentile
+            FROM symbol_rankings
+            WHERE timestamp = :timestamp
+            AND (CAST(:sector AS varchar) IS NULL OR sector = CAST(:sector AS varchar))
+            AND rs_percentile >= :min_percentile
+            ORDER BY rs_percentile DESC, symbol
+            LIMIT :limit
+        """, {"timestamp": timestamp, "sector": sector, "min_percentile": minPercentile, "limit": limit})
+        sectors = await read_sql("""
+            SELECT sector, MAX(sector_momentum) AS momentum,
+                   MAX(sector_momentum_percentile) AS percentile, COUNT(*) AS symbols
+            FROM symbol_rankings
+            WHERE timestamp = :timestamp
+            AND sector IS NOT NULL
+            GROUP BY sector
+            ORDER BY percentile DESC
+        """, {"timestamp": timestamp})
+        # NaN is not valid JSON
+        return {
+            "timestamp": timestamp.isoformat(),
+            "stocks": stocks.astype(object).where(stocks.notna(), None).to_dict("records"),
+            "sectors": sectors.astype(object).where(sectors.notna(), None).to_dict("records")
+        }
+    except Exception as e:
+        logger.error(f"Error getting rankings: {str(e)}")
+        return {"stocks": [], "sectors": [], "error": str(e)}
+
 @app.get("/api/backtests")
 async def api_backtests(symbol: str = None):
-    results = get_backtest_results(symbol)
+    results = await get_backtest_results(symbol)
     return {"results": results}
 
 @app.get("/api/backtest/equity_curve")
-async def api_equity_curve(symbol: str, start_date: str, end_date: str = None,
-                          short_ma: int = 50, long_ma: int = 100, initial_capital: float = 10000.0):
+async def api_equity_curve(symbol: str = None, start_date: str = None, end_date: str = None,
+                          strategy: str = "momentum_trend_breakout", atr_multiplier: float = 1.5,
+                          risk_reward_ratio: float = 3.0, initial_capital: float = 10000.0,
+                          run_id: int = None):
     if not end_date:
         end_date = datetime.now().strftime('%Y-%m-%d')
         
     try:
         logger.info(f"Getting equity curve for {symbol} from {start_date} to {end_date}")
-        response = requests.get(
-            f"http://backtester:8004/equity_curve?symbol={symbol}&start_date={start_date}&end_date={end_date}"
-            f"&short_ma={short_ma}&long_ma={long_ma}&initial_capital={initial_capital}",
+        params = {
+            "symbol": symbol,
+            "start_date": start_date,
+            "end_date": end_date,
+            "strategy": strategy,
+            "atr_multiplier": atr_multiplier,
+            "risk_reward_ratio": risk_reward_ratio,
+            "initial_capital": initial_capital,
+            "run_id": run_id
+        }
+        response = await http_client.get(
+            "http://backtester:8004/equity_curve",
+            params={key: value for key, value in params.items() if value is not None},
             timeout=30
         )
         
@@ -548,9 +818,50 @@ async def api_equity_curve(symbol: str, start_date: str, end_date: str = None,
             content={"error": str(e)}
         )
 
+@app.get("/api/events")
+async def api_events(request: Request):
+    """Server-Sent Events stream of new alerts, health changes and ingested bars"""
+    queue = broadcaster.subscribe()
+
+    async def event_stream():
+        try:
+            # Ask browsers to reconnect after 5s if the stream drops
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                    yield format_sse(event)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/cache/stats")
+async def api_cache_stats():
+    """Hit/miss counters of the response cache"""
+    return response_cache.stats()
+
+@app.get("/api/indicators/cache")
+async def api_indicator_cache_stats():
+    """Hit statistics of the in-process indicator cache"""
+    return indicator_cache.stats()
+
+@app.post("/api/cache/invalidate")
+async def api_cache_invalidate():
+    """Drop all cached API responses"""
+    await response_cache.invalidate()
+    logger.info("Response cache invalidated")
+    return {"status": "OK", "generation": response_cache.local_generation}
+
 @app.get("/api/health")
 async def api_health():
-    health_data = get_system_health()
+    health_data = await get_system_health()
     
     # Overall system status
     overall_status = "OK"
@@ -570,9 +881,8 @@ async def api_health():
 async def healthcheck():
     try:
         # Check database connection
-        engine = get_db_connection()
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
         
         logger.info("Healthcheck passed")
         return {"status": "OK", "timestamp": datetime.now().isoformat()}
@@ -591,31 +901,32 @@ async def healthcheck():
 @app.get("/api/seed_test_data")
 async def seed_test_data():
     try:
-        engine = get_db_connection()
-        with engine.connect() as conn:
-            # Insert some test data for PKO
-            for i in range(100):
-                date = (datetime.now() - timedelta(days=100-i)).strftime('%Y-%m-%d')
-                # Generate some fake price data that looks like a trend
-                base_price = 40.0 + i * 0.1 + (i % 7) * 0.2
-                conn.execute(
-                    text("""
-                        INSERT INTO historical_stock_prices 
-                        (symbol, timestamp, open, high, low, close, volume)
-                        VALUES (:symbol, :timestamp, :open, :high, :low, :close, :volume)
-                        ON CONFLICT (symbol, timestamp) DO NOTHING
-                    """),
-                    {
-                        "symbol": "PKO",
-                        "timestamp": date,
-                        "open": base_price,
-                        "high": base_price + 0.5,
-                        "low": base_price - 0.3,
-                        "close": base_price + 0.1,
-                        "volume": 1000000 + (i * 10000)
-                    }
-                )
-            conn.commit()
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        rows = []
+        # Insert some test data for PKO
+        for i in range(100):
+            # Generate some fake price data that looks like a trend
+            base_price = 40.0 + i * 0.1 + (i % 7) * 0.2
+            rows.append({
+                "symbol": "PKO",
+                "timestamp": today - timedelta(days=100-i),
+                "open": base_price,
+                "high": base_price + 0.5,
+                "low": base_price - 0.3,
+                "close": base_price + 0.1,
+                "volume": 1000000 + (i * 10000)
+            })
+
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("""
+                    INSERT INTO historical_stock_prices 
+                    (symbol, timestamp, open, high, low, close, volume)
+                    VALUES (:symbol, :timestamp, :open, :high, :low, :close, :volume)
+                    ON CONFLICT (symbol, timestamp) DO NOTHING
+                """),
+                rows
+            )
             
         logger.info("Seeded test data for PKO")
         return {"status": "OK", "message": "Test data has been seeded for PKO"}
@@ -0,0 +1,142 @@
+import io
+import base64
+import binascii
+import gzip
+import json
+import hashlib
+from datetime import datetime
+
+import numpy as np
+
+# Optional encoders: Arrow IPC responses and brotli compression are only
+# offered when the packages are installed.
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STOCK_FORMATS = ("rows", "columnar", "arrow")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Moving averages are rounded before encoding; full float reprs roughly
+# double both the payload and the json.dumps time.
+INDICATOR_DECIMALS = 4
+
+PRICE_FIELDS = ["open", "high", "low", "close"]
+OPTIONAL_FIELDS = ["ma50", "ma100"]
+
+# Below this size compression costs more than it saves
+MIN_COMPRESS_SIZE = 1024
+
+# Page sizes for the alert/signal history endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def _nullable(values):
+    """float64 array -> list with NaN replaced by None (JSON null)."""
+    values = np.asarray(values, dtype=np.float64)
+    result = values.tolist()
+    for i in np.flatnonzero(np.isnan(values)):
+        result[i] = None
+    return result
+
+
+def stock_columns(df):
+    """
+    Convert a price frame into parallel per-field lists. Each column is
+    converted once with NumPy instead of cell by cell.
+    """
+    timestamps = df["timestamp"].to_numpy(dtype="datetime64[s]")
+    columns = {"timestamp": np.datetime_as_string(timestamps).tolist()}
+    for field in PRICE_FIELDS:
+        columns[field] = df[field].to_numpy(dtype=np.float64).tolist()
+    columns["volume"] = df["volume"].to_numpy(dtype=np.int64).tolist()
+    for field in OPTIONAL_FIELDS:
+        if field in df:
+            columns[field] = _nullable(
+                np.round(df[field].to_numpy(dtype=np.float64), INDICATOR_DECIMALS)
+            )
+    return columns
+
+
+def columns_to_rows(columns):
+    """Parallel lists -> list of per-bar dicts (the original response shape)."""
+    fields = list(columns)
+    return [dict(zip(fields, values)) for values in zip(*columns.values())]
+
+
+def columns_to_arrow(columns):
+    """Serialize parallel lists as an Arrow IPC stream."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+
+    arrays = {
+        "timestamp": pc.strptime(pa.array(columns["timestamp"]), format=TIMESTAMP_FORMAT, unit="s")
+    }
+    for field, values in columns.items():
+        if field == "timestamp":
+            continue
+        arrays[field] = pa.array(values, type=pa.int64() if field == "volume" else pa.float64())
+    table = pa.table(arrays)
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def dumps(payload):
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def make_etag(*parts):
+    """Weak ETag from the values that identify a response's content."""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(etag, if_none_match):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def compress_body(body, accept_encoding):
+    """
+    Compress a response body with the best encoding the client accepts.
+    Returns (body, content_encoding or None).
+    """
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+
+    accepted = {token.split(";")[0].strip() for token in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=5), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque keyset cursor pointing just past the (created_at, id) of a row."""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Cursor -> (created_at, id). Raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
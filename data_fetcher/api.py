@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 import uvicorn
 from datetime import datetime
 import main as fetcher
@@ -6,11 +7,15 @@ import main as fetcher
 app = FastAPI()
 
 @app.get("/fetch")
-async def fetch_data():
+def fetch_data(run_id: str = None):
     """Trigger data fetching process"""
     try:
-        fetcher.main()
-        return {"status": "success", "timestamp": datetime.now().isoformat()}
+        if not fetcher.main():
+            return JSONResponse(
+                status_code=409,
+                content={"status": "skipped", "run_id": run_id, "timestamp": datetime.now().isoformat()}
+            )
+        return {"status": "success", "run_id": run_id, "timestamp": datetime.now().isoformat()}
     except Exception as e:
         return {"status": "error", "error": str(e), "timestamp": datetime.now().isoformat()}
 
@@ -2,6 +2,8 @@ import os
 import json
 import time
 import logging
+from contextlib import contextmanager
+import redis
 import yfinance as yf
 import pandas as pd
 from sqlalchemy import create_engine, text
@@ -24,6 +26,62 @@ def get_db_connection():
     connection_string = f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
     return create_engine(connection_string)
 
+# Advisory lock guarding the staging table and historical inserts. The strategy
+# analyzer takes the same lock in shared mode, so it never reads mid-ingest.
+INGEST_LOCK = "gpw_ingest"
+
+@contextmanager
+def advisory_lock(engine, name, shared=False):
+    """
+    Hold a session-level Postgres advisory lock for the duration of the block.
+    Yields False without waiting when another session holds it. Postgres drops
+    the lock together with the connection, so a crashed run never leaves it stuck.
+    """
+    mode = "_shared" if shared else ""
+    conn = engine.connect()
+    acquired = False
+    try:
+        acquired = conn.execute(
+            text(f"SELECT pg_try_advisory_lock{mode}(hashtext(:name))"), {"name": name}
+        ).scalar()
+        conn.commit()
+        yield acquired
+    finally:
+        if acquired:
+            conn.execute(text(f"SELECT pg_advisory_unlock{mode}(hashtext(:name))"), {"name": name})
+            conn.commit()
+        conn.close()
+
+# Generation counter embedded in the dashboard's response cache keys
+CACHE_GENERATION_KEY = "gpw:cache:generation"
+
+def invalidate_dashboard_cache():
+    """Bump the dashboard cache generation so responses built on old bars are dropped."""
+    try:
+        client = redis.Redis(host=os.environ.get('REDIS_HOST', 'redis'), port=6379, socket_timeout=1)
+        generation = client.incr(CACHE_GENERATION_KEY)
+        logger.info(f"Invalidated dashboard cache (generation {generation})")
+    except redis.RedisError as e:
+        # Cached entries still expire by TTL
+        logger.warning(f"Could not invalidate dashboard cache: {str(e)}")
+
+# Tell LISTEN-ing dashboards which symbols just received new bars
+def notify_new_bars(engine, symbols, records):
+    try:
+        payload = json.dumps({
+            "type": "bars",
+            "data": {
+                "symbols": symbols,
+                "records": records,
+                "timestamp": datetime.now().isoformat()
+            }
+        })
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_notify('dashboard_events', :payload)"), {"payload": payload})
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Failed to notify dashboards about new bars: {str(e)}")
+
 # Load configuration
 def load_config():
     try:
@@ -106,6 +164,8 @@ def save_to_staging(engine, data):
         
         # Select only required columns
         data = data[['symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume']]
+        # Index series come without volume
+        data['volume'] = data['volume'].fillna(0)
         
         # Insert into staging table
         data.to_sql('staging_stock_prices', engine, if_exists='append', index=False)
@@ -115,6 +175,27 @@ def save_to_staging(engine, data):
         logger.error(f"Error saving data to staging: {str(e)}")
         return 0
 
+# Highest historical_stock_prices id, the mark new bars are counted from
+def last_bar_id(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM historical_stock_prices")).scalar()
+
+# Bars merged into historical_stock_prices after the mark, per symbol. Staged
+# rows that already existed are skipped by the merge and not counted.
+def new_bars_since(engine, mark):
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT symbol, COUNT(*)
+                FROM historical_stock_prices
+                WHERE id > :mark
+                GROUP BY symbol
+                ORDER BY symbol
+            """),
+            {"mark": mark}
+        ).fetchall()
+    return {symbol: count for symbol, count in rows}
+
 # Record health status
 def update_health_status(engine, status, details=None):
     try:
@@ -136,37 +217,55 @@ def update_health_status(engine, status, details=None):
 
 # Main function
 def main():
+    """
+    Run a single ingest. Returns False without doing anything when another
+    ingest, or an analysis pass reading the bars, holds the ingest lock.
+    """
     logger.info("Starting data fetcher")
     
     try:
         # Get database connection
         engine = get_db_connection()
-        
-        # Clear the staging table first
-        clear_staging_table(engine)
 
-        # Load configuration
-        config = load_config()
-        symbols = config.get("symbols", [])
-        
-        if not symbols:
-            logger.error("No symbols configured")
-            update_health_status(engine, "ERROR", "No symbols configured")
-            return
-        
-        total_records = 0
-        
-        # Fetch data for each symbol
-        for symbol in symbols:
-            data = fetch_stock_data(symbol)
-            records = save_to_staging(engine, data)
-            total_records += records
+        with advisory_lock(engine, INGEST_LOCK) as acquired:
+            if not acquired:
+                logger.warning("Another ingest or an analysis pass holds the ingest lock, skipping this run")
+                return False
+            
+            # Clear the staging table first
+            clear_staging_table(engine)
+
+            # Load configuration
+            config = load_config()
+            # Benchmark indices (WIG20, mWIG40) are fetched like stocks for the relative-strength ranking
+            symbols = config.get("symbols", []) + config.get("benchmarks", [])
             
-            # Sleep to avoid rate limiting
-            time.sleep(1)
+            if not symbols:
+                logger.error("No symbols configured")
+                update_health_status(engine, "ERROR", "No symbols configured")
+                return True
+            
+            total_records = 0
+            mark = last_bar_id(engine)
+            
+            # Fetch data for each symbol
+            for symbol in symbols:
+                data = fetch_stock_data(symbol)
+                records = save_to_staging(engine, data)
+                total_records += records
+                
+                # Sleep to avoid rate limiting
+                time.sleep(1)
 
-        logger.info(f"Completed data fetch. Processed {total_records} records for {len(symbols)} symbols")
-        update_health_status(engine, "OK", f"Processed {total_records} records")
+            # Re-fetched bars are staged again but skipped by the merge; only
+            # symbols that actually gained bars invalidate caches and notify
+            new_bars = new_bars_since(engine, mark)
+            new_records = sum(new_bars.values())
+            logger.info(f"Completed data fetch. Processed {total_records} records for {len(symbols)} symbols, {new_records} new bars")
+            if new_bars:
+                invalidate_dashboard_cache()
+                notify_new_bars(engine, list(new_bars), new_records)
+            update_health_status(engine, "OK", f"Processed {total_records} records, {new_records} new bars")
         
     except Exception as e:
         logger.error(f"Error in main process: {str(e)}")
@@ -175,5 +274,7 @@ def main():
         except:
             pass
 
+    return True
+
 if __name__ == "__main__":
     main()
@@ -33,7 +33,43 @@ CREATE TABLE IF NOT EXISTS historical_stock_prices (
 CREATE INDEX IF NOT EXISTS idx_historical_symbol ON historical_stock_prices(symbol);
 CREATE INDEX IF NOT EXISTS idx_historical_timestamp ON historical_stock_prices(timestamp);
 
--- Alerts history table with JSONB for extra details
+-- Weekly and monthly bars, folded from every daily bar merged into
+-- historical_stock_prices by a trigger (see historical_to_period_bars_fn), so
+-- nothing resamples daily bars at read time. timestamp is the period start
+-- (Monday, first of the month); first_day and last_day are the trading days
+-- covered so far, so the current period's bar is partial until it ends.
+CREATE TABLE IF NOT EXISTS weekly_bars (
+    symbol VARCHAR(20) NOT NULL,
+    timestamp TIMESTAMP(0) NOT NULL,
+    open DECIMAL(10, 2) NOT NULL,
+    high DECIMAL(10, 2) NOT NULL,
+    low DECIMAL(10, 2) NOT NULL,
+    close DECIMAL(10, 2) NOT NULL,
+    volume BIGINT NOT NULL,
+    first_day TIMESTAMP(0) NOT NULL,
+    last_day TIMESTAMP(0) NOT NULL,
+    days INTEGER NOT NULL,
+    PRIMARY KEY (symbol, timestamp)
+);
+
+CREATE TABLE IF NOT EXISTS monthly_bars (LIKE weekly_bars INCLUDING ALL);
+
+-- Hourly bars, used by the backtester to settle days on which a position's
+-- stop and target both fall inside the daily range
+CREATE TABLE IF NOT EXISTS intraday_stock_prices (
+    id SERIAL PRIMARY KEY,
+    symbol VARCHAR(20) NOT NULL,
+    timestamp TIMESTAMP(0) NOT NULL,
+    open DECIMAL(10, 2) NOT NULL,
+    high DECIMAL(10, 2) NOT NULL,
+    low DECIMAL(10, 2) NOT NULL,
+    close DECIMAL(10, 2) NOT NULL,
+    volume BIGINT NOT NULL,
+    CONSTRAINT unique_intraday_entry UNIQUE (symbol, timestamp)
+);
+
+-- Alerts history table with JSONB for extra details. A WATCH replaced by a
+-- newer WATCH for the same symbol and strategy is kept as SUPERSEDED.
 CREATE TABLE IF NOT EXISTS alerts (
     id SERIAL PRIMARY KEY,
     symbol VARCHAR(20) NOT NULL,
@@ -46,13 +82,94 @@ CREATE TABLE IF NOT EXISTS alerts (
     details JSONB
 );
 
+-- Keyset pagination for the dashboard's alert and signal history:
+-- pages are read newest first on (created_at, id), optionally per strategy
+CREATE INDEX IF NOT EXISTS idx_alerts_created_id ON alerts(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_strategy_created_id ON alerts(strategy, created_at DESC, id DESC);
+
+-- Delivery outbox: one row per actionable alert, written in the same
+-- transaction as the alert by a trigger. The alert system claims rows,
+-- sends them and marks whole batches at once.
+CREATE TABLE IF NOT EXISTS alert_outbox (
+    id SERIAL PRIMARY KEY,
+    alert_id INTEGER NOT NULL UNIQUE REFERENCES alerts(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'PENDING',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    -- Full precision: TIMESTAMP(0) rounds up and would hold new rows back
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP,
+    sent_at TIMESTAMP(0),
+    last_error TEXT,
+    created_at TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Only undelivered rows are ever scanned by the claim query
+CREATE INDEX IF NOT EXISTS idx_alert_outbox_due ON alert_outbox(next_attempt_at)
+WHERE status IN ('PENDING', 'SENDING');
+
+-- Who receives which alerts, and where. channel is one of email, webhook,
+-- telegram, slack or file; destination is the address, URL, chat id or file
+-- for that channel. NULL symbols/strategies match everything; statuses
+-- selects the signal kinds (ALERT, WATCH) the subscriber wants.
+CREATE TABLE IF NOT EXISTS alert_subscriptions (
+    id SERIAL PRIMARY KEY,
+    channel VARCHAR(20) NOT NULL DEFAULT 'email',
+    destination VARCHAR(500) NOT NULL,
+    symbols TEXT[],
+    strategies TEXT[],
+    statuses TEXT[] NOT NULL DEFAULT '{ALERT}',
+    min_conditions INTEGER NOT NULL DEFAULT 0,
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per alert delivered to a destination, so a retried batch never
+-- sends the same alert to the same place twice. duration_ms is the channel
+-- send time, latency_ms the time from the alert being created to delivery.
+CREATE TABLE IF NOT EXISTS alert_deliveries (
+    alert_id INTEGER NOT NULL REFERENCES alerts(id) ON DELETE CASCADE,
+    recipient VARCHAR(500) NOT NULL,
+    channel VARCHAR(20) NOT NULL DEFAULT 'email',
+    delivered_at TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    duration_ms INTEGER,
+    latency_ms INTEGER,
+    PRIMARY KEY (alert_id, recipient, channel)
+);
+
 -- System health monitoring table
 CREATE TABLE IF NOT EXISTS system_health (
     id SERIAL PRIMARY KEY,
     component VARCHAR(50) NOT NULL,
     status VARCHAR(20) NOT NULL,
     last_check TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    details TEXT
+    details TEXT,
+    duration_ms INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_system_health_last_check ON system_health(last_check);
+
+-- Current status per component, one row each, kept up to date by a trigger on
+-- system_health so health checks never scan the raw history
+CREATE TABLE IF NOT EXISTS component_status (
+    component VARCHAR(50) PRIMARY KEY,
+    status VARCHAR(20) NOT NULL,
+    last_check TIMESTAMP(0) NOT NULL,
+    details TEXT,
+    duration_ms INTEGER,
+    last_ok_at TIMESTAMP(0),
+    consecutive_errors INTEGER NOT NULL DEFAULT 0
+);
+
+-- Hourly aggregates of system_health rows older than the raw retention window
+CREATE TABLE IF NOT EXISTS system_health_rollup (
+    component VARCHAR(50) NOT NULL,
+    bucket TIMESTAMP(0) NOT NULL,
+    runs INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    total_duration_ms BIGINT,
+    max_duration_ms INTEGER,
+    PRIMARY KEY (component, bucket)
 );
 
 CREATE TABLE IF NOT EXISTS positions (
@@ -67,6 +184,123 @@ CREATE TABLE IF NOT EXISTS positions (
     details JSONB
 );
 
+CREATE INDEX IF NOT EXISTS idx_positions_open ON positions(id) WHERE status = 'OTWARTA';
+
+-- Exit-tracking state of each open position, advanced by the position monitor
+-- after every ingest. Each run reads only the bars newer than last_timestamp
+-- (plus the indicator look-back), never the whole history since entry.
+CREATE TABLE IF NOT EXISTS position_state (
+    position_id INTEGER PRIMARY KEY REFERENCES positions(id) ON DELETE CASCADE,
+    last_timestamp TIMESTAMP(0) NOT NULL,
+    highest_close DECIMAL(10,2) NOT NULL,
+    trailing_stop DECIMAL(10,4) NOT NULL,
+    last_close DECIMAL(10,2),
+    atr DECIMAL(10,4),
+    rsi DECIMAL(7,4),
+    exit_signalled_at TIMESTAMP(0),
+    exit_reasons TEXT[],
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- WATCH signals waiting for a close above their breakout level. The analyzer
+-- keeps one ACTIVE row per symbol and strategy; after every ingest the
+-- watchlist pass joins the active rows to the bars newer than checked_through
+-- and promotes a crossing to an ALERT, or expires the row once max_bars bars
+-- passed without one (or a close fell below its stop).
+CREATE TABLE IF NOT EXISTS watchlist (
+    id SERIAL PRIMARY KEY,
+    symbol VARCHAR(20) NOT NULL,
+    strategy VARCHAR(50) NOT NULL,
+    trigger_entry DECIMAL(10,4) NOT NULL,
+    stop_loss DECIMAL(10,4) NOT NULL,
+    target DECIMAL(10,4) NOT NULL,
+    conditions_met INTEGER,
+    alert_id INTEGER REFERENCES alerts(id) ON DELETE SET NULL,
+    -- Last bar compared against the trigger, and how many were
+    checked_through TIMESTAMP(0) NOT NULL,
+    bars_seen INTEGER NOT NULL DEFAULT 0,
+    max_bars INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'ACTIVE',
+    promoted_alert_id INTEGER REFERENCES alerts(id) ON DELETE SET NULL,
+    created_at TIMESTAMP(0) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    resolved_at TIMESTAMP(0)
+);
+
+-- Only active rows are indexed: the crossing join probes them by symbol and
+-- trigger level, and a new WATCH replaces the symbol's active row in place
+CREATE INDEX IF NOT EXISTS idx_watchlist_active_trigger ON watchlist(symbol, trigger_entry)
+WHERE status = 'ACTIVE';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_watchlist_active_symbol_strategy ON watchlist(symbol, strategy)
+WHERE status = 'ACTIVE';
+
+-- Cross-sectional ranking of the universe per trading date, computed on the
+-- whole price panel after every ingest. Returns are over the ranking period;
+-- rs_* are relative to the WIG20 and mWIG40 indices, percentiles are 0-100
+-- across the universe, within the symbol's sector and across sectors.
+-- Symbols without a sector in config/symbols.json have NULL sector columns.
+CREATE TABLE IF NOT EXISTS symbol_rankings (
+    symbol VARCHAR(20) NOT NULL,
+    timestamp TIMESTAMP(0) NOT NULL,
+    sector VARCHAR(50),
+    return_pct DOUBLE PRECISION,
+    rs_wig20 DOUBLE PRECISION,
+    rs_mwig40 DOUBLE PRECISION,
+    rs_percentile DOUBLE PRECISION,
+    sector_percentile DOUBLE PRECISION,
+    sector_momentum DOUBLE PRECISION,
+    sector_momentum_percentile DOUBLE PRECISION,
+    PRIMARY KEY (symbol, timestamp)
+);
+
+-- Filters read one date's ranking, strongest first
+CREATE INDEX IF NOT EXISTS idx_symbol_rankings_timestamp ON symbol_rankings(timestamp, rs_percentile DESC);
+
+-- Registry of completed backtests. params_hash covers the strategy, universe,
+-- date range, normalised parameters and a fingerprint of the price data, so
+-- an identical request is served from here instead of being recomputed.
+-- equity_curve is a compressed numpy archive (dates, equity, exposure, trade days).
+CREATE TABLE IF NOT EXISTS backtest_runs (
+    id SERIAL PRIMARY KEY,
+    params_hash CHAR(64) NOT NULL UNIQUE,
+    symbol VARCHAR(20),
+    symbols TEXT[] NOT NULL,
+    strategy VARCHAR(50) NOT NULL,
+    start_date DATE,
+    end_date DATE,
+    parameters JSONB NOT NULL,
+    metrics JSONB NOT NULL,
+    equity_curve BYTEA NOT NULL,
+    duration_ms INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Result listings: per symbol (NULL for universe runs) and per strategy, newest first
+CREATE INDEX IF NOT EXISTS idx_backtest_runs_symbol_strategy ON backtest_runs(symbol, strategy, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_backtest_runs_created ON backtest_runs(created_at DESC);
+
+-- Closed trades of backtests, bulk-loaded with COPY and tagged with their run
+CREATE TABLE IF NOT EXISTS backtest_closed_positions (
+    id SERIAL PRIMARY KEY,
+    run_id INTEGER REFERENCES backtest_runs(id) ON DELETE CASCADE,
+    symbol VARCHAR(20) NOT NULL,
+    signal_type VARCHAR(20),
+    signal_date TIMESTAMP,
+    entry_date TIMESTAMP,
+    entry_price DOUBLE PRECISION,
+    stop_loss DOUBLE PRECISION,
+    target DOUBLE PRECISION,
+    conditions_met INT,
+    exit_date TIMESTAMP,
+    exit_price DOUBLE PRECISION,
+    shares DOUBLE PRECISION,
+    profit DOUBLE PRECISION,
+    profit_pct DOUBLE PRECISION,
+    exit_reason VARCHAR(20),
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_backtest_closed_positions_run ON backtest_closed_positions(run_id);
+
 -- Create or replace the trigger function
 CREATE OR REPLACE FUNCTION staging_to_historical_trigger_fn()
 RETURNS TRIGGER AS $$
@@ -85,3 +319,171 @@ AFTER INSERT OR UPDATE ON staging_stock_prices
 FOR EACH ROW
 EXECUTE FUNCTION staging_to_historical_trigger_fn();
 
+
+-- Fold each new daily bar into its week and month. Daily bars are only ever
+-- inserted (the merge skips existing ones), so a period bar is updated in
+-- place: open from its earliest day, close from its latest, high/low/volume
+-- accumulated. Bars may arrive in any order.
+CREATE OR REPLACE FUNCTION historical_to_period_bars_fn()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO weekly_bars AS b
+        (symbol, timestamp, open, high, low, close, volume, first_day, last_day, days)
+    VALUES (NEW.symbol, date_trunc('week', NEW.timestamp), NEW.open, NEW.high, NEW.low, NEW.close,
+            NEW.volume, NEW.timestamp, NEW.timestamp, 1)
+    ON CONFLICT (symbol, timestamp) DO UPDATE SET
+        open = CASE WHEN EXCLUDED.first_day < b.first_day THEN EXCLUDED.open ELSE b.open END,
+        close = CASE WHEN EXCLUDED.last_day > b.last_day THEN EXCLUDED.close ELSE b.close END,
+        high = GREATEST(b.high, EXCLUDED.high),
+        low = LEAST(b.low, EXCLUDED.low),
+        volume = b.volume + EXCLUDED.volume,
+        first_day = LEAST(b.first_day, EXCLUDED.first_day),
+        last_day = GREATEST(b.last_day, EXCLUDED.last_day),
+        days = b.days + 1;
+
+    INSERT INTO monthly_bars AS b
+        (symbol, timestamp, open, high, low, close, volume, first_day, last_day, days)
+    VALUES (NEW.symbol, date_trunc('month', NEW.timestamp), NEW.open, NEW.high, NEW.low, NEW.close,
+            NEW.volume, NEW.timestamp, NEW.timestamp, 1)
+    ON CONFLICT (symbol, timestamp) DO UPDATE SET
+        open = CASE WHEN EXCLUDED.first_day < b.first_day THEN EXCLUDED.open ELSE b.open END,
+        close = CASE WHEN EXCLUDED.last_day > b.last_day THEN EXCLUDED.close ELSE b.close END,
+        high = GREATEST(b.high, EXCLUDED.high),
+        low = LEAST(b.low, EXCLUDED.low),
+        volume = b.volume + EXCLUDED.volume,
+        first_day = LEAST(b.first_day, EXCLUDED.first_day),
+        last_day = GREATEST(b.last_day, EXCLUDED.last_day),
+        days = b.days + 1;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER historical_to_period_bars_trigger
+AFTER INSERT ON historical_stock_prices
+FOR EACH ROW
+EXECUTE FUNCTION historical_to_period_bars_fn();
+
+-- Rebuild both period tables from the daily bars in one pass, e.g. once when
+-- the tables are added to a database that already holds history
+CREATE OR REPLACE FUNCTION rebuild_period_bars()
+RETURNS VOID AS $$
+BEGIN
+    TRUNCATE weekly_bars, monthly_bars;
+
+    INSERT INTO weekly_bars (symbol, timestamp, open, high, low, close, volume, first_day, last_day, days)
+    SELECT symbol, date_trunc('week', timestamp),
+           (array_agg(open ORDER BY timestamp))[1], MAX(high), MIN(low),
+           (array_agg(close ORDER BY timestamp DESC))[1], SUM(volume),
+           MIN(timestamp), MAX(timestamp), COUNT(*)
+    FROM historical_stock_prices
+    GROUP BY symbol, date_trunc('week', timestamp);
+
+    INSERT INTO monthly_bars (symbol, timestamp, open, high, low, close, volume, first_day, last_day, days)
+    SELECT symbol, date_trunc('month', timestamp),
+           (array_agg(open ORDER BY timestamp))[1], MAX(high), MIN(low),
+           (array_agg(close ORDER BY timestamp DESC))[1], SUM(volume),
+           MIN(timestamp), MAX(timestamp), COUNT(*)
+    FROM historical_stock_prices
+    GROUP BY symbol, date_trunc('month', timestamp);
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Push dashboard events (new alerts, health changes) to LISTEN-ing dashboards.
+-- The data fetcher publishes a 'bars' event on the same channel after an ingest.
+CREATE OR REPLACE FUNCTION notify_dashboard_event_fn()
+RETURNS TRIGGER AS $$
+DECLARE
+    payload JSON;
+BEGIN
+    IF TG_TABLE_NAME = 'alerts' THEN
+        payload := json_build_object(
+            'type', 'alert',
+            'data', json_build_object(
+                'id', NEW.id,
+                'symbol', NEW.symbol,
+                'strategy', NEW.strategy,
+                'signal_type', NEW.signal_type,
+                'price', NEW.price,
+                'created_at', NEW.created_at,
+                'status', NEW.status
+            )
+        );
+    ELSE
+        payload := json_build_object(
+            'type', 'health',
+            'data', json_build_object(
+                'component', NEW.component,
+                'status', NEW.status,
+                'last_check', NEW.last_check,
+                'details', left(NEW.details, 500)
+            )
+        );
+    END IF;
+
+    PERFORM pg_notify('dashboard_events', payload::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER alerts_dashboard_event_trigger
+AFTER INSERT ON alerts
+FOR EACH ROW
+EXECUTE FUNCTION notify_dashboard_event_fn();
+
+CREATE TRIGGER system_health_dashboard_event_trigger
+AFTER INSERT ON system_health
+FOR EACH ROW
+EXECUTE FUNCTION notify_dashboard_event_fn();
+
+-- Maintain component_status from every system_health insert
+CREATE OR REPLACE FUNCTION update_component_status_fn()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO component_status AS cs
+        (component, status, last_check, details, duration_ms, last_ok_at, consecutive_errors)
+    VALUES (
+        NEW.component, NEW.status, NEW.last_check, NEW.details, NEW.duration_ms,
+        CASE WHEN NEW.status = 'OK' THEN NEW.last_check END,
+        CASE WHEN NEW.status = 'OK' THEN 0 ELSE 1 END
+    )
+    ON CONFLICT (component) DO UPDATE SET
+        status = EXCLUDED.status,
+        last_check = EXCLUDED.last_check,
+        details = EXCLUDED.details,
+        duration_ms = EXCLUDED.duration_ms,
+        last_ok_at = COALESCE(EXCLUDED.last_ok_at, cs.last_ok_at),
+        consecutive_errors = CASE WHEN EXCLUDED.status = 'OK' THEN 0 ELSE cs.consecutive_errors + 1 END
+    -- A late or backfilled row never replaces a newer status
+    WHERE EXCLUDED.last_check >= cs.last_check;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER system_health_component_status_trigger
+AFTER INSERT ON system_health
+FOR EACH ROW
+EXECUTE FUNCTION update_component_status_fn();
+
+-- Queue every new signal for delivery (subscriptions decide who gets ALERT
+-- and who also gets WATCH entries) and wake the alert system's listener. NOTIFY is delivered on commit, so the
+-- listener never sees an alert before its outbox row is visible.
+CREATE OR REPLACE FUNCTION enqueue_alert_delivery_fn()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status IN ('ALERT', 'WATCH', 'PENDING') THEN
+        INSERT INTO alert_outbox (alert_id) VALUES (NEW.id)
+        ON CONFLICT (alert_id) DO NOTHING;
+        PERFORM pg_notify('new_alert', NEW.id::text);
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER alerts_outbox_trigger
+AFTER INSERT ON alerts
+FOR EACH ROW
+EXECUTE FUNCTION enqueue_alert_delivery_fn();
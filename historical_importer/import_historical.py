@@ -1,6 +1,8 @@
 import os
 import json
 import logging
+from contextlib import contextmanager
+import redis
 import yfinance as yf
 import pandas as pd
 from sqlalchemy import create_engine, text
@@ -24,6 +26,38 @@ def get_db_connection():
     connection_string = f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
     return create_engine(connection_string)
 
+# Advisory lock shared with the data fetcher around staging/historical writes
+INGEST_LOCK = "gpw_ingest"
+
+@contextmanager
+def ingest_lock(engine):
+    """
+    Wait for and hold the ingest advisory lock, so a scheduled fetch cannot
+    truncate the staging table in the middle of an import.
+    """
+    conn = engine.connect()
+    try:
+        conn.execute(text("SELECT pg_advisory_lock(hashtext(:name))"), {"name": INGEST_LOCK})
+        conn.commit()
+        yield
+    finally:
+        conn.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": INGEST_LOCK})
+        conn.commit()
+        conn.close()
+
+# Generation counter embedded in the dashboard's response cache keys
+CACHE_GENERATION_KEY = "gpw:cache:generation"
+
+def invalidate_dashboard_cache():
+    """Bump the dashboard cache generation so responses built on old bars are dropped."""
+    try:
+        client = redis.Redis(host=os.environ.get('REDIS_HOST', 'redis'), port=6379, socket_timeout=1)
+        generation = client.incr(CACHE_GENERATION_KEY)
+        logger.info(f"Invalidated dashboard cache (generation {generation})")
+    except redis.RedisError as e:
+        # Cached entries still expire by TTL
+        logger.warning(f"Could not invalidate dashboard cache: {str(e)}")
+
 # Load configuration
 def load_config():
     try:
@@ -90,7 +124,9 @@ def insert_stock_data(engine, symbol, data):
                 high_price = float(row['High'].item() if hasattr(row['High'], 'item') else row['High'])
                 low_price = float(row['Low'].item() if hasattr(row['Low'], 'item') else row['Low'])
                 close_price = float(row['Close'].item() if hasattr(row['Close'], 'item') else row['Close'])
-                volume = int(row['Volume'].item() if hasattr(row['Volume'], 'item') else row['Volume'])
+                volume = float(row['Volume'].item() if hasattr(row['Volume'], 'item') else row['Volume'])
+                # Index series come without volume
+                volume = int(volume) if volume == volume else 0
                 
                 # Insert directly with SQL (no ON CONFLICT since table is cleared)
                 query = """
@@ -144,44 +180,48 @@ def main():
         # Get database connection
         engine = get_db_connection()
         
-        # Clear the staging table first
-        clear_staging_table(engine)
+        with ingest_lock(engine):
+            # Clear the staging table first
+            clear_staging_table(engine)
 
-        # Load configuration
-        config = load_config()
-        if config is None:
-            logger.error("Configuration could not be loaded")
-            update_health_status(engine, "ERROR", "Configuration could not be loaded")
-            return
+            # Load configuration
+            config = load_config()
+            if config is None:
+                logger.error("Configuration could not be loaded")
+                update_health_status(engine, "ERROR", "Configuration could not be loaded")
+                return
         
-        symbols = config.get("symbols", [])
-        if not symbols:
-            logger.error("No symbols configured")
-            update_health_status(engine, "ERROR", "No symbols configured")
-            return
+            # Benchmark indices (WIG20, mWIG40) are imported like stocks for the relative-strength ranking
+            symbols = config.get("symbols", []) + config.get("benchmarks", [])
+            if not symbols:
+                logger.error("No symbols configured")
+                update_health_status(engine, "ERROR", "No symbols configured")
+                return
         
-        # Get number of years to import
-        years = int(os.environ.get('HISTORY_YEARS', 5))
-        logger.info(f"Importing {years} years of historical data")
+            # Get number of years to import
+            years = int(os.environ.get('HISTORY_YEARS', 5))
+            logger.info(f"Importing {years} years of historical data")
         
-        total_records = 0
+            total_records = 0
         
-        # Process each symbol
-        for symbol in symbols:
-            try:
-                data = fetch_historical_data(symbol, years)
-                if data is not None and not data.empty:
-                    records = insert_stock_data(engine, symbol, data)
-                    total_records += records
-                else:
-                    logger.info(f"Failed to insert data for {symbol}")
-            except Exception as e:
-                logger.error(f"Failed to process {symbol}: {str(e)}")
+            # Process each symbol
+            for symbol in symbols:
+                try:
+                    data = fetch_historical_data(symbol, years)
+                    if data is not None and not data.empty:
+                        records = insert_stock_data(engine, symbol, data)
+                        total_records += records
+                    else:
+                        logger.info(f"Failed to insert data for {symbol}")
+                except Exception as e:
+                    logger.error(f"Failed to process {symbol}: {str(e)}")
             
-            time.sleep(1)  # Avoid rate limiting
+                time.sleep(1)  # Avoid rate limiting
         
-        logger.info(f"Completed historical data import. Processed {total_records} records for {len(symbols)} symbols")
-        update_health_status(engine, "OK", f"Processed {total_records} records")
+            logger.info(f"Completed historical data import. Processed {total_records} records for {len(symbols)} symbols")
+            if total_records:
+                invalidate_dashboard_cache()
+            update_health_status(engine, "OK", f"Processed {total_records} records")
         
     except Exception as e:
         logger.error(f"Error in main process: {str(e)}")
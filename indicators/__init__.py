@@ -0,0 +1,15 @@
+from .kernels import (
+    as_series,
+    shift,
+    previous_valid,
+    sma,
+    rolling_max,
+    ema,
+    macd,
+    rsi,
+    true_range,
+    atr,
+)
+from .wilder import WARMUP_PERIODS, wilder_smooth, wilder_rsi, wilder_atr
+from .cache import KERNELS, IndicatorCache, indicator_cache, indicator, bar_key
+from .ranking import period_return, relative_strength, percentile_rank, group_mean, group_percentile_rank
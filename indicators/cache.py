@@ -0,0 +1,137 @@
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from . import kernels, wilder
+from .kernels import as_series
+
+# Bound of the shared cache: whichever of the two is reached first evicts
+# the least recently used series
+INDICATOR_CACHE_MB = int(os.environ.get('INDICATOR_CACHE_MB', 64))
+INDICATOR_CACHE_ENTRIES = int(os.environ.get('INDICATOR_CACHE_ENTRIES', 4096))
+
+
+# Kernels by name, with the bar columns each takes ahead of the series column
+KERNELS = {
+    "sma": (kernels.sma, ()),
+    "rolling_max": (kernels.rolling_max, ()),
+    "ema": (kernels.ema, ()),
+    "macd": (kernels.macd, ()),
+    "rsi": (kernels.rsi, ()),
+    "atr": (kernels.atr, ("high", "low")),
+    "wilder_rsi": (wilder.wilder_rsi, ()),
+    "wilder_atr": (wilder.wilder_atr, ("high", "low")),
+}
+
+
+def _nbytes(value):
+    if isinstance(value, tuple):
+        return sum(_nbytes(item) for item in value)
+    return value.nbytes
+
+
+def _freeze(value):
+    """Make a cached series read-only, so a caller cannot alter it for the others."""
+    if isinstance(value, tuple):
+        for item in value:
+            _freeze(item)
+    else:
+        value.flags.writeable = False
+
+
+def bar_key(timestamps):
+    """
+    Key of the bars an indicator was computed over, from their timestamps
+    (a 1-D series or a bars x symbols panel): the shape with the first and
+    last bars. Stored bars are never rewritten, so a new bar or a longer
+    history changes the key.
+    """
+    stamps = np.asarray(timestamps, dtype="datetime64[ns]")
+    if len(stamps) == 0:
+        return (stamps.shape,)
+    return (stamps.shape, stamps[0].tobytes(), stamps[-1].tobytes())
+
+
+class IndicatorCache:
+    """
+    LRU memo of computed indicator series, keyed by symbol (or a panel's
+    tuple of symbols), indicator, column, params and bar_key. Shared by
+    everything in the process, so strategies, the dashboard and backtests
+    over the same bars compute each series once. Thread-safe; a series is
+    computed outside the lock, so two threads missing at once may both
+    compute it.
+    """
+
+    def __init__(self, max_bytes=INDICATOR_CACHE_MB * 2**20, max_entries=INDICATOR_CACHE_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+
+        value = compute()
+        _freeze(value)
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return value
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = (value, size)
+                self.nbytes += size
+            while len(self.entries) > self.max_entries or self.nbytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "size_mb": round(self.nbytes / 2**20, 2),
+                "max_size_mb": round(self.max_bytes / 2**20, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate_pct": round(100 * self.hits / lookups, 2) if lookups else None,
+            }
+
+
+# The process-wide cache
+indicator_cache = IndicatorCache()
+
+
+def indicator(bars, name, column="close", *params, symbol=None, bars_key=None, cache=indicator_cache):
+    """
+    Indicator `name` of `bars[column]` (plus the other bar columns the kernel
+    takes, e.g. high and low for ATR), with `params` passed to the kernel.
+    `bars` maps column names to a series or a bars x symbols panel. With a
+    `symbol` and the bars' `bars_key` the series is memoized in `cache`.
+    """
+    kernel, columns = KERNELS[name]
+
+    def compute():
+        return kernel(*(as_series(bars[field]) for field in columns), as_series(bars[column]), *params)
+
+    if symbol is None or bars_key is None or cache is None:
+        return compute()
+    return cache.get((symbol, name, column, params, bars_key), compute)
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Kernels take a 1-D series or a bars x symbols panel (one column per symbol)
+# and work down axis 0. NaN marks a missing bar: a window containing one is
+# NaN, as with pandas' rolling(window) defaults.
+#
+# Moving means and EMAs run in pandas' compiled rolling/ewm loops rather than
+# as NumPy window sums: those round differently in the last bit, which flips
+# ties such as close > SMA on flat prices and would change signals against
+# registered backtests. Everything around them is array arithmetic.
+
+
+def as_series(values):
+    """float64 array of a 1-D series or a bars x symbols panel."""
+    return np.asarray(values, dtype=np.float64)
+
+
+def _frame(values):
+    return pd.DataFrame(values.reshape(len(values), -1))
+
+
+def _output(shape, out):
+    if out is None:
+        return np.empty(shape)
+    if out.shape != shape or out.dtype != np.float64:
+        raise ValueError(f"out must be a float64 array of shape {shape}")
+    return out
+
+
+def _as_panel(values):
+    """2-D view (bars x columns) of a 1-D series or a panel."""
+    return values.reshape(len(values), -1)
+
+
+def shift(values, periods=1):
+    """Shift down by `periods` bars, filling the first ones with NaN."""
+    values = as_series(values)
+    shifted = np.full(values.shape, np.nan)
+    if periods < len(values):
+        shifted[periods:] = values[:-periods]
+    return shifted
+
+
+def sma(values, window, min_periods=None):
+    """
+    Trailing mean of `window` bars. With `min_periods`, the first bars (and
+    windows with missing bars) average what they have once at least that
+    many are present, like SQL's AVG() OVER (ROWS n PRECEDING).
+    """
+    values = as_series(values)
+    return _frame(values).rolling(window=window, min_periods=min_periods).mean().to_numpy().reshape(values.shape)
+
+
+def rolling_max(values, window):
+    """Highest value of the trailing `window` bars."""
+    values = as_series(values)
+    out = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window, axis=0).max(axis=-1)
+    return out
+
+
+def ema(values, span):
+    """
+    Exponential moving average with alpha = 2 / (span + 1), seeded with the
+    first bar, as pandas' ewm(span, adjust=False): a missing bar keeps the
+    previous average.
+    """
+    values = as_series(values)
+    return _frame(values).ewm(span=span, adjust=False).mean().to_numpy().reshape(values.shape)
+
+
+def macd(values, fast, slow, signal):
+    """MACD line (fast EMA - slow EMA) and its signal line."""
+    line = ema(values, fast) - ema(values, slow)
+    return line, ema(line, signal)
+
+
+def rsi(values, period):
+    """RSI over simple `period`-bar means of gains and losses."""
+    values = as_series(values)
+    delta = values - shift(values)
+    avg_gain = sma(np.maximum(delta, 0), period)
+    avg_loss = sma(-np.minimum(delta, 0), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / np.where(avg_loss == 0, np.nan, avg_loss)
+    return 100 - 100 / (1 + rs)
+
+
+def previous_valid(values, out=None):
+    """Each bar's previous present value, skipping missing bars; NaN before the first."""
+    values = as_series(values)
+    out = _output(values.shape, out)
+    panel, result = _as_panel(values), _as_panel(out)
+    if len(panel) == 0:
+        return out
+    rows = np.where(np.isnan(panel), -1, np.arange(len(panel))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    result[0] = np.nan
+    if len(panel) > 1:
+        last = rows[:-1]
+        result[1:] = np.take_along_axis(panel, np.maximum(last, 0), axis=0)
+        result[1:][last < 0] = np.nan
+    return out
+
+
+def true_range(high, low, close, out=None):
+    """
+    High - low widened to the previous close (the symbol's previous bar, not
+    the previous row of the panel); a symbol's first bar has high - low.
+    """
+    high, low = as_series(high), as_series(low)
+    out = _output(high.shape, out)
+    prev_close = previous_valid(close)
+    np.subtract(high, low, out=out)
+    # |high - prev| and |prev - low| in one scratch buffer; fmax skips the
+    # missing previous close of the first bar
+    gap = np.subtract(high, prev_close)
+    np.abs(gap, out=gap)
+    np.fmax(out, gap, out=out)
+    np.subtract(prev_close, low, out=gap)
+    np.abs(gap, out=gap)
+    np.fmax(out, gap, out=out)
+    return out
+
+
+def atr(high, low, close, period):
+    """Average true range as a simple `period`-bar mean."""
+    return sma(true_range(high, low, close), period)
+
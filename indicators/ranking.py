@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from .kernels import as_series, shift, _frame
+
+# Cross-sectional kernels over a dates x symbols panel: every row is one
+# trading date and the columns are compared with each other, so unlike the
+# series kernels these need the whole universe at once. Missing bars are NaN
+# and drop out of the date's ranking.
+
+
+def period_return(close, period):
+    """Return over the last `period` bars, e.g. 0.05 for +5%."""
+    close = as_series(close)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return close / shift(close, period) - 1
+
+
+def relative_strength(close, benchmark, period):
+    """
+    Return over `period` bars relative to the benchmark's over the same
+    bars: (1 + stock return) / (1 + benchmark return) - 1, so 0.1 means 10%
+    ahead of the index. `benchmark` is a 1-D close series on the panel's dates.
+    """
+    stock = period_return(close, period)
+    index = period_return(benchmark, period)
+    if stock.ndim == 2:
+        index = index[:, None]
+    return (1 + stock) / (1 + index) - 1
+
+
+def percentile_rank(values):
+    """Percentile (0-100] of each value among the same row's, ties averaged."""
+    values = as_series(values)
+    return _frame(values).rank(axis=1, pct=True).to_numpy().reshape(values.shape) * 100
+
+
+def group_mean(values, codes, groups):
+    """
+    Mean of each row's values per group, as a dates x groups array. `codes`
+    gives each column's group (0..groups-1, or -1 for none); missing values
+    are left out of their group's mean, and a group with none is NaN.
+    """
+    values = as_series(values)
+    members = np.zeros((values.shape[1], groups))
+    grouped = codes >= 0
+    members[np.flatnonzero(grouped), codes[grouped]] = 1
+    present = ~np.isnan(values)
+    total = np.where(present, values, 0) @ members
+    count = present @ members
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return total / np.where(count > 0, count, np.nan)
+
+
+def group_percentile_rank(values, codes):
+    """Percentile of each value among the same row's values of its group; NaN without a group."""
+    values = as_series(values)
+    frame = pd.DataFrame(values.T)
+    ranks = frame.groupby(np.where(codes >= 0, codes, np.nan)).rank(pct=True)
+    return ranks.reindex(frame.index).to_numpy().T * 100
@@ -0,0 +1,136 @@
+import numpy as np
+
+from .kernels import as_series, previous_valid, true_range, _output, _as_panel
+
+# Wilder's smoothing as an exact recurrence over preallocated float64 buffers:
+# seeded with the mean of a symbol's first `period` values, then
+#   avg = (avg * (period - 1) + value) / period
+# A missing bar (NaN) leaves the average as it was and its output NaN, so a
+# column of a date panel gets the same values as the symbol's own series.
+# Every kernel takes a 1-D series or a bars x symbols panel and an optional
+# `out` array of the same shape to write into.
+
+# Periods of history for the seed to have decayed to noise ((p-1)/p)^(10p),
+# about 5e-5 of its weight: callers loading a window of bars use this many
+WARMUP_PERIODS = 10
+
+
+def wilder_smooth(values, period, out=None):
+    """Wilder's running average of `values`, NaN until `period` values were seen."""
+    values = as_series(values)
+    out = _output(values.shape, out)
+    _smooth(_as_panel(values), period, _as_panel(out))
+    return out
+
+
+def _smooth(values, period, out):
+    n, m = values.shape
+    if m == 1:
+        _smooth_series(values[:, 0], period, out[:, 0])
+        return
+
+    # State and scratch for the whole pass; the loop itself allocates nothing
+    weight = period - 1.0
+    average = np.zeros(m)
+    scratch = np.empty(m)
+    seen = np.zeros(m, dtype=np.int64)
+    valid = np.empty(m, dtype=bool)
+    ready = np.zeros(m, dtype=bool)
+    mask = np.empty(m, dtype=bool)
+    seeded = False
+    for i in range(n):
+        row, result = values[i], out[i]
+        np.equal(row, row, out=valid)
+        if seeded and valid.all():
+            # The common case: every column seeded and present on this bar
+            np.multiply(average, weight, out=average)
+            np.add(average, row, out=average)
+            np.divide(average, period, out=average)
+            result[:] = average
+            continue
+
+        # Seeded columns present on this bar take the recurrence
+        np.multiply(average, weight, out=scratch)
+        np.add(scratch, row, out=scratch)
+        np.divide(scratch, period, out=scratch)
+        np.logical_and(ready, valid, out=mask)
+        np.copyto(average, scratch, where=mask)
+        if not seeded:
+            # Columns still seeding sum their first `period` values
+            np.logical_not(ready, out=mask)
+            np.logical_and(mask, valid, out=mask)
+            np.add(average, row, out=average, where=mask)
+            seen += mask
+            np.greater_equal(seen, period, out=ready)
+            np.logical_and(mask, ready, out=mask)
+            np.divide(average, period, out=average, where=mask)
+            seeded = bool(ready.all())
+
+        result[:] = average
+        np.logical_and(ready, valid, out=mask)
+        np.logical_not(mask, out=mask)
+        np.copyto(result, np.nan, where=mask)
+
+
+def _smooth_series(values, period, out):
+    """Single column: the same recurrence on Python floats, cheaper than ufunc calls."""
+    weight = period - 1.0
+    average = 0.0
+    seen = 0
+    result = []
+    for value in values.tolist():
+        if value != value:
+            result.append(np.nan)
+            continue
+        if seen < period:
+            average += value
+            seen += 1
+            if seen < period:
+                result.append(np.nan)
+                continue
+            average /= period
+        else:
+            average = (average * weight + value) / period
+        result.append(average)
+    out[:] = result
+
+
+def wilder_atr(high, low, close, period, out=None):
+    """Average true range with Wilder's smoothing."""
+    tr = true_range(high, low, close, out=out)
+    return wilder_smooth(tr, period, out=tr)
+
+
+def wilder_rsi(close, period, out=None):
+    """
+    RSI with Wilder-smoothed average gain and loss over the symbol's bar to
+    bar changes. A period without any change gives 50.
+    """
+    close = as_series(close)
+    out = _output(close.shape, out)
+    panel = _as_panel(close)
+    n, m = panel.shape
+
+    # Gains and losses side by side, so one pass smooths both
+    moves = np.empty((n, 2 * m))
+    gain, loss = moves[:, :m], moves[:, m:]
+    previous_valid(panel, out=gain)
+    np.subtract(panel, gain, out=gain)
+    np.negative(gain, out=loss)
+    np.maximum(gain, 0, out=gain)
+    np.maximum(loss, 0, out=loss)
+    if m == 1:
+        _smooth(gain, period, gain)
+        _smooth(loss, period, loss)
+    else:
+        _smooth(moves, period, moves)
+
+    # 100 * gain / (gain + loss), i.e. 100 - 100 / (1 + gain / loss) without
+    # the division by a zero loss
+    result = _as_panel(out)
+    np.add(gain, loss, out=loss)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(gain, loss, out=result)
+    np.multiply(result, 100, out=result)
+    result[(loss == 0) & ~np.isnan(gain)] = 50.0
+    return out
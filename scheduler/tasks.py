@@ -1,7 +1,11 @@
 import os
+import uuid
 import logging
+from contextlib import contextmanager
+from datetime import datetime
 from celery import Celery
 from celery.schedules import crontab
+import redis
 import requests
 import time
 from sqlalchemy import create_engine, text
@@ -16,6 +20,35 @@ logger = logging.getLogger('scheduler')
 # Setup Celery
 redis_host = os.environ.get('REDIS_HOST', 'redis')
 app = Celery('tasks', broker=f'redis://{redis_host}:6379/0')
+redis_client = redis.Redis(host=redis_host, port=6379, db=0)
+
+# Lock TTLs (seconds) per pipeline stage. A lock outlives the HTTP timeout of its
+# stage so a hung worker cannot hold it forever, but never expires mid-run.
+LOCK_TTLS = {
+    "data_fetcher": 900,
+    "strategy_analyzer": 900,
+    "position_monitor": 300,
+    "watchlist": 300,
+    "ranking": 300,
+    "alert_system": 600,
+}
+# How long a completed run key is remembered for deduplication
+RUN_KEY_TTL = 24 * 3600
+# How long the analyzer waits for an in-flight ingest before trying again
+INGEST_WAIT_COUNTDOWN = 60
+# How long the fetcher waits for analysis runs holding the ingest lock
+ANALYSIS_WAIT_COUNTDOWN = 60
+# Raw system_health rows older than this are folded into hourly rollups
+HEALTH_RETENTION_DAYS = int(os.environ.get('HEALTH_RETENTION_DAYS', 7))
+
+# Compare-and-delete so a worker never releases a lock another run re-acquired
+# after its own TTL expired.
+_release_lock = redis_client.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+""")
 
 # Database connection
 def get_db_connection():
@@ -28,86 +61,210 @@ def get_db_connection():
     return create_engine(connection_string)
 
 # Record task execution in database
-def record_task_execution(name, status, details=None):
+def record_task_execution(name, status, details=None, duration_ms=None):
     try:
         engine = get_db_connection()
         with engine.connect() as conn:
             conn.execute(
                 text("""
                     INSERT INTO system_health 
-                    (component, status, details)
-                    VALUES (:component, :status, :details)
+                    (component, status, details, duration_ms)
+                    VALUES (:component, :status, :details, :duration_ms)
                 """),
                 {
                     "component": f"scheduler_{name}",
                     "status": status,
-                    "details": details
+                    "details": details,
+                    "duration_ms": duration_ms
                 }
             )
             conn.commit()
     except Exception as e:
         logger.error(f"Failed to record task execution: {str(e)}")
 
-# Tasks
-@app.task
-def run_data_fetcher():
-    logger.info("Running data_fetcher task")
+# Single-flight guard around a pipeline stage
+@contextmanager
+def stage_lock(stage):
+    """
+    Hold the Redis lock for a pipeline stage for the duration of the block.
+    Yields False without waiting when another run of the same stage holds it.
+    """
+    key = f"gpw:lock:{stage}"
+    token = uuid.uuid4().hex
+    acquired = bool(redis_client.set(key, token, nx=True, ex=LOCK_TTLS[stage]))
     try:
-        # Call the data_fetcher service
-        response = requests.get("http://data_fetcher:8001/fetch", timeout=300)
-        
-        if response.status_code == 200:
-            logger.info("Data fetcher executed successfully")
-            record_task_execution("data_fetcher", "OK")
-            return True
-        else:
-            logger.error(f"Data fetcher failed with status: {response.status_code}")
-            record_task_execution("data_fetcher", "ERROR", f"Status code: {response.status_code}")
+        yield acquired
+    finally:
+        if acquired:
+            _release_lock(keys=[key], args=[token])
+
+def is_stage_running(stage):
+    return bool(redis_client.exists(f"gpw:lock:{stage}"))
+
+# Per-run idempotency keys
+def default_run_key():
+    """Beat fires on the hour, so the hour slot identifies a scheduled run."""
+    return datetime.now().strftime('%Y-%m-%dT%H')
+
+def claim_run(stage, run_key):
+    """Return True if this run key has not been claimed for the stage yet."""
+    return bool(redis_client.set(f"gpw:run:{stage}:{run_key}", "1", nx=True, ex=RUN_KEY_TTL))
+
+def release_run(stage, run_key):
+    """Forget a claimed run key so a failed run can be retried."""
+    redis_client.delete(f"gpw:run:{stage}:{run_key}")
+
+def run_stage(stage, url, run_key=None):
+    """
+    Call a service endpoint for a pipeline stage, at most once per run key and
+    never concurrently with another run of the same stage. Returns True when
+    the stage ran, None when the service answered busy (409) and the run key
+    was released for a retry, and False otherwise.
+    """
+    run_key = run_key or default_run_key()
+
+    with stage_lock(stage) as acquired:
+        if not acquired:
+            logger.info(f"Skipping {stage}: another run is in progress")
             return False
-    except Exception as e:
-        logger.error(f"Error running data_fetcher: {str(e)}")
-        record_task_execution("data_fetcher", "ERROR", str(e))
-        return False
 
-@app.task
-def run_strategy_analyzer():
-    logger.info("Running strategy_analyzer task")
-    try:
-        # Call the strategy_analyzer service
-        response = requests.get("http://strategy_analyzer:8002/analyze", timeout=300)
-        
-        if response.status_code == 200:
-            logger.info("Strategy analyzer executed successfully")
-            record_task_execution("strategy_analyzer", "OK")
-            return True
-        else:
-            logger.error(f"Strategy analyzer failed with status: {response.status_code}")
-            record_task_execution("strategy_analyzer", "ERROR", f"Status code: {response.status_code}")
+        if not claim_run(stage, run_key):
+            logger.info(f"Skipping {stage}: run {run_key} already executed")
+            return False
+
+        start = time.monotonic()
+        try:
+            response = requests.get(url, params={"run_id": f"{stage}:{run_key}"}, timeout=300)
+            duration_ms = int((time.monotonic() - start) * 1000)
+
+            if response.status_code == 200:
+                logger.info(f"{stage} executed successfully in {duration_ms / 1000:.1f}s")
+                record_task_execution(stage, "OK", duration_ms=duration_ms)
+                return True
+            elif response.status_code == 409:
+                # The service is busy with a run started outside the scheduler
+                logger.info(f"{stage} is busy in the service, run {run_key} released")
+                release_run(stage, run_key)
+                return None
+            else:
+                logger.error(f"{stage} failed with status: {response.status_code}")
+                record_task_execution(stage, "ERROR", f"Status code: {response.status_code}", duration_ms)
+                release_run(stage, run_key)
+                return False
+        except Exception as e:
+            logger.error(f"Error running {stage}: {str(e)}")
+            record_task_execution(stage, "ERROR", str(e), int((time.monotonic() - start) * 1000))
+            release_run(stage, run_key)
             return False
-    except Exception as e:
-        logger.error(f"Error running strategy_analyzer: {str(e)}")
-        record_task_execution("strategy_analyzer", "ERROR", str(e))
-        return False
+
+# Tasks
+@app.task(bind=True, max_retries=15)
+def run_data_fetcher(self, run_key=None):
+    logger.info("Running data_fetcher task")
+    run_key = run_key or default_run_key()
+    fetched = run_stage("data_fetcher", "http://data_fetcher:8001/fetch", run_key)
+    if fetched is None:
+        # An analysis pass holds the ingest lock; fetch once it is done rather
+        # than losing this slot until the next beat
+        logger.info("Ingest lock is busy, retrying data_fetcher later")
+        raise self.retry(countdown=ANALYSIS_WAIT_COUNTDOWN, kwargs={"run_key": run_key})
+    if fetched:
+        # Re-evaluate open positions and watch triggers against the bars that just
+        # landed, and re-rank the universe on them
+        run_position_monitor.delay(run_key=run_key)
+        run_watchlist.delay(run_key=run_key)
+        run_ranking.delay(run_key=run_key)
+    return fetched
+
+def run_analysis_stage(task, stage, url, run_key=None):
+    """
+    Run a stage that reads the bars, retrying the task later while the data
+    fetcher is running or the service reports the ingest lock busy (409).
+    """
+    run_key = run_key or default_run_key()
+    # Analysis reads the bars the fetcher is writing, so queue behind an
+    # in-flight ingest instead of analysing a half-loaded staging table.
+    if is_stage_running("data_fetcher"):
+        logger.info(f"Data fetcher is running, retrying {stage} later")
+        raise task.retry(countdown=INGEST_WAIT_COUNTDOWN, kwargs={"run_key": run_key})
+    result = run_stage(stage, url, run_key)
+    if result is None:
+        # An ingest started outside the scheduler holds the lock
+        logger.info(f"Ingest lock is busy, retrying {stage} later")
+        raise task.retry(countdown=INGEST_WAIT_COUNTDOWN, kwargs={"run_key": run_key})
+    return result
+
+@app.task(bind=True, max_retries=15)
+def run_strategy_analyzer(self, run_key=None):
+    logger.info("Running strategy_analyzer task")
+    return run_analysis_stage(self, "strategy_analyzer", "http://strategy_analyzer:8002/analyze", run_key)
+
+@app.task(bind=True, max_retries=15)
+def run_position_monitor(self, run_key=None):
+    logger.info("Running position_monitor task")
+    return run_analysis_stage(self, "position_monitor", "http://strategy_analyzer:8002/monitor", run_key)
+
+@app.task(bind=True, max_retries=15)
+def run_watchlist(self, run_key=None):
+    logger.info("Running watchlist task")
+    return run_analysis_stage(self, "watchlist", "http://strategy_analyzer:8002/watchlist", run_key)
+
+@app.task(bind=True, max_retries=15)
+def run_ranking(self, run_key=None):
+    logger.info("Running ranking task")
+    return run_analysis_stage(self, "ranking", "http://strategy_analyzer:8002/ranking", run_key)
 
 @app.task
-def run_alert_system():
+def run_alert_system(run_key=None):
     logger.info("Running alert_system task")
+    return run_stage("alert_system", "http://alert_system:8003/send", run_key)
+
+@app.task
+def rollup_system_health():
+    """
+    Move system_health rows older than the retention window into hourly
+    rollups (run count, error count, durations) in a single statement, so the
+    raw table only ever holds the last few days.
+    """
+    logger.info("Running system_health rollup task")
     try:
-        # Call the alert_system service
-        response = requests.get("http://alert_system:8003/send", timeout=300)
-        
-        if response.status_code == 200:
-            logger.info("Alert system executed successfully")
-            record_task_execution("alert_system", "OK")
-            return True
-        else:
-            logger.error(f"Alert system failed with status: {response.status_code}")
-            record_task_execution("alert_system", "ERROR", f"Status code: {response.status_code}")
-            return False
+        engine = get_db_connection()
+        with engine.begin() as conn:
+            result = conn.execute(
+                text("""
+                    WITH moved AS (
+                        DELETE FROM system_health
+                        WHERE last_check < date_trunc('hour', NOW() - make_interval(days => :days))
+                        RETURNING component, status, last_check, duration_ms
+                    ), buckets AS (
+                        INSERT INTO system_health_rollup AS r
+                            (component, bucket, runs, errors, total_duration_ms, max_duration_ms)
+                        SELECT component,
+                               date_trunc('hour', last_check),
+                               COUNT(*),
+                               COUNT(*) FILTER (WHERE status <> 'OK'),
+                               SUM(duration_ms),
+                               MAX(duration_ms)
+                        FROM moved
+                        GROUP BY component, date_trunc('hour', last_check)
+                        ON CONFLICT (component, bucket) DO UPDATE SET
+                            runs = r.runs + EXCLUDED.runs,
+                            errors = r.errors + EXCLUDED.errors,
+                            total_duration_ms = COALESCE(r.total_duration_ms, 0) + COALESCE(EXCLUDED.total_duration_ms, 0),
+                            max_duration_ms = GREATEST(r.max_duration_ms, EXCLUDED.max_duration_ms)
+                        RETURNING 1
+                    )
+                    SELECT (SELECT COUNT(*) FROM moved), (SELECT COUNT(*) FROM buckets)
+                """),
+                {"days": HEALTH_RETENTION_DAYS}
+            )
+            moved, buckets = result.fetchone()
+        logger.info(f"Rolled up {moved} system_health rows into {buckets} hourly buckets")
+        return moved
     except Exception as e:
-        logger.error(f"Error running alert_system: {str(e)}")
-        record_task_execution("alert_system", "ERROR", str(e))
-        return False
+        logger.error(f"Error rolling up system_health: {str(e)}")
+        record_task_execution("health_rollup", "ERROR", str(e))
+        return 0
 
 # Schedule tasks
 app.conf.beat_schedule = {
@@ -115,6 +272,20 @@ app.conf.beat_schedule = {
         'task': 'tasks.run_data_fetcher',
         'schedule': crontab(hour='*/4', minute=0),  # Every 4 hours
     },
+    # Normally chained from the fetch; this catches ingests whose chain was
+    # lost and is skipped by the run key when the chained run already happened
+    'monitor-positions-after-fetch': {
+        'task': 'tasks.run_position_monitor',
+        'schedule': crontab(hour='*/4', minute=20),
+    },
+    'resolve-watchlist-after-fetch': {
+        'task': 'tasks.run_watchlist',
+        'schedule': crontab(hour='*/4', minute=20),
+    },
+    'rank-universe-after-fetch': {
+        'task': 'tasks.run_ranking',
+        'schedule': crontab(hour='*/4', minute=20),
+    },
     'analyze-strategies-hourly': {
         'task': 'tasks.run_strategy_analyzer',
         'schedule': crontab(hour='*/6', minute=0),  # Every 6 hours
@@ -123,6 +294,10 @@ app.conf.beat_schedule = {
         'task': 'tasks.run_alert_system',
         'schedule': crontab(hour='*/6', minute=0),  # Every 2 hours
     },
+    'rollup-system-health-daily': {
+        'task': 'tasks.rollup_system_health',
+        'schedule': crontab(hour=3, minute=30),
+    },
 }
 
 # For manual testing
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Local HTTP stand-in for the alert system's webhook, Slack and Telegram
+channels. Accepts every POST, prints a one-line summary and can simulate
+rate limiting and slow endpoints.
+
+    python scripts/http_sink.py --port 8099
+    # webhook/slack subscriptions: destination http://localhost:8099/hook
+    # telegram: TELEGRAM_API_URL=http://localhost:8099 TELEGRAM_BOT_TOKEN=test
+"""
+import time
+import json
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    count = 0
+    lock = threading.Lock()
+    throttle_every = 0
+    delay = 0.0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            SinkHandler.count += 1
+            count = SinkHandler.count
+
+        if self.throttle_every and count % self.throttle_every == 0:
+            print(f"[{count}] {self.path} -> 429", flush=True)
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+
+        if self.delay:
+            time.sleep(self.delay)
+
+        try:
+            payload = json.loads(body)
+            summary = payload.get("subject") or payload.get("text", "")[:60].replace("\n", " ")
+        except ValueError:
+            summary = f"{len(body)} bytes"
+        print(f"[{count}] {self.path} {summary}", flush=True)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"ok": true}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP sink for the GPW alert system")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="Answer every Nth request with 429 Retry-After: 1")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering")
+    args = parser.parse_args()
+
+    SinkHandler.throttle_every = args.throttle_every
+    SinkHandler.delay = args.delay
+
+    server = ThreadingHTTPServer((args.host, args.port), SinkHandler)
+    print(f"HTTP sink listening on {args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Local SMTP stand-in for exercising the alert system without a real mail server.
+
+Accepts every message, prints a one-line summary and optionally writes each
+message to a directory. Point the alert system at it with:
+
+    EMAIL_HOST=localhost EMAIL_PORT=1025 EMAIL_STARTTLS=false
+
+Requires aiosmtpd (pip install aiosmtpd).
+"""
+import os
+import sys
+import time
+import argparse
+from email import message_from_bytes
+
+from aiosmtpd.controller import Controller
+
+
+class SinkHandler:
+    def __init__(self, outdir=None):
+        self.outdir = outdir
+        self.count = 0
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.count += 1
+        self.sessions.add(id(session))
+        msg = message_from_bytes(envelope.content)
+        print(
+            f"[{self.count}] session={len(self.sessions)} from={envelope.mail_from} "
+            f"to={','.join(envelope.rcpt_tos)} subject={msg['Subject']}",
+            flush=True
+        )
+        if self.outdir:
+            path = os.path.join(self.outdir, f"{int(time.time() * 1000)}_{self.count}.eml")
+            with open(path, "wb") as f:
+                f.write(envelope.content)
+        return "250 Message accepted for delivery"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink for the GPW alert system")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--outdir", help="Directory to store received messages as .eml files")
+    args = parser.parse_args()
+
+    if args.outdir:
+        os.makedirs(args.outdir, exist_ok=True)
+
+    controller = Controller(SinkHandler(args.outdir), hostname=args.host, port=args.port)
+    controller.start()
+    print(f"SMTP sink listening on {args.host}:{args.port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        controller.stop()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
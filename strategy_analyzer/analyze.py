@@ -3,8 +3,12 @@ import json
 import logging
 import importlib
 import sqlalchemy
+from contextlib import contextmanager
 from sqlalchemy import create_engine, text
 from datetime import datetime
+from strategies.base import Strategy, discover_strategies
+from strategies.panel import PRICE_COLUMNS, load_panel, load_rankings
+from indicators import indicator_cache
 
 # Configure logging
 logging.basicConfig(
@@ -23,6 +27,36 @@ def get_db_connection():
     connection_string = f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
     return create_engine(connection_string)
 
+# Bars a WATCH stays on the watchlist waiting for a close above its trigger
+WATCH_MAX_BARS = int(os.environ.get('WATCH_MAX_BARS', 5))
+
+# Advisory locks shared with the other pipeline stages. The data fetcher holds
+# INGEST_LOCK exclusively while it rewrites staging and historical prices.
+INGEST_LOCK = "gpw_ingest"
+ANALYZER_LOCK = "gpw_strategy_analyzer"
+
+@contextmanager
+def advisory_lock(engine, name, shared=False):
+    """
+    Hold a session-level Postgres advisory lock for the duration of the block.
+    Yields False without waiting when another session holds it. Postgres drops
+    the lock together with the connection, so a crashed run never leaves it stuck.
+    """
+    mode = "_shared" if shared else ""
+    conn = engine.connect()
+    acquired = False
+    try:
+        acquired = conn.execute(
+            text(f"SELECT pg_try_advisory_lock{mode}(hashtext(:name))"), {"name": name}
+        ).scalar()
+        conn.commit()
+        yield acquired
+    finally:
+        if acquired:
+            conn.execute(text(f"SELECT pg_advisory_unlock{mode}(hashtext(:name))"), {"name": name})
+            conn.commit()
+        conn.close()
+
 # Load strategies configuration from strategies.json
 def load_strategies_config():
     try:
@@ -46,19 +80,17 @@ def load_symbols_config():
         logger.error("Symbols configuration file not found at /app/config/symbols.json. Please ensure the file is present.")
         return []
 
-# Dynamically load strategy modules based on the strategies configuration
+# Instantiate the strategies listed in the configuration: registered plugins by
+# name, anything else by importing strategies.<name> and looking up its class
 def load_strategies(engine, strategies_config):
+    registry = discover_strategies()
     strategies = []
     for strategy_config in strategies_config.get("strategies", []):
         try:
-            module_name = f"strategies.{strategy_config['name']}"
-            class_name = strategy_config["class"]
-            
-            # Import the module dynamically
-            module = importlib.import_module(module_name)
-            
-            # Get the strategy class
-            strategy_class = getattr(module, class_name)
+            strategy_class = registry.get(strategy_config["name"])
+            if strategy_class is None:
+                module = importlib.import_module(f"strategies.{strategy_config['name']}")
+                strategy_class = getattr(module, strategy_config["class"])
             
             # Create an instance of the strategy, passing the database engine and settings
             strategy = strategy_class(engine, strategy_config.get("settings"))
@@ -89,10 +121,8 @@ def save_signal(engine, signal):
         status = signal.get("status", "PENDING")
 
         with engine.connect() as conn:
-            # Dla WATCH sygnałów czyścimy stare zapisy, aby dashboard widział tylko bieżące obserwacje.
-            if status == "WATCH":
-                conn.execute(text("DELETE FROM alerts WHERE status = 'WATCH'"))
-
+            # Analysis runs several times on the same bar: a signal already saved in the
+            # last 24 hours, superseded or not, is not saved (or delivered) again
             result = conn.execute(
                 text("""
                     SELECT id FROM alerts
@@ -108,26 +138,96 @@ def save_signal(engine, signal):
                 logger.info(f"Signal already exists for {common_fields['symbol']} ({common_fields['strategy']})")
                 return
 
-            conn.execute(
+            # A new WATCH replaces the symbol's earlier one, so the dashboard only shows
+            # current observations. Rows are kept for their delivery history; one still
+            # queued for delivery stays a WATCH, as routing matches subscribers on status.
+            if status == "WATCH":
+                conn.execute(
+                    text("""
+                        UPDATE alerts a SET status = 'SUPERSEDED'
+                        WHERE a.status = 'WATCH'
+                        AND a.symbol = :symbol
+                        AND a.strategy = :strategy
+                        AND NOT EXISTS (
+                            SELECT 1 FROM alert_outbox o
+                            WHERE o.alert_id = a.id AND o.status IN ('PENDING', 'SENDING')
+                        )
+                    """),
+                    common_fields
+                )
+
+            alert_id = conn.execute(
                 text("""
                     INSERT INTO alerts
                     (symbol, strategy, signal_type, price, details, status)
                     VALUES
                     (:symbol, :strategy, :signal_type, :price, :details, :status)
+                    RETURNING id
                 """),
                 {
                     **common_fields,
                     "details": json.dumps(details, default=lambda o: o.item() if hasattr(o, "item") else o),
                     "status": status
                 }
-            )
+            ).scalar()
+            update_watchlist(conn, alert_id, common_fields, details, status)
             conn.commit()
             logger.info(f"Saved new {common_fields['signal_type']} signal for {common_fields['symbol']} ({common_fields['strategy']})")
     except Exception as e:
         logger.error(f"Error saving signal: {str(e)}")
 
+# Keep the watchlist in step with a saved signal: a WATCH with a breakout level
+# becomes (or replaces) the symbol's active entry, an ALERT resolves it. A WATCH
+# at an unchanged level keeps the entry's progress, so it still expires.
+def update_watchlist(conn, alert_id, fields, details, status):
+    if status == "WATCH" and details.get("trigger_entry") is not None:
+        conn.execute(
+            text("""
+                INSERT INTO watchlist
+                (symbol, strategy, trigger_entry, stop_loss, target, conditions_met,
+                 alert_id, checked_through, max_bars)
+                SELECT :symbol, :strategy, :trigger_entry, :stop_loss, :target, :conditions_met,
+                       :alert_id, MAX(timestamp), :max_bars
+                FROM historical_stock_prices
+                WHERE symbol = :symbol
+                HAVING MAX(timestamp) IS NOT NULL
+                ON CONFLICT (symbol, strategy) WHERE status = 'ACTIVE' DO UPDATE SET
+                    trigger_entry = EXCLUDED.trigger_entry,
+                    stop_loss = EXCLUDED.stop_loss,
+                    target = EXCLUDED.target,
+                    conditions_met = EXCLUDED.conditions_met,
+                    alert_id = EXCLUDED.alert_id,
+                    checked_through = CASE WHEN watchlist.trigger_entry = EXCLUDED.trigger_entry
+                        THEN watchlist.checked_through ELSE EXCLUDED.checked_through END,
+                    bars_seen = CASE WHEN watchlist.trigger_entry = EXCLUDED.trigger_entry
+                        THEN watchlist.bars_seen ELSE 0 END,
+                    max_bars = EXCLUDED.max_bars,
+                    created_at = CASE WHEN watchlist.trigger_entry = EXCLUDED.trigger_entry
+                        THEN watchlist.created_at ELSE CURRENT_TIMESTAMP END
+            """),
+            {
+                "symbol": fields["symbol"],
+                "strategy": fields["strategy"],
+                "trigger_entry": float(details["trigger_entry"]),
+                "stop_loss": details["stop_loss"],
+                "target": details["target"],
+                "conditions_met": details.get("conditions_met"),
+                "alert_id": alert_id,
+                "max_bars": WATCH_MAX_BARS
+            }
+        )
+    elif status == "ALERT":
+        conn.execute(
+            text("""
+                UPDATE watchlist
+                SET status = 'PROMOTED', promoted_alert_id = :alert_id, resolved_at = CURRENT_TIMESTAMP
+                WHERE symbol = :symbol AND strategy = :strategy AND status = 'ACTIVE'
+            """),
+            {"symbol": fields["symbol"], "strategy": fields["strategy"], "alert_id": alert_id}
+        )
+
 # Update the system health status in the database
-def update_health_status(engine, status, details=None):
+def update_health_status(engine, status, details=None, component="strategy_analyzer"):
     try:
         with engine.connect() as conn:
             conn.execute(
@@ -136,7 +236,7 @@ def update_health_status(engine, status, details=None):
                     VALUES (:component, :status, :details)
                 """),
                 {
-                    "component": "strategy_analyzer",
+                    "component": component,
                     "status": status,
                     "details": details
                 }
@@ -146,45 +246,81 @@ def update_health_status(engine, status, details=None):
         logger.error(f"Failed to update health status: {str(e)}")
 
 def main():
+    """
+    Run a single analysis pass. Returns False without doing anything when
+    another analysis is running or an ingest is in flight.
+    """
     logger.info("Starting strategy analyzer")
     
     try:
         # Establish database connection
         engine = get_db_connection()
-        
-        # Load strategies configuration from strategies.json
-        strategies_config = load_strategies_config()
-        if strategies_config is None:
-            logger.error("Strategies configuration did not load. Aborting strategy analysis.")
-            update_health_status(engine, "ERROR", "Strategies configuration did not load from /app/config/strategies.json")
-            return
-        
-        # Load symbols configuration from symbols.json
-        symbols = load_symbols_config()
-        if not symbols:
-            logger.error("No symbols loaded from /app/config/symbols.json. Aborting analysis.")
-            update_health_status(engine, "ERROR", "No symbols provided in /app/config/symbols.json")
-            return
-        
-        # Load strategy modules dynamically
-        strategies = load_strategies(engine, strategies_config)
-        if not strategies:
-            logger.error("No strategies loaded")
-            update_health_status(engine, "ERROR", "No strategies loaded")
-            return
-        
-        signal_count = 0
-        
-        # Analyze each symbol with each strategy
-        for symbol in symbols:
+
+        with advisory_lock(engine, ANALYZER_LOCK) as acquired, \
+                advisory_lock(engine, INGEST_LOCK, shared=True) as ingest_idle:
+            if not acquired:
+                logger.warning("Another strategy analysis is in progress, skipping this run")
+                return False
+            if not ingest_idle:
+                logger.warning("Data ingest is in progress, skipping this run")
+                return False
+            
+            # Load strategies configuration from strategies.json
+            strategies_config = load_strategies_config()
+            if strategies_config is None:
+                logger.error("Strategies configuration did not load. Aborting strategy analysis.")
+                update_health_status(engine, "ERROR", "Strategies configuration did not load from /app/config/strategies.json")
+                return True
+            
+            # Load symbols configuration from symbols.json
+            symbols = load_symbols_config()
+            if not symbols:
+                logger.error("No symbols loaded from /app/config/symbols.json. Aborting analysis.")
+                update_health_status(engine, "ERROR", "No symbols provided in /app/config/symbols.json")
+                return True
+            
+            # Load strategy modules dynamically
+            strategies = load_strategies(engine, strategies_config)
+            if not strategies:
+                logger.error("No strategies loaded")
+                update_health_status(engine, "ERROR", "No strategies loaded")
+                return True
+            
+            signal_count = 0
+
+            # One panel covering every plugin's columns and look-back, so adding a
+            # strategy adds no queries; shared indicators are computed once on it
+            plugins = [strategy for strategy in strategies if isinstance(strategy, Strategy)]
+            if plugins:
+                columns = {column for strategy in plugins for column in strategy.required_columns}
+                panel = load_panel(
+                    engine,
+                    symbols,
+                    [column for column in PRICE_COLUMNS if column in columns],
+                    lookback=max(strategy.lookback() for strategy in plugins)
+                )
+                if panel is not None:
+                    # Latest cross-sectional ranks, attached to signals and used by rank filters
+                    rankings = load_rankings(engine, symbols)
+                    for strategy in plugins:
+                        for signal in strategy.apply_rankings(strategy.latest_signals(panel), rankings):
+                            save_signal(engine, signal)
+                            signal_count += 1
+                    logger.info(f"Evaluated {len(plugins)} strategies on {len(panel.symbols)} symbols "
+                                f"(indicator cache: {indicator_cache.stats()})")
+
+            # Strategies that only implement analyze(symbol) do their own I/O
             for strategy in strategies:
-                signal = strategy.analyze(symbol)
-                if signal:
-                    save_signal(engine, signal)
-                    signal_count += 1
-        
-        logger.info(f"Analysis complete. Generated {signal_count} signals")
-        update_health_status(engine, "OK", f"Generated {signal_count} signals")
+                if isinstance(strategy, Strategy):
+                    continue
+                for symbol in symbols:
+                    signal = strategy.analyze(symbol)
+                    if signal:
+                        save_signal(engine, signal)
+                        signal_count += 1
+            
+            logger.info(f"Analysis complete. Generated {signal_count} signals")
+            update_health_status(engine, "OK", f"Generated {signal_count} signals")
         
     except Exception as e:
         logger.error(f"Error in main process: {str(e)}")
@@ -193,5 +329,7 @@ def main():
         except:
             pass
 
+    return True
+
 if __name__ == "__main__":
     main()
@@ -1,19 +1,72 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 import uvicorn
 from datetime import datetime
 import analyze as analyzer
+import monitor
+import watchlist
+import ranking
+from indicators import indicator_cache
 
 app = FastAPI()
 
 @app.get("/analyze")
-async def analyze_data():
+def analyze_data(run_id: str = None):
     """Trigger strategy analysis process"""
     try:
-        analyzer.main()
-        return {"status": "success", "timestamp": datetime.now().isoformat()}
+        if not analyzer.main():
+            return JSONResponse(
+                status_code=409,
+                content={"status": "skipped", "run_id": run_id, "timestamp": datetime.now().isoformat()}
+            )
+        return {"status": "success", "run_id": run_id, "timestamp": datetime.now().isoformat()}
     except Exception as e:
         return {"status": "error", "error": str(e), "timestamp": datetime.now().isoformat()}
 
+@app.get("/monitor")
+def monitor_positions(run_id: str = None):
+    """Evaluate open positions and emit exit signals"""
+    try:
+        if not monitor.main():
+            return JSONResponse(
+                status_code=409,
+                content={"status": "skipped", "run_id": run_id, "timestamp": datetime.now().isoformat()}
+            )
+        return {"status": "success", "run_id": run_id, "timestamp": datetime.now().isoformat()}
+    except Exception as e:
+        return {"status": "error", "error": str(e), "timestamp": datetime.now().isoformat()}
+
+@app.get("/watchlist")
+def resolve_watchlist(run_id: str = None):
+    """Promote watchlist entries whose trigger was crossed and expire stale ones"""
+    try:
+        if not watchlist.main():
+            return JSONResponse(
+                status_code=409,
+                content={"status": "skipped", "run_id": run_id, "timestamp": datetime.now().isoformat()}
+            )
+        return {"status": "success", "run_id": run_id, "timestamp": datetime.now().isoformat()}
+    except Exception as e:
+        return {"status": "error", "error": str(e), "timestamp": datetime.now().isoformat()}
+
+@app.get("/ranking")
+def rank_universe(run_id: str = None):
+    """Rank the universe by relative strength and sector momentum on the new bars"""
+    try:
+        if not ranking.main():
+            return JSONResponse(
+                status_code=409,
+                content={"status": "skipped", "run_id": run_id, "timestamp": datetime.now().isoformat()}
+            )
+        return {"status": "success", "run_id": run_id, "timestamp": datetime.now().isoformat()}
+    except Exception as e:
+        return {"status": "error", "error": str(e), "timestamp": datetime.now().isoformat()}
+
+@app.get("/indicators/cache")
+def indicator_cache_stats():
+    """Hit statistics of the indicator cache shared by the strategies"""
+    return indicator_cache.stats()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
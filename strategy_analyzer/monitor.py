@@ -0,0 +1,347 @@
+import json
+import logging
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import text
+import indicators
+
+from analyze import (
+    get_db_connection, advisory_lock, INGEST_LOCK,
+    load_strategies_config, load_strategies, update_health_status
+)
+
+logger = logging.getLogger('position_monitor')
+
+MONITOR_LOCK = "gpw_position_monitor"
+
+# Exit rules applied when a position's strategy does not override them
+DEFAULT_EXIT_SETTINGS = {
+    "trend_period": 5,              # SMA period for the breakdown exit
+    "momentum_period": 14,          # RSI and ATR period
+    "smoothing": "wilder",          # RSI/ATR averaging: "wilder" or "simple"
+    "trailing_atr_multiplier": 1.5, # trailing stop = highest close - 1.5 * ATR
+    "sma_exit_days": 2,             # consecutive closes below the SMA
+    "rsi_exit_threshold": 40,       # exit when RSI (14) drops below this
+}
+EXIT_REASONS = ("trailing_stop", "sma_breakdown", "rsi")
+
+
+# Exit settings per strategy name, as stored in positions.strategy
+def load_exit_settings(engine):
+    settings_by_strategy = {}
+    strategies_config = load_strategies_config() or {}
+    for strategy in load_strategies(engine, strategies_config):
+        settings = {key: strategy.settings.get(key, value) for key, value in DEFAULT_EXIT_SETTINGS.items()}
+        settings_by_strategy[strategy.name] = settings
+    for strategy_config in strategies_config.get("strategies", []):
+        # Positions opened by hand may use the config name instead of the display name
+        settings = dict(DEFAULT_EXIT_SETTINGS)
+        settings.update({k: v for k, v in (strategy_config.get("settings") or {}).items() if k in settings})
+        settings_by_strategy.setdefault(strategy_config["name"], settings)
+    return settings_by_strategy
+
+
+def lookback_bars(settings):
+    """Bars needed before the first new bar for every indicator to be defined."""
+    momentum_bars = settings["momentum_period"] + 1
+    if settings["smoothing"] == "wilder":
+        momentum_bars = settings["momentum_period"] * indicators.WARMUP_PERIODS
+    return max(momentum_bars, settings["trend_period"] + settings["sma_exit_days"])
+
+
+# Load open positions with their recent bars
+def load_open_positions(engine, lookback):
+    """
+    One query for every open position that has bars newer than its state:
+    the position, its stored state, the `lookback` bars up to the last
+    evaluated one and every bar since, oldest first.
+    """
+    query = text("""
+        SELECT p.id AS position_id, p.symbol, p.strategy,
+               p.entry_price::float8, p.stop_loss::float8, p.target::float8, p.entry_time,
+               s.last_timestamp, s.highest_close::float8, s.trailing_stop::float8,
+               b.timestamp, b.high::float8, b.low::float8, b.close::float8
+        FROM positions p
+        LEFT JOIN position_state s ON s.position_id = p.id
+        CROSS JOIN LATERAL (
+            SELECT h.timestamp, h.high, h.low, h.close
+            FROM historical_stock_prices h
+            WHERE h.symbol = p.symbol
+            AND h.timestamp >= COALESCE((
+                SELECT h2.timestamp
+                FROM historical_stock_prices h2
+                WHERE h2.symbol = p.symbol
+                AND h2.timestamp <= COALESCE(s.last_timestamp, p.entry_time)
+                ORDER BY h2.timestamp DESC
+                OFFSET :lookback - 1
+                LIMIT 1
+            ), '-infinity')
+        ) b
+        WHERE p.status = 'OTWARTA'
+        AND s.exit_signalled_at IS NULL
+        AND EXISTS (
+            SELECT 1 FROM historical_stock_prices h
+            WHERE h.symbol = p.symbol
+            AND h.timestamp > COALESCE(s.last_timestamp, p.entry_time)
+        )
+        ORDER BY p.id, b.timestamp
+    """)
+    # Prices come back as float8: converting Decimal objects costs more than the query
+    return pd.read_sql(query, engine, params={"lookback": lookback})
+
+
+def build_panel(df):
+    """
+    Turn the long (position, bar) frame into right-aligned 2D arrays of shape
+    (positions, bars), NaN-padded on the left for positions with fewer bars.
+    """
+    positions = df.drop_duplicates("position_id").reset_index(drop=True)
+    row = np.searchsorted(positions["position_id"].to_numpy(), df["position_id"].to_numpy())
+    counts = np.bincount(row, minlength=len(positions))
+    width = counts.max()
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    col = width - counts[row] + (np.arange(len(df)) - starts[row])
+
+    panel = {}
+    for column in ("high", "low", "close"):
+        values = np.full((len(positions), width), np.nan)
+        values[row, col] = df[column].to_numpy()
+        panel[column] = values
+    timestamps = np.full((len(positions), width), np.datetime64("NaT"), dtype="datetime64[ns]")
+    timestamps[row, col] = df["timestamp"].to_numpy(dtype="datetime64[ns]")
+    panel["timestamp"] = timestamps
+    return positions, panel
+
+
+def evaluate_exits(positions, panel, settings):
+    """
+    Advance the trailing state of every position over its new bars and find
+    the first new bar on which an exit rule fires. All positions are evaluated
+    at once on the (positions, bars) panel.
+    """
+    close = panel["close"]
+    n_positions, width = close.shape
+
+    since = positions["last_timestamp"].fillna(positions["entry_time"]).to_numpy(dtype="datetime64[ns]")
+    new = panel["timestamp"] > since[:, None]
+
+    # The kernels run down the bars axis, so they get the transposed panel
+    sma = indicators.sma(close.T, settings["trend_period"]).T
+    if settings["smoothing"] == "wilder":
+        rsi_kernel, atr_kernel = indicators.wilder_rsi, indicators.wilder_atr
+    else:
+        rsi_kernel, atr_kernel = indicators.rsi, indicators.atr
+    rsi = rsi_kernel(close.T, settings["momentum_period"]).T
+    atr = atr_kernel(panel["high"].T, panel["low"].T, close.T, settings["momentum_period"]).T
+
+    # Highest close since entry, carried over from the stored state
+    prev_highest = positions["highest_close"].fillna(positions["entry_price"]).to_numpy()
+    highest = np.maximum.accumulate(np.where(new, close, -np.inf), axis=1)
+    highest = np.maximum(highest, prev_highest[:, None])
+
+    # Chandelier stop, ratcheted up only; each bar is tested against the stop
+    # in force when it opened
+    prev_stop = positions["trailing_stop"].fillna(positions["stop_loss"]).to_numpy()
+    candidate = np.where(new & ~np.isnan(atr), highest - settings["trailing_atr_multiplier"] * atr, -np.inf)
+    stop_after = np.maximum(np.maximum.accumulate(candidate, axis=1), prev_stop[:, None])
+    stop_before = np.concatenate((prev_stop[:, None], stop_after[:, :-1]), axis=1)
+
+    below_sma = close < sma
+    days = settings["sma_exit_days"]
+    breakdown = np.zeros_like(below_sma)
+    breakdown[:, days - 1:] = sliding_window_view(below_sma, days, axis=1).all(axis=-1)
+
+    triggers = np.stack((
+        close < stop_before,
+        breakdown,
+        rsi < settings["rsi_exit_threshold"],
+    )) & new
+    fired = triggers.any(axis=0)
+    has_exit = fired.any(axis=1)
+    # Exit bar: first firing bar, otherwise the latest bar
+    bar = np.where(has_exit, fired.argmax(axis=1), width - 1)
+    rows = np.arange(n_positions)
+
+    return pd.DataFrame({
+        "position_id": positions["position_id"].to_numpy(),
+        "symbol": positions["symbol"].to_numpy(),
+        "strategy": positions["strategy"].to_numpy(),
+        "entry_price": positions["entry_price"].to_numpy(),
+        "target": positions["target"].to_numpy(),
+        "last_timestamp": panel["timestamp"][rows, bar],
+        "highest_close": highest[rows, bar],
+        "trailing_stop": stop_after[rows, bar],
+        "stop_in_force": stop_before[rows, bar],
+        "close": close[rows, bar],
+        "sma": sma[rows, bar],
+        "atr": atr[rows, bar],
+        "rsi": rsi[rows, bar],
+        "exit": has_exit,
+        "reasons": [
+            [reason for reason, hit in zip(EXIT_REASONS, triggers[:, i, bar[i]]) if hit]
+            for i in range(n_positions)
+        ],
+    })
+
+
+def _nullable(values):
+    return [None if pd.isna(v) else float(v) for v in values]
+
+
+# Persist the new state and emit exit alerts in one transaction
+def save_results(engine, results):
+    exits = results[results["exit"]]
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO position_state AS s
+                    (position_id, last_timestamp, highest_close, trailing_stop,
+                     last_close, atr, rsi, exit_signalled_at, exit_reasons, updated_at)
+                SELECT d.position_id, d.last_timestamp, d.highest_close, d.trailing_stop,
+                       d.last_close, d.atr, d.rsi,
+                       CASE WHEN d.is_exit THEN NOW() END,
+                       CASE WHEN d.is_exit THEN string_to_array(d.reasons, ',') END,
+                       NOW()
+                FROM unnest(
+                    CAST(:position_ids AS integer[]),
+                    CAST(:timestamps AS timestamp[]),
+                    CAST(:highest AS double precision[]),
+                    CAST(:stops AS double precision[]),
+                    CAST(:closes AS double precision[]),
+                    CAST(:atrs AS double precision[]),
+                    CAST(:rsis AS double precision[]),
+                    CAST(:exits AS boolean[]),
+                    CAST(:reasons AS text[])
+                ) AS d(position_id, last_timestamp, highest_close, trailing_stop,
+                       last_close, atr, rsi, is_exit, reasons)
+                ON CONFLICT (position_id) DO UPDATE SET
+                    last_timestamp = EXCLUDED.last_timestamp,
+                    highest_close = EXCLUDED.highest_close,
+                    trailing_stop = EXCLUDED.trailing_stop,
+                    last_close = EXCLUDED.last_close,
+                    atr = EXCLUDED.atr,
+                    rsi = EXCLUDED.rsi,
+                    exit_signalled_at = EXCLUDED.exit_signalled_at,
+                    exit_reasons = EXCLUDED.exit_reasons,
+                    updated_at = EXCLUDED.updated_at
+                WHERE s.exit_signalled_at IS NULL
+            """),
+            {
+                "position_ids": results["position_id"].astype(int).tolist(),
+                "timestamps": pd.to_datetime(results["last_timestamp"]).dt.to_pydatetime().tolist(),
+                "highest": results["highest_close"].astype(float).tolist(),
+                "stops": results["trailing_stop"].astype(float).tolist(),
+                "closes": _nullable(results["close"]),
+                "atrs": _nullable(results["atr"]),
+                "rsis": _nullable(results["rsi"]),
+                "exits": results["exit"].astype(bool).tolist(),
+                "reasons": [",".join(reasons) for reasons in results["reasons"]],
+            }
+        )
+
+        if exits.empty:
+            return 0
+
+        details = [
+            json.dumps({
+                "position_id": int(row.position_id),
+                "exit_reasons": row.reasons,
+                "entry_price": float(row.entry_price),
+                "stop_loss": round(float(row.stop_in_force), 4),
+                "target": float(row.target),
+                "highest_close": float(row.highest_close),
+                "sma": None if pd.isna(row.sma) else round(float(row.sma), 4),
+                "atr": None if pd.isna(row.atr) else round(float(row.atr), 4),
+                "rsi": None if pd.isna(row.rsi) else round(float(row.rsi), 4),
+                "return_pct": round((float(row.close) / float(row.entry_price) - 1) * 100, 2),
+                "bar_timestamp": pd.Timestamp(row.last_timestamp).isoformat()
+            })
+            for row in exits.itertuples()
+        ]
+        conn.execute(
+            text("""
+                INSERT INTO alerts (symbol, strategy, signal_type, price, details, status)
+                SELECT d.symbol, d.strategy, 'EXIT', d.price, d.details, 'ALERT'
+                FROM unnest(
+                    CAST(:symbols AS varchar[]),
+                    CAST(:strategies AS varchar[]),
+                    CAST(:prices AS double precision[]),
+                    CAST(:details AS jsonb[])
+                ) AS d(symbol, strategy, price, details)
+            """),
+            {
+                "symbols": exits["symbol"].tolist(),
+                "strategies": exits["strategy"].tolist(),
+                "prices": exits["close"].astype(float).tolist(),
+                "details": details
+            }
+        )
+    return len(exits)
+
+
+def run_monitor(engine):
+    """Evaluate every open position once. Returns (positions evaluated, exit alerts)."""
+    settings_by_strategy = load_exit_settings(engine)
+    lookback = max(lookback_bars(s) for s in [DEFAULT_EXIT_SETTINGS, *settings_by_strategy.values()])
+
+    df = load_open_positions(engine, lookback)
+    if df.empty:
+        return 0, 0
+
+    positions, panel = build_panel(df)
+
+    results = []
+    for strategy, group in positions.groupby("strategy", sort=False):
+        settings = settings_by_strategy.get(strategy)
+        if settings is None:
+            logger.warning(f"No configuration for strategy {strategy}, using default exit rules")
+            settings = DEFAULT_EXIT_SETTINGS
+        idx = group.index.to_numpy()
+        results.append(evaluate_exits(
+            group.reset_index(drop=True),
+            {key: values[idx] for key, values in panel.items()},
+            settings
+        ))
+    results = pd.concat(results, ignore_index=True)
+
+    exits = save_results(engine, results)
+    for row in results[results["exit"]].itertuples():
+        logger.info(f"Exit signal for position {row.position_id} ({row.symbol}): {', '.join(row.reasons)}")
+    return len(results), exits
+
+
+def main():
+    """
+    Run a single monitoring pass. Returns False without doing anything when
+    another pass is running or an ingest is in flight.
+    """
+    logger.info("Starting position monitor")
+    engine = None
+    try:
+        engine = get_db_connection()
+
+        with advisory_lock(engine, MONITOR_LOCK) as acquired, \
+                advisory_lock(engine, INGEST_LOCK, shared=True) as ingest_idle:
+            if not acquired:
+                logger.warning("Another position monitor run is in progress, skipping this run")
+                return False
+            if not ingest_idle:
+                logger.warning("Data ingest is in progress, skipping this run")
+                return False
+
+            evaluated, exits = run_monitor(engine)
+            logger.info(f"Monitoring complete. Evaluated {evaluated} positions, generated {exits} exit signals")
+            update_health_status(engine, "OK", f"Evaluated {evaluated} positions, generated {exits} exit signals",
+                                 component="position_monitor")
+
+    except Exception as e:
+        logger.error(f"Error in position monitor: {str(e)}")
+        if engine is not None:
+            update_health_status(engine, "ERROR", str(e), component="position_monitor")
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import os
+import json
+import logging
+import numpy as np
+from datetime import timedelta
+from sqlalchemy import text
+import indicators
+
+from analyze import get_db_connection, advisory_lock, INGEST_LOCK, update_health_status
+from strategies.panel import load_panel
+
+logger = logging.getLogger('ranking')
+
+RANKING_LOCK = "gpw_ranking"
+
+# Bars the returns and relative strength are measured over (about 3 months)
+RANKING_PERIOD = int(os.environ.get('RANKING_PERIOD', 63))
+
+# symbol_rankings has one relative-strength column per benchmark index,
+# rs_<index>; the indices themselves come from "benchmarks" in symbols.json,
+# the list the fetcher loads bars for
+BENCHMARK_FIELDS = ("rs_wig20", "rs_mwig40")
+
+RANKING_FIELDS = (
+    "return_pct", "rs_wig20", "rs_mwig40", "rs_percentile",
+    "sector_percentile", "sector_momentum", "sector_momentum_percentile"
+)
+
+
+# Universe, the sector of each symbol and the benchmark indices from symbols.json
+def load_ranking_config():
+    try:
+        config_path = os.environ.get('SYMBOLS_CONFIG_PATH', '/app/config/symbols.json')
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        logger.error("Symbols configuration file not found at /app/config/symbols.json. Please ensure the file is present.")
+        return [], {}, []
+    sectors = {
+        symbol: sector
+        for sector, members in (config.get("sectors") or {}).items()
+        for symbol in members
+    }
+    return config.get("symbols", []), sectors, config.get("benchmarks", [])
+
+
+def benchmark_columns(benchmarks):
+    """
+    Map each rs_* column to the configured benchmark index it measures
+    against, None for a column whose index is not configured. A configured
+    index without a column is logged and left out.
+    """
+    columns = {field: None for field in BENCHMARK_FIELDS}
+    for benchmark in benchmarks:
+        field = f"rs_{benchmark.lower()}"
+        if field in columns:
+            columns[field] = benchmark
+        else:
+            logger.warning(f"Benchmark {benchmark} has no {field} column in symbol_rankings, not ranked against")
+    for field, benchmark in columns.items():
+        if benchmark is None:
+            logger.warning(f"No benchmark configured for {field}, left empty")
+    return columns
+
+
+def compute_rankings(close, benchmarks, sectors, period=RANKING_PERIOD):
+    """
+    Rank every symbol of a dates x symbols close frame against the others on
+    each date. `benchmarks` maps the rs_* columns to index close series on
+    the same dates, `sectors` maps symbols to sector names. Returns one
+    dates x symbols array per RANKING_FIELDS entry and each symbol's sector.
+    """
+    values = close.to_numpy(dtype=float)
+    returns = indicators.period_return(values, period)
+
+    sector_names = sorted({sectors[symbol] for symbol in close.columns if symbol in sectors})
+    codes = np.array([sector_names.index(sectors[s]) if s in sectors else -1 for s in close.columns])
+    momentum = indicators.group_mean(returns, codes, len(sector_names))
+    momentum_percentile = indicators.percentile_rank(momentum)
+    # Sector values per symbol column, NaN for symbols without a sector
+    by_symbol = np.where(codes >= 0, codes, len(sector_names))
+    momentum = np.column_stack([momentum, np.full(len(values), np.nan)])[:, by_symbol]
+    momentum_percentile = np.column_stack([momentum_percentile, np.full(len(values), np.nan)])[:, by_symbol]
+
+    result = {
+        "return_pct": returns * 100,
+        "rs_percentile": indicators.percentile_rank(returns),
+        "sector_percentile": indicators.group_percentile_rank(returns, codes),
+        "sector_momentum": momentum * 100,
+        "sector_momentum_percentile": momentum_percentile,
+    }
+    for column, benchmark in benchmarks.items():
+        if benchmark is None:
+            result[column] = np.full(values.shape, np.nan)
+        else:
+            result[column] = indicators.relative_strength(values, benchmark, period) * 100
+    return result, [sectors.get(symbol) for symbol in close.columns]
+
+
+def save_rankings(engine, dates, symbols, sector_of, rankings):
+    """Upsert the ranked (date, symbol) cells in one statement."""
+    ranked = ~np.isnan(rankings["rs_percentile"])
+    rows, cols = np.nonzero(ranked)
+    if not len(rows):
+        return 0
+
+    def column(values):
+        values = values[rows, cols]
+        return [None if v != v else float(v) for v in values.tolist()]
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"""
+                INSERT INTO symbol_rankings (symbol, timestamp, sector, {", ".join(RANKING_FIELDS)})
+                SELECT *
+                FROM unnest(
+                    CAST(:symbols AS varchar[]),
+                    CAST(:timestamps AS timestamp[]),
+                    CAST(:sectors AS varchar[]),
+                    {", ".join(f"CAST(:{field} AS double precision[])" for field in RANKING_FIELDS)}
+                )
+                ON CONFLICT (symbol, timestamp) DO UPDATE SET
+                    sector = EXCLUDED.sector,
+                    {", ".join(f"{field} = EXCLUDED.{field}" for field in RANKING_FIELDS)}
+            """),
+            {
+                "symbols": [symbols[c] for c in cols.tolist()],
+                "timestamps": [dates[r] for r in rows.tolist()],
+                "sectors": [sector_of[c] for c in cols.tolist()],
+                **{field: column(rankings[field]) for field in RANKING_FIELDS}
+            }
+        )
+    return len(rows)
+
+
+def run_ranking(engine):
+    """
+    Rank the universe on the last ranked date and every newer one; the
+    first run ranks the whole history. Returns (dates, rows) written.
+    """
+    symbols, sectors, configured_benchmarks = load_ranking_config()
+    if not symbols:
+        return 0, 0
+    columns = benchmark_columns(configured_benchmarks)
+
+    with engine.connect() as conn:
+        last = conn.execute(text("SELECT MAX(timestamp) FROM symbol_rankings")).scalar()
+    # Enough calendar days before the first new date for a full ranking period
+    start_date = None if last is None else last - timedelta(days=RANKING_PERIOD * 2 + 14)
+
+    indices = [benchmark for benchmark in columns.values() if benchmark is not None]
+    panel = load_panel(engine, symbols + indices, ["close"], start_date=start_date)
+    if panel is None:
+        return 0, 0
+    close = panel["close"]
+    # The last ranked date is ranked again: bars that arrived for it after the
+    # previous pass (e.g. a symbol whose fetch failed then) join its ranking
+    first = 0 if last is None else int(np.searchsorted(close.index, last, side="left"))
+    if first == len(close):
+        return 0, 0
+
+    universe = close[[symbol for symbol in symbols if symbol in close.columns]]
+    benchmarks = {}
+    for column, benchmark in columns.items():
+        if benchmark in close.columns:
+            benchmarks[column] = close[benchmark].to_numpy(dtype=float)
+        else:
+            if benchmark is not None:
+                logger.warning(f"No bars for benchmark {benchmark}, {column} left empty")
+            benchmarks[column] = None
+
+    rankings, sector_of = compute_rankings(universe, benchmarks, sectors)
+    rankings = {field: values[first:] for field, values in rankings.items()}
+    dates = [ts.to_pydatetime() for ts in close.index[first:]]
+    written = save_rankings(engine, dates, list(universe.columns), sector_of, rankings)
+    return len(dates), written
+
+
+def main():
+    """
+    Run a single ranking pass. Returns False without doing anything when
+    another pass is running or an ingest is in flight.
+    """
+    logger.info("Starting ranking pass")
+    engine = None
+    try:
+        engine = get_db_connection()
+
+        with advisory_lock(engine, RANKING_LOCK) as acquired, \
+                advisory_lock(engine, INGEST_LOCK, shared=True) as ingest_idle:
+            if not acquired:
+                logger.warning("Another ranking pass is in progress, skipping this run")
+                return False
+            if not ingest_idle:
+                logger.warning("Data ingest is in progress, skipping this run")
+                return False
+
+            dates, rows = run_ranking(engine)
+            logger.info(f"Ranking complete. Ranked {rows} symbol-days over {dates} dates")
+            update_health_status(engine, "OK", f"Ranked {rows} symbol-days over {dates} dates",
+                                 component="ranking")
+
+    except Exception as e:
+        logger.error(f"Error in ranking pass: {str(e)}")
+        if engine is not None:
+            update_health_status(engine, "ERROR", str(e), component="ranking")
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
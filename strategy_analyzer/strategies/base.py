@@ -0,0 +1,148 @@
+import pkgutil
+import logging
+import importlib
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from .panel import PricePanel, RANKING_COLUMNS
+
+logger = logging.getLogger('strategies')
+
+# Strategy plugins by the name used in strategies.json, filled by @register_strategy
+STRATEGIES = {}
+
+# Package modules that hold no plugins
+SUPPORT_MODULES = ("base", "panel")
+
+
+def register_strategy(cls):
+    """Class decorator adding a plugin to the registry under its `key`."""
+    STRATEGIES[cls.key] = cls
+    return cls
+
+
+def discover_strategies():
+    """Import every module of the strategies package so its plugins register."""
+    package = importlib.import_module(__package__)
+    for module in pkgutil.iter_modules(package.__path__):
+        if module.name not in SUPPORT_MODULES:
+            importlib.import_module(f"{__package__}.{module.name}")
+    return STRATEGIES
+
+
+class Strategy:
+    """
+    Base class of strategy plugins.
+
+    A plugin declares the bar columns it reads, how many bars of history it
+    needs and the indicator series it depends on, and implements
+    evaluate(panel): a pure, vectorized pass over a PricePanel with no I/O
+    of its own. The analyzer and the backtester load one panel for every
+    strategy and its indicators are computed once on it.
+
+    evaluate returns a dict of arrays shaped like the panel (bars x symbols):
+      signal       bool, an entry signal on that bar
+      signal_type  "ALERT" or "WATCH" where signal is set
+      conditions   number of conditions met
+      price, stop_loss, target
+      details      dict of extra arrays stored with the alert
+    """
+
+    key = None
+    name = None
+    required_columns = ("close",)
+    default_settings = {}
+    # Settings that are counts (bar periods, conditions) and so stay integers;
+    # every other numeric setting is a float
+    integer_settings = ()
+    # Bars per symbol the live scan loads
+    lookback_bars = 30
+
+    def __init__(self, db_engine=None, settings=None):
+        self.engine = db_engine
+        self.settings = dict(self.default_settings)
+        if settings:
+            self.settings.update(settings)
+
+    def lookback(self):
+        return self.lookback_bars
+
+    def indicator_dependencies(self):
+        """(indicator, column, params) series evaluate reads from the panel."""
+        return []
+
+    def evaluate(self, panel):
+        raise NotImplementedError
+
+    def latest_signals(self, panel, evaluation=None):
+        """Signals on each symbol's last bar of the panel, as alert dicts."""
+        evaluation = evaluation or self.evaluate(panel)
+        fired = np.flatnonzero(evaluation["signal"][-1])
+        signals = []
+        for column in fired:
+            details = {name: values[-1, column] for name, values in evaluation["details"].items()}
+            signal_type = str(evaluation["signal_type"][-1, column])
+            signals.append({
+                "symbol": panel.symbols[column],
+                "signal_type": signal_type,
+                "strategy": self.name,
+                "price": evaluation["price"][-1, column],
+                "stop_loss": evaluation["stop_loss"][-1, column],
+                "target": evaluation["target"][-1, column],
+                "conditions_met": int(evaluation["conditions"][-1, column]),
+                "status": signal_type,
+                "details": details,
+            })
+        return signals
+
+    def apply_rankings(self, signals, rankings):
+        """
+        Attach each signal's cross-sectional ranking (panel.load_rankings) to
+        its details and, when the strategy's settings have min_rs_percentile,
+        drop signals ranked below it or not ranked at all. Live scans only:
+        backtests evaluate the bars alone.
+        """
+        min_percentile = self.settings.get("min_rs_percentile")
+        kept = []
+        for signal in signals:
+            ranking = rankings.loc[signal["symbol"]] if signal["symbol"] in rankings.index else None
+            if ranking is not None:
+                signal["details"].update({
+                    column: None if pd.isna(ranking[column]) else ranking[column]
+                    for column in RANKING_COLUMNS
+                })
+            if min_percentile is not None:
+                if ranking is None or pd.isna(ranking["rs_percentile"]) or ranking["rs_percentile"] < min_percentile:
+                    continue
+            kept.append(signal)
+        return kept
+
+    def get_historical_data(self, symbol, days=30):
+        """Retrieve historical data for a given symbol from the database."""
+        try:
+            query = text("""
+                SELECT timestamp, open, high, low, close, volume
+                FROM historical_stock_prices
+                WHERE symbol = :symbol
+                ORDER BY timestamp DESC
+                LIMIT :limit
+            """)
+            df = pd.read_sql(query, self.engine, params={"symbol": symbol, "limit": days})
+            if df.empty:
+                logger.warning(f"No historical data for {symbol}")
+            return df
+        except Exception as e:
+            logger.error(f"Error fetching historical data for {symbol}: {str(e)}")
+            return pd.DataFrame()
+
+    def analyze(self, symbol):
+        """
+        Evaluate one symbol on its own history and return the signal on its
+        last bar, or None. Batch callers should use evaluate on a shared panel.
+        """
+        df = self.get_historical_data(symbol, days=self.lookback())
+        if df.empty:
+            return None
+        signals = self.latest_signals(PricePanel.from_history(df, symbol))
+        return signals[0] if signals else None
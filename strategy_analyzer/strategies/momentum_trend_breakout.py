@@ -1,11 +1,22 @@
-import pandas as pd
 import numpy as np
-from sqlalchemy import text
 import logging
+from indicators import WARMUP_PERIODS, shift
+
+from .base import Strategy, register_strategy
 
 logger = logging.getLogger('MomentumTrendBreakoutStrategy')
 
-class MomentumTrendBreakoutStrategy:
+# Minimum daily turnover (volume x close) in PLN for a signal
+MIN_TURNOVER = 500000
+
+# RSI and ATR indicators by the `smoothing` setting
+SMOOTHED_INDICATORS = {
+    "simple": ("rsi", "atr"),
+    "wilder": ("wilder_rsi", "wilder_atr"),
+}
+
+@register_strategy
+class MomentumTrendBreakoutStrategy(Strategy):
     """
     Momentum Trend Breakout Strategy:
 
@@ -17,173 +28,116 @@ class MomentumTrendBreakoutStrategy:
           • MACD bullish crossover: Yesterday MACD <= signal and today MACD > signal.
           • Breakout condition: Current close equals (or exceeds) the maximum close over the last 5 days.
 
+    RSI and ATR use Wilder's smoothing by default; "smoothing": "simple" takes
+    plain 14-day means instead, as backtests registered before it did.
+
     Exit triggers (for risk management) are calculated as:
       - Stop-loss: Current price minus 1.5 times the ATR (14).
       - Target price: Current price plus 3 times the risk (i.e. using a 1:3 risk-reward ratio).
 
+    Open positions are monitored by monitor.py, which signals an exit on a close
+    below the ATR trailing stop, 2 closes below the 5-day SMA or RSI below 40.
+
     The strategy returns a signal containing the entry price, stop-loss, target price,
-    and details of the conditions met.
+    and details of the conditions met: WATCH with min_conditions met, ALERT with more.
     """
 
-    def __init__(self, db_engine, settings=None):
-        self.engine = db_engine
-        self.name = "Momentum Trend Breakout"
-        default_settings = {
-            "trend_period": 5,            # 5-day SMA period
-            "momentum_period": 14,        # for RSI and ATR calculations
-            "min_volume_multiplier": 1.2, # last day volume must be at least 120% of 5-day average
-            "rsi_threshold": 50,          # RSI must be above 50
-            "macd_fast": 12,
-            "macd_slow": 26,
-            "macd_signal": 9,
-            "min_conditions": 2,          # need at least 2 additional conditions to trigger a signal
-            "risk_reward_ratio": 3,       # target = entry + 3*(entry - stop_loss)
-            "atr_multiplier": 1.5,        # stop_loss = entry - (1.5 * ATR)
-        }
-        if settings:
-            default_settings.update(settings)
-        self.settings = default_settings
-
-    def calculate_sma(self, series, window):
-        return series.rolling(window=window).mean()
-
-    def calculate_rsi(self, series, period):
-        delta = series.diff()
-        gain = delta.clip(lower=0)
-        loss = -delta.clip(upper=0)
-        avg_gain = gain.rolling(window=period, min_periods=period).mean()
-        avg_loss = loss.rolling(window=period, min_periods=period).mean()
-        rs = avg_gain / avg_loss.replace(0, np.nan)
-        rsi = 100 - (100 / (1 + rs))
-        return rsi
-
-    def calculate_ema(self, series, span):
-        return series.ewm(span=span, adjust=False).mean()
-
-    def calculate_macd(self, series):
-        ema_fast = self.calculate_ema(series, self.settings["macd_fast"])
-        ema_slow = self.calculate_ema(series, self.settings["macd_slow"])
-        macd_line = ema_fast - ema_slow
-        signal_line = self.calculate_ema(macd_line, self.settings["macd_signal"])
-        return macd_line, signal_line
-
-    def calculate_atr(self, df, period):
-        high = df['high']
-        low = df['low']
-        close = df['close']
-        prev_close = close.shift(1)
-        tr1 = high - low
-        tr2 = (high - prev_close).abs()
-        tr3 = (low - prev_close).abs()
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-        atr = tr.rolling(window=period, min_periods=period).mean()
-        return atr
-
-    def get_historical_data(self, symbol, days=30):
-        """Retrieve historical data for a given symbol from the database."""
-        try:
-            query = text("""
-                SELECT timestamp, open, high, low, close, volume
-                FROM historical_stock_prices
-                WHERE symbol = :symbol
-                ORDER BY timestamp DESC
-                LIMIT :limit
-            """)
-            df = pd.read_sql(query, self.engine, params={"symbol": symbol, "limit": days})
-            if df.empty:
-                logger.warning(f"No historical data for {symbol}")
-            return df
-        except Exception as e:
-            logger.error(f"Error fetching historical data for {symbol}: {str(e)}")
-            return pd.DataFrame()
-
-    def analyze(self, symbol):
+    key = "momentum_trend_breakout"
+    name = "Momentum Trend Breakout"
+    required_columns = ("high", "low", "close", "volume")
+    default_settings = {
+        "trend_period": 5,            # 5-day SMA period
+        "momentum_period": 14,        # for RSI and ATR calculations
+        "smoothing": "wilder",        # RSI/ATR averaging: "wilder" or "simple"
+        "min_volume_multiplier": 1.2, # last day volume must be at least 120% of 5-day average
+        "rsi_threshold": 50,          # RSI must be above 50
+        "macd_fast": 12,
+        "macd_slow": 26,
+        "macd_signal": 9,
+        "min_conditions": 2,          # need at least 2 additional conditions to trigger a signal
+        "risk_reward_ratio": 3,       # target = entry + 3*(entry - stop_loss)
+        "atr_multiplier": 1.5,        # stop_loss = entry - (1.5 * ATR)
+        "trailing_atr_multiplier": 1.5, # exit: close below highest close - 1.5 * ATR
+        "sma_exit_days": 2,           # exit: closes below the 5-day SMA for 2 days
+        "rsi_exit_threshold": 40,     # exit: RSI (14) below 40
+    }
+    integer_settings = (
+        "trend_period", "momentum_period", "macd_fast", "macd_slow", "macd_signal",
+        "min_conditions", "sma_exit_days",
+    )
+
+    def lookback(self):
+        s = self.settings
+        momentum_bars = s["momentum_period"] + 1
+        if s["smoothing"] == "wilder":
+            # Wilder's averages depend on all earlier bars; load enough for the seed to wash out
+            momentum_bars = s["momentum_period"] * WARMUP_PERIODS
+        return max(self.lookback_bars, s["trend_period"] + 1, momentum_bars)
+
+    def indicator_dependencies(self):
+        s = self.settings
+        rsi, atr = SMOOTHED_INDICATORS[s["smoothing"]]
+        return [
+            ("sma", "close", (s["trend_period"],)),
+            ("sma", "volume", (s["trend_period"],)),
+            ("rolling_max", "close", (s["trend_period"],)),
+            (rsi, "close", (s["momentum_period"],)),
+            ("macd", "close", (s["macd_fast"], s["macd_slow"], s["macd_signal"])),
+            (atr, "close", (s["momentum_period"],)),
+        ]
+
+    def evaluate(self, panel):
         """
-        Analizuje spółkę i zwraca sygnał, jeśli warunki są spełnione.
-        Zwraca sygnał typu WATCH, jeśli spełniono 2 kryteria,
-        oraz sygnał ALERT (ENTRY) gdy spełniono 3 lub więcej kryteriów.
+        Entry rules for every symbol and bar of the panel at once: an uptrend
+        over the SMA for two bars, enough turnover and at least min_conditions
+        of volume, RSI, MACD crossover and breakout.
         """
-        df = self.get_historical_data(symbol, days=30)
-        if df.empty or len(df) < self.settings["trend_period"]:
-            logger.warning(f"Not enough data for {symbol}")
-            return None
-
-        df = df.sort_values('timestamp').reset_index(drop=True)
-        df['sma5'] = self.calculate_sma(df['close'], self.settings["trend_period"])
-
-        if len(df) < 2:
-            return None
-        uptrend = (df['close'].iloc[-1] > df['sma5'].iloc[-1]) and (df['close'].iloc[-2] > df['sma5'].iloc[-2])
-        if not uptrend:
-            logger.info(f"{symbol}: Uptrend condition not met")
-            return None
-
-        current_price = df['close'].iloc[-1]
-        turnover = df['volume'].iloc[-1] * current_price
-        if turnover < 500000:
-            logger.info(f"{symbol}: Daily turnover {turnover:.2f} PLN is below threshold")
-            return None
-
-        conditions_met = 0
-        avg_volume = df['volume'].rolling(window=self.settings["trend_period"]).mean().iloc[-1]
-        if df['volume'].iloc[-1] >= self.settings["min_volume_multiplier"] * avg_volume:
-            conditions_met += 1
-
-        rsi = self.calculate_rsi(df['close'], self.settings["momentum_period"])
-        if not rsi.empty and rsi.iloc[-1] > self.settings["rsi_threshold"]:
-            conditions_met += 1
-
-        macd_line, signal_line = self.calculate_macd(df['close'])
-        if len(macd_line) >= 2:
-            if macd_line.iloc[-2] <= signal_line.iloc[-2] and macd_line.iloc[-1] > signal_line.iloc[-1]:
-                conditions_met += 1
-
-        recent_max = df['close'].rolling(window=self.settings["trend_period"]).max().iloc[-1]
-        breakout = df['close'].iloc[-1] >= recent_max
-        if breakout:
-            conditions_met += 1
-
-        logger.info(f"{symbol}: Additional conditions met: {conditions_met}")
-
-        # Ustal typ sygnału i status na podstawie liczby spełnionych warunków.
-        if conditions_met >= 3:
-            signal_type = "ALERT"
-            status = "ALERT"
-        elif conditions_met == 2:
-            signal_type = "WATCH"
-            status = "WATCH"
-        else:
-            return None
-
-        # Oblicz trigger_entry jako maksymalną cenę z ostatnich 5 dni
-        trigger_entry = df['close'].rolling(window=self.settings["trend_period"]).max().iloc[-1]
-
-        atr_series = self.calculate_atr(df, self.settings["momentum_period"])
-        current_atr = atr_series.iloc[-1] if not atr_series.empty else 0
-        stop_loss = current_price - (self.settings["atr_multiplier"] * current_atr) if current_atr > 0 else current_price * 0.98
-        target = current_price + self.settings["risk_reward_ratio"] * (current_price - stop_loss)
-
-        signal = {
-            "symbol": symbol,
+        s = self.settings
+        panel.compute(self.indicator_dependencies())
+        rsi_name, atr_name = SMOOTHED_INDICATORS[s["smoothing"]]
+        close, volume = panel.values("close"), panel.values("volume")
+
+        sma = panel.indicator("sma", "close", s["trend_period"])
+        uptrend = (close > sma) & (shift(close) > shift(sma))
+        turnover = volume * close
+        liquid = turnover >= MIN_TURNOVER
+
+        avg_volume = panel.indicator("sma", "volume", s["trend_period"])
+        rsi = panel.indicator(rsi_name, "close", s["momentum_period"])
+        macd_line, signal_line = panel.indicator("macd", "close", s["macd_fast"], s["macd_slow"], s["macd_signal"])
+        recent_max = panel.indicator("rolling_max", "close", s["trend_period"])
+        breakout = close >= recent_max
+        conditions = (
+            (volume >= s["min_volume_multiplier"] * avg_volume).astype(int)
+            + (rsi > s["rsi_threshold"])
+            + ((shift(macd_line) <= shift(signal_line)) & (macd_line > signal_line))
+            + breakout
+        )
+        signal = uptrend & liquid & (conditions >= s["min_conditions"])
+        signal_type = np.where(conditions > s["min_conditions"], "ALERT", "WATCH")
+
+        atr = panel.indicator(atr_name, "close", s["momentum_period"])
+        stop_loss = np.where(atr > 0, close - s["atr_multiplier"] * atr, close * 0.98)
+        target = close + s["risk_reward_ratio"] * (close - stop_loss)
+
+        return {
+            "signal": signal,
             "signal_type": signal_type,
-            "strategy": self.name,
-            "price": current_price,
+            "conditions": conditions,
+            "price": close,
             "stop_loss": stop_loss,
             "target": target,
-            "conditions_met": conditions_met,
-            "status": status,
             "details": {
-                "uptrend": True,
-                "volume": df['volume'].iloc[-1],
+                "uptrend": uptrend,
+                "volume": volume,
                 "avg_volume": avg_volume,
-                "rsi": rsi.iloc[-1] if not rsi.empty else None,
-                "macd": macd_line.iloc[-1],
-                "macd_signal": signal_line.iloc[-1],
+                "rsi": rsi,
+                "macd": macd_line,
+                "macd_signal": signal_line,
                 "breakout": breakout,
-                "atr": current_atr,
+                "atr": atr,
                 "turnover": turnover,
-                "trigger_entry": trigger_entry
-            }
+                # Highest close of the trend period, the breakout level to watch
+                "trigger_entry": recent_max,
+            },
         }
-        logger.info(f"{symbol}: Signal generated: {signal}")
-        return signal
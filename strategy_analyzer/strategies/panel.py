@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+import logging
+from sqlalchemy import text
+from indicators import indicator, bar_key
+
+logger = logging.getLogger('strategy_panel')
+
+# Bar columns a strategy can declare in required_columns
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+
+# Table holding the bars of each timeframe; weekly and monthly bars are kept
+# up to date from the daily ones by a trigger, labelled by their period start
+TIMEFRAME_TABLES = {
+    "day": "historical_stock_prices",
+    "week": "weekly_bars",
+    "month": "monthly_bars",
+}
+
+# Cross-sectional ranking columns of symbol_rankings, written after each ingest
+RANKING_COLUMNS = (
+    "sector", "return_pct", "rs_wig20", "rs_mwig40", "rs_percentile",
+    "sector_percentile", "sector_momentum", "sector_momentum_percentile"
+)
+
+
+class PricePanel:
+    """
+    Bars of many symbols as one DataFrame per column, rows by date (or by
+    bar position for a look-back panel, with the dates in the "timestamp"
+    frame) and one column per symbol. Indicator series go through the
+    shared indicator cache, keyed by the panel's symbols and bars, so every
+    strategy evaluated on it, or on another panel of the same bars,
+    computes a dependency once. Weekly and monthly panels also carry each
+    period's latest trading day in the "last_day" frame.
+    """
+
+    def __init__(self, frames, timeframe="day"):
+        self.frames = frames
+        self.timeframe = timeframe
+        self._arrays = None
+        self._bars_key = None
+
+    @classmethod
+    def from_history(cls, df, symbol):
+        """Single-symbol panel from a frame of timestamp and bar columns."""
+        order = np.argsort(df["timestamp"].to_numpy(), kind="stable")
+        frames = {"timestamp": pd.DataFrame({symbol: df["timestamp"].to_numpy()[order]})}
+        for column in PRICE_COLUMNS:
+            if column in df:
+                frames[column] = pd.DataFrame(df[column].to_numpy(dtype=float)[order, None], columns=[symbol])
+        return cls(frames)
+
+    def __getitem__(self, column):
+        return self.frames[column]
+
+    def __contains__(self, column):
+        return column in self.frames
+
+    @property
+    def index(self):
+        return self.frames["close"].index
+
+    @property
+    def symbols(self):
+        return self.frames["close"].columns
+
+    @property
+    def arrays(self):
+        """Bar columns as date x symbol float arrays, converted once."""
+        if self._arrays is None:
+            self._arrays = {
+                column: self.frames[column].to_numpy(dtype=float)
+                for column in PRICE_COLUMNS if column in self.frames
+            }
+        return self._arrays
+
+    def values(self, column):
+        return self.arrays[column]
+
+    @property
+    def bars_key(self):
+        if self._bars_key is None:
+            # The current period's bar changes in place as days are added to
+            # it, so period bars are keyed by the last day they cover
+            for field in ("last_day", "timestamp"):
+                if field in self.frames:
+                    stamps = self.frames[field]
+                    break
+            else:
+                stamps = self.index
+            self._bars_key = bar_key(stamps)
+            if self.timeframe != "day":
+                self._bars_key += (self.timeframe,)
+        return self._bars_key
+
+    def indicator(self, name, column="close", *params):
+        """Indicator series as a bars x symbols array, e.g. indicator("sma", "volume", 5)."""
+        return indicator(self.arrays, name, column, *params, symbol=tuple(self.symbols), bars_key=self.bars_key)
+
+    def compute(self, dependencies):
+        """Warm the memo with a strategy's declared (indicator, column, params) dependencies."""
+        for name, column, params in dependencies:
+            self.indicator(name, column, *params)
+
+
+def load_panel(engine, symbols, columns=PRICE_COLUMNS, lookback=None, start_date=None, end_date=None,
+               timeframe="day"):
+    """
+    Load bars for every symbol in one query. With `lookback`, the last
+    `lookback` bars of each symbol are right-aligned by position (row 0 is
+    each symbol's latest bar) and their dates kept in the "timestamp"
+    frame; otherwise rows are dates in [start_date, end_date] and days a
+    symbol did not trade are NaN. timeframe="week" or "month" reads the
+    stored period bars instead of the daily ones, dated by period start.
+    Returns None without data.
+    """
+    if timeframe not in TIMEFRAME_TABLES:
+        raise ValueError(f"Unknown timeframe {timeframe}, expected one of {', '.join(TIMEFRAME_TABLES)}")
+    table = TIMEFRAME_TABLES[timeframe]
+    columns = [column for column in PRICE_COLUMNS if column in columns]
+    select = ", ".join(f"p.{column}::float8 AS {column}" for column in columns)
+    # Period bars bring the last trading day they cover along
+    extra = [] if timeframe == "day" else ["last_day"]
+    select = ", ".join([select] + [f"p.{field}" for field in extra])
+    if lookback is not None:
+        query = text(f"""
+            SELECT s.symbol, p.timestamp, {select}
+            FROM unnest(CAST(:symbols AS varchar[])) AS s(symbol)
+            CROSS JOIN LATERAL (
+                SELECT timestamp, {", ".join(columns + extra)}
+                FROM {table} h
+                WHERE h.symbol = s.symbol
+                ORDER BY timestamp DESC
+                LIMIT :lookback
+            ) p
+        """)
+        params = {"symbols": list(symbols), "lookback": lookback}
+    else:
+        query = text(f"""
+            SELECT p.symbol, p.timestamp, {select}
+            FROM {table} p
+            WHERE p.symbol = ANY(:symbols)
+            AND (CAST(:start_date AS timestamp) IS NULL OR p.timestamp >= CAST(:start_date AS timestamp))
+            AND (CAST(:end_date AS timestamp) IS NULL OR p.timestamp <= CAST(:end_date AS timestamp))
+            ORDER BY p.timestamp, p.symbol
+        """)
+        params = {"symbols": list(symbols), "start_date": start_date, "end_date": end_date}
+
+    df = pd.read_sql(query, engine, params=params)
+    if df.empty:
+        return None
+
+    if lookback is not None:
+        df = df.sort_values(["symbol", "timestamp"])
+        df["row"] = df.groupby("symbol").cumcount(ascending=False).to_numpy() * -1
+        fields = ["timestamp"] + columns + extra
+        frames = {field: df.pivot(index="row", columns="symbol", values=field) for field in fields}
+    else:
+        fields = columns + extra
+        frames = {field: df.pivot(index="timestamp", columns="symbol", values=field) for field in fields}
+    return PricePanel(frames, timeframe)
+
+
+def load_rankings(engine, symbols, as_of=None):
+    """
+    Each symbol's latest ranking up to `as_of` (default: the newest) in one
+    query, as a frame indexed by symbol with the ranking date in "timestamp".
+    Symbols without a ranking are missing from it.
+    """
+    query = text(f"""
+        SELECT s.symbol, r.timestamp, {", ".join(f"r.{column}" for column in RANKING_COLUMNS)}
+        FROM unnest(CAST(:symbols AS varchar[])) AS s(symbol)
+        CROSS JOIN LATERAL (
+            SELECT *
+            FROM symbol_rankings k
+            WHERE k.symbol = s.symbol
+            AND (CAST(:as_of AS timestamp) IS NULL OR k.timestamp <= CAST(:as_of AS timestamp))
+            ORDER BY k.timestamp DESC
+            LIMIT 1
+        ) r
+    """)
+    df = pd.read_sql(query, engine, params={"symbols": list(symbols), "as_of": as_of})
+    return df.set_index("symbol")
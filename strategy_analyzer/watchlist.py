@@ -0,0 +1,123 @@
+import logging
+from sqlalchemy import text
+
+from analyze import get_db_connection, advisory_lock, INGEST_LOCK, update_health_status
+
+logger = logging.getLogger('watchlist')
+
+WATCHLIST_LOCK = "gpw_watchlist"
+
+# One statement for the whole pass: every active entry is joined to the bars
+# newer than its checked_through, and the first bar that closes above the
+# trigger (or below the stop) within max_bars resolves it. Crossings are
+# inserted as ALERTs, so delivery and dashboard triggers fire as for any other
+# signal; the rest advance their position or expire.
+RESOLVE_WATCHLIST = text("""
+    WITH new_bars AS (
+        SELECT w.id, w.max_bars, h.timestamp, h.close,
+               w.bars_seen + ROW_NUMBER() OVER (PARTITION BY w.id ORDER BY h.timestamp) AS bar_no,
+               h.close > w.trigger_entry AS crossed,
+               h.close < w.stop_loss AS stopped
+        FROM watchlist w
+        JOIN historical_stock_prices h
+          ON h.symbol = w.symbol AND h.timestamp > w.checked_through
+        WHERE w.status = 'ACTIVE'
+    ), events AS (
+        SELECT DISTINCT ON (id) id, timestamp, close, bar_no, crossed
+        FROM new_bars
+        WHERE (crossed OR stopped) AND bar_no <= max_bars
+        ORDER BY id, timestamp
+    ), progress AS (
+        SELECT id, MAX(timestamp) AS last_timestamp, MAX(bar_no) AS bars_seen
+        FROM new_bars
+        GROUP BY id
+    ), promoted AS (
+        INSERT INTO alerts (symbol, strategy, signal_type, price, details, status)
+        SELECT w.symbol, w.strategy, 'ALERT', e.close,
+               jsonb_build_object(
+                   'promoted_from', 'WATCH',
+                   'watchlist_id', w.id,
+                   'watch_alert_id', w.alert_id,
+                   'trigger_entry', w.trigger_entry::float8,
+                   'stop_loss', w.stop_loss::float8,
+                   'target', w.target::float8,
+                   'conditions_met', w.conditions_met,
+                   'bars_waited', e.bar_no,
+                   'bar_timestamp', e.timestamp
+               ),
+               'ALERT'
+        FROM events e
+        JOIN watchlist w ON w.id = e.id
+        WHERE e.crossed
+        RETURNING id, (details->>'watchlist_id')::int AS watchlist_id
+    ), resolved AS (
+        UPDATE watchlist w SET
+            checked_through = COALESCE(e.timestamp, p.last_timestamp),
+            bars_seen = COALESCE(e.bar_no, p.bars_seen),
+            status = CASE
+                WHEN e.crossed THEN 'PROMOTED'
+                WHEN e.id IS NOT NULL THEN 'INVALIDATED'
+                WHEN p.bars_seen >= w.max_bars THEN 'EXPIRED'
+                ELSE 'ACTIVE'
+            END,
+            promoted_alert_id = pr.id,
+            resolved_at = CASE
+                WHEN e.id IS NOT NULL OR p.bars_seen >= w.max_bars THEN CURRENT_TIMESTAMP
+            END
+        FROM progress p
+        LEFT JOIN events e ON e.id = p.id
+        LEFT JOIN promoted pr ON pr.watchlist_id = p.id
+        WHERE w.id = p.id
+        RETURNING w.status
+    )
+    SELECT status, COUNT(*) FROM resolved GROUP BY status
+""")
+
+
+def run_watchlist(engine):
+    """
+    Compare every active watchlist entry with the bars that arrived since it
+    was last checked. Returns the number of entries per resulting status.
+    """
+    with engine.begin() as conn:
+        counts = dict(conn.execute(RESOLVE_WATCHLIST).fetchall())
+    for status in ("ACTIVE", "PROMOTED", "INVALIDATED", "EXPIRED"):
+        counts.setdefault(status, 0)
+    return counts
+
+
+def main():
+    """
+    Run a single watchlist pass. Returns False without doing anything when
+    another pass is running or an ingest is in flight.
+    """
+    logger.info("Starting watchlist pass")
+    engine = None
+    try:
+        engine = get_db_connection()
+
+        with advisory_lock(engine, WATCHLIST_LOCK) as acquired, \
+                advisory_lock(engine, INGEST_LOCK, shared=True) as ingest_idle:
+            if not acquired:
+                logger.warning("Another watchlist pass is in progress, skipping this run")
+                return False
+            if not ingest_idle:
+                logger.warning("Data ingest is in progress, skipping this run")
+                return False
+
+            counts = run_watchlist(engine)
+            summary = (f"Promoted {counts['PROMOTED']} entries to ALERT, expired {counts['EXPIRED']}, "
+                       f"invalidated {counts['INVALIDATED']}, {counts['ACTIVE']} still waiting")
+            logger.info(f"Watchlist pass complete. {summary}")
+            update_health_status(engine, "OK", summary, component="watchlist")
+
+    except Exception as e:
+        logger.error(f"Error in watchlist pass: {str(e)}")
+        if engine is not None:
+            update_health_status(engine, "ERROR", str(e), component="watchlist")
+
+    return True
+
+
+if __name__ == "__main__":
+    main()